@@ -0,0 +1,261 @@
+# This file contains the (compact) representation of the actual times of a connection (historical departure and arrival times).
+# Instead of a list of (departure, arrival) tuples, the times are stored as NumPy arrays (one entry per observation),
+# departures and arrivals in separate arrays plus the index of the operating day the observation is from.
+# The distributions of the departure and arrival times (needed for the reliability) are computed only once per connection,
+# either for all connections of a network at once when it is built (create_actual_times) or when they are used for the first time.
+import numpy as np
+
+
+class ActualTimes:
+    """
+    Actual (observed) departure and arrival times of a connection in minutes, with the index of the operating day of each observation
+    It behaves like the list of (departure, arrival) tuples that was used before (length, iteration, indexing),
+    so code that expects such a list keeps working. The arrays are read-only (they are shared, e.g., when copying paths).
+    """
+
+    __slots__ = ("departures", "arrivals", "operating_days", "_distributions")
+
+    def __init__(self, departures, arrivals, operating_days=None, distributions=None):
+        self.departures = np.asarray(departures, dtype=np.int16)
+        self.arrivals = np.asarray(arrivals, dtype=np.int16)
+        if operating_days is None:
+            # without information about the operating day, the position is used
+            operating_days = np.arange(len(self.departures), dtype=np.int32)
+        self.operating_days = np.asarray(operating_days, dtype=np.int32)
+        for values in (self.departures, self.arrivals, self.operating_days):
+            if values.flags.writeable:
+                values.flags.writeable = False
+        # distributions of the departure and arrival times (see compute_distributions), computed when needed if not given
+        self._distributions = distributions
+
+    @classmethod
+    def from_tuples(cls, actual_times):
+        """
+        Create the actual times from a list of (departure, arrival) tuples
+        """
+        actual_times = np.array(actual_times, dtype=np.int16).reshape(-1, 2)
+        return cls(actual_times[:, 0], actual_times[:, 1])
+
+    @property
+    def distributions(self) -> dict:
+        """
+        Distributions of the departure and arrival times (see compute_distributions)
+        """
+        if self._distributions is None:
+            self._distributions = compute_distributions(
+                self.departures, self.arrivals
+            )
+        return self._distributions
+
+    @property
+    def departure_distribution(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Unique departure times (ascending) and their probabilities
+        """
+        distributions = self.distributions
+        return (
+            distributions["departure_times"],
+            distributions["departure_probabilities"],
+        )
+
+    @property
+    def arrival_distribution(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Unique arrival times (ascending), their probabilities and the probabilities of arriving at or before them
+        """
+        distributions = self.distributions
+        return (
+            distributions["arrival_times"],
+            distributions["arrival_probabilities"],
+            distributions["arrival_cumulative_probabilities"],
+        )
+
+    def __len__(self):
+        return len(self.departures)
+
+    def __iter__(self):
+        return zip(self.departures.tolist(), self.arrivals.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ActualTimes(
+                self.departures[index],
+                self.arrivals[index],
+                self.operating_days[index],
+            )
+        return int(self.departures[index]), int(self.arrivals[index])
+
+    def __eq__(self, other):
+        if isinstance(other, ActualTimes):
+            return np.array_equal(self.departures, other.departures) and np.array_equal(
+                self.arrivals, other.arrivals
+            )
+        if isinstance(other, (list, tuple)):
+            return list(self) == [tuple(actual_time) for actual_time in other]
+        return NotImplemented
+
+    def __repr__(self):
+        # same representation as the list of tuples (e.g., in the csv files with the results)
+        return repr(list(self))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # the arrays are read-only, so there is no need to copy them
+        return self
+
+
+def _segment_distributions(times: np.ndarray, offsets: np.ndarray) -> dict:
+    """
+    Compute the distributions of the times of several connections at once, the times of connection i are times[offsets[i]:offsets[i + 1]]
+    Returns the unique times per connection (concatenated, the ones of connection i are at group_offsets[i]:group_offsets[i + 1]),
+    the probabilities and cumulative probabilities of the unique times, and for each time the (local) index of its unique time
+    """
+    lengths = np.diff(offsets)
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+    order = np.lexsort((times, segments))
+    sorted_times = times[order]
+    sorted_segments = segments[order]
+    is_new_group = np.ones(len(times), dtype=bool)
+    is_new_group[1:] = (sorted_segments[1:] != sorted_segments[:-1]) | (
+        sorted_times[1:] != sorted_times[:-1]
+    )
+    group_starts = np.flatnonzero(is_new_group)
+    group_segments = sorted_segments[group_starts]
+    group_offsets = np.searchsorted(group_segments, np.arange(len(lengths) + 1))
+    counts = np.diff(np.append(group_starts, len(times)))
+    # cumulative counts per connection (integers, so the cumulative probabilities are exact)
+    cumulative_counts = np.cumsum(counts)
+    cumulative_counts_before = np.concatenate(([0], cumulative_counts))[
+        group_offsets[:-1]
+    ]
+    cumulative_counts = cumulative_counts - cumulative_counts_before[group_segments]
+    group_lengths = lengths[group_segments]
+    indices = np.empty(len(times), dtype=np.int32)
+    indices[order] = (np.cumsum(is_new_group) - 1) - group_offsets[sorted_segments]
+    return {
+        "times": sorted_times[group_starts],
+        "probabilities": counts / group_lengths,
+        "cumulative_probabilities": cumulative_counts / group_lengths,
+        "group_offsets": group_offsets,
+        "indices": indices,
+    }
+
+
+def _segment_joint_histograms(
+    departure_indices: np.ndarray, arrival_indices: np.ndarray, offsets: np.ndarray
+) -> dict:
+    """
+    Compute the (sparse) joint histograms of the departure and arrival times of several connections at once (see _segment_distributions):
+    the observed pairs of (unique departure index, unique arrival index) per connection, sorted by departure index, and how often they occur
+    """
+    lengths = np.diff(offsets)
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+    order = np.lexsort((arrival_indices, departure_indices, segments))
+    sorted_segments = segments[order]
+    sorted_departure_indices = departure_indices[order]
+    sorted_arrival_indices = arrival_indices[order]
+    is_new_pair = np.ones(len(order), dtype=bool)
+    is_new_pair[1:] = (
+        (sorted_segments[1:] != sorted_segments[:-1])
+        | (sorted_departure_indices[1:] != sorted_departure_indices[:-1])
+        | (sorted_arrival_indices[1:] != sorted_arrival_indices[:-1])
+    )
+    pair_starts = np.flatnonzero(is_new_pair)
+    return {
+        "departure_indices": sorted_departure_indices[pair_starts],
+        "arrival_indices": sorted_arrival_indices[pair_starts],
+        "counts": np.diff(np.append(pair_starts, len(order))),
+        "group_offsets": np.searchsorted(
+            sorted_segments[pair_starts], np.arange(len(lengths) + 1)
+        ),
+    }
+
+
+def compute_distributions(departures, arrivals) -> dict:
+    """
+    Compute the distributions of the departure and arrival times of one connection
+    - departure/arrival times: unique times (ascending)
+    - departure/arrival probabilities: probability of departing/arriving at the unique time
+    - arrival cumulative probabilities: probability of arriving at or before the unique time
+    - departure/arrival indices: for each observation, the index of its unique departure/arrival time
+    - joint departure/arrival indices and joint counts: sparse joint histogram, how often each observed pair of (departure, arrival) time occurs
+    """
+    offsets = np.array([0, len(departures)])
+    departure_distributions = _segment_distributions(np.asarray(departures), offsets)
+    arrival_distributions = _segment_distributions(np.asarray(arrivals), offsets)
+    joint_histograms = _segment_joint_histograms(
+        departure_distributions["indices"], arrival_distributions["indices"], offsets
+    )
+    return {
+        "departure_times": departure_distributions["times"],
+        "departure_probabilities": departure_distributions["probabilities"],
+        "departure_indices": departure_distributions["indices"],
+        "arrival_times": arrival_distributions["times"],
+        "arrival_probabilities": arrival_distributions["probabilities"],
+        "arrival_cumulative_probabilities": arrival_distributions[
+            "cumulative_probabilities"
+        ],
+        "arrival_indices": arrival_distributions["indices"],
+        "joint_departure_indices": joint_histograms["departure_indices"],
+        "joint_arrival_indices": joint_histograms["arrival_indices"],
+        "joint_counts": joint_histograms["counts"],
+    }
+
+
+def create_actual_times(
+    departures: np.ndarray,
+    arrivals: np.ndarray,
+    operating_days: np.ndarray,
+    offsets,
+) -> list[ActualTimes]:
+    """
+    Create the actual times of several connections at once (the observations of connection i are at offsets[i]:offsets[i + 1]),
+    the distributions of all connections are computed together (vectorized) instead of one by one
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    departure_distributions = _segment_distributions(np.asarray(departures), offsets)
+    arrival_distributions = _segment_distributions(np.asarray(arrivals), offsets)
+    joint_histograms = _segment_joint_histograms(
+        departure_distributions["indices"], arrival_distributions["indices"], offsets
+    )
+    departure_groups = departure_distributions["group_offsets"].tolist()
+    arrival_groups = arrival_distributions["group_offsets"].tolist()
+    joint_groups = joint_histograms["group_offsets"].tolist()
+    offsets = offsets.tolist()
+    actual_times = []
+    for index in range(len(offsets) - 1):
+        observations = slice(offsets[index], offsets[index + 1])
+        departure_group = slice(departure_groups[index], departure_groups[index + 1])
+        arrival_group = slice(arrival_groups[index], arrival_groups[index + 1])
+        joint_group = slice(joint_groups[index], joint_groups[index + 1])
+        actual_times.append(
+            ActualTimes(
+                departures[observations],
+                arrivals[observations],
+                operating_days[observations],
+                distributions={
+                    "departure_times": departure_distributions["times"][departure_group],
+                    "departure_probabilities": departure_distributions["probabilities"][departure_group],
+                    "departure_indices": departure_distributions["indices"][observations],
+                    "arrival_times": arrival_distributions["times"][arrival_group],
+                    "arrival_probabilities": arrival_distributions["probabilities"][arrival_group],
+                    "arrival_cumulative_probabilities": arrival_distributions["cumulative_probabilities"][arrival_group],
+                    "arrival_indices": arrival_distributions["indices"][observations],
+                    "joint_departure_indices": joint_histograms["departure_indices"][joint_group],
+                    "joint_arrival_indices": joint_histograms["arrival_indices"][joint_group],
+                    "joint_counts": joint_histograms["counts"][joint_group],
+                },
+            )
+        )
+    return actual_times
+
+
+def as_actual_times(actual_times) -> ActualTimes:
+    """
+    Get the actual times as ActualTimes (converts a list of (departure, arrival) tuples)
+    """
+    if isinstance(actual_times, ActualTimes):
+        return actual_times
+    return ActualTimes.from_tuples(actual_times)
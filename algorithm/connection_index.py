@@ -0,0 +1,42 @@
+# This file contains an index of the connections of a graph (per station), for checking in constant time whether a connection is already part of the graph.
+# A connection is identified by its trip, planned departure and arrival station (the departure station is the key of the graph).
+
+
+def get_connection_key(connection: dict) -> tuple:
+    """
+    Get the key of a connection (unique per departure station): (trip identifier, planned departure, arrival station)
+    """
+    return connection["trip_id"], connection["planned_departure"], connection["to"]
+
+
+class ConnectionIndex:
+    """
+    Index of the connections per station (station -> {connection key: connection})
+    """
+
+    def __init__(self, graph: dict | None = None):
+        self.index = {}
+        if graph is not None:
+            for node in graph:
+                for connection in graph[node]:
+                    self.add(connection)
+
+    def add(self, connection: dict) -> bool:
+        """
+        Add a connection to the index, returns False if the connection was already in the index
+        """
+        station_index = self.index.setdefault(connection["from"], {})
+        key = get_connection_key(connection)
+        if key in station_index:
+            return False
+        station_index[key] = connection
+        return True
+
+    def get(self, station, key: tuple) -> dict | None:
+        """
+        Get the connection with the given key departing from the station (None if there is no such connection)
+        """
+        return self.index.get(station, {}).get(key)
+
+    def __contains__(self, connection: dict) -> bool:
+        return get_connection_key(connection) in self.index.get(connection["from"], {})
@@ -0,0 +1,322 @@
+# This file contains the Connection Scan Algorithm (CSA) for earliest arrival queries, an alternative to the Dijkstra algorithm of the graph class.
+# Instead of a priority queue over the stations, all connections of the network are stored in one array sorted by departure time,
+# and a query scans this array once (starting at the first connection after the start time).
+# The profile query scans the array once backwards and gives the earliest arrival for every departure time at the source (departure sweep).
+# Reference: "Connection Scan Algorithm" (Dibbelt et al., 2018), https://arxiv.org/abs/1703.05997
+import logging
+from bisect import bisect_left, bisect_right
+
+from algorithm.helper import consolidate_path
+from algorithm.reliability import TRANSFER_TIME_DEFAULT
+from constants import LOG_LEVEL
+
+# set log level
+logging.basicConfig(level=LOG_LEVEL)
+
+
+def sort_connections(connections) -> list[dict]:
+    """
+    Sort connections by planned departure and planned arrival time, such that a connection comes after every connection it can be reached with
+    Connections with a duration of zero minutes that depart at the same time have the same sort key, but can follow each other (e.g., consecutive
+    stops of the same train), so they are ordered along their stations (a connection arriving at a station before the ones departing from it)
+    """
+    connections = sorted(
+        connections,
+        key=lambda connection: (
+            connection["planned_departure"],
+            connection["planned_arrival"],
+        ),
+    )
+    sorted_connections = []
+    index = 0
+    while index < len(connections):
+        connection = connections[index]
+        # group of zero-duration connections departing at the same time
+        end = index + 1
+        if connection["planned_departure"] == connection["planned_arrival"]:
+            while (
+                end < len(connections)
+                and connections[end]["planned_departure"] == connection["planned_departure"]
+                and connections[end]["planned_arrival"] == connection["planned_arrival"]
+            ):
+                end += 1
+        if end - index > 1:
+            sorted_connections.extend(_sort_zero_duration_connections(connections[index:end]))
+        else:
+            sorted_connections.append(connection)
+        index = end
+    return sorted_connections
+
+
+def _sort_zero_duration_connections(connections: list[dict]) -> list[dict]:
+    """
+    Order zero-duration connections departing at the same time topologically: a connection is added as soon as all connections arriving
+    at its departure station are added (for a cycle, the first remaining connection is added)
+    """
+    # number of connections not added yet arriving at each station
+    remaining_arrivals = {}
+    for connection in connections:
+        remaining_arrivals[connection["to"]] = remaining_arrivals.get(connection["to"], 0) + 1
+    sorted_connections = []
+    remaining_connections = connections
+    while remaining_connections:
+        ready_connections = [
+            connection
+            for connection in remaining_connections
+            if remaining_arrivals.get(connection["from"], 0) == 0
+        ] or remaining_connections[:1]
+        for connection in ready_connections:
+            sorted_connections.append(connection)
+            remaining_arrivals[connection["to"]] -= 1
+        ready_ids = {id(connection) for connection in ready_connections}
+        remaining_connections = [
+            connection for connection in remaining_connections if id(connection) not in ready_ids
+        ]
+    return sorted_connections
+
+
+class ConnectionScan:
+    """
+    All connections of a network (graph dictionary) sorted by planned departure (and planned arrival) time (see sort_connections)
+    """
+
+    def __init__(self, graph: dict):
+        self.graph = graph
+        self.connections = sort_connections(
+            connection for node in graph for connection in graph[node]
+        )
+        # parallel list of the departure times (for the binary search of the first connection after the start time)
+        self.departures = [
+            connection["planned_departure"] for connection in self.connections
+        ]
+
+    def earliest_arrival(
+        self,
+        source,
+        target,
+        start_time: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+    ) -> tuple[int, list[dict]]:
+        """
+        Compute the shortest path (in terms of earliest arrival time) between the source and target node, same result structure as Graph.dijkstra
+        A connection can be used if we arrive at its departure station with the same trip (no transfer needed) at or before the departure,
+        or with another trip at least transfer_time minutes before the departure. At the source, no transfer time is needed.
+        The earliest arrival per station and trip is kept as well (not only per station like in the Dijkstra algorithm), so staying in a train
+        is still possible if the station was already reached earlier with another train. Therefore, the arrival time is never later than
+        the one of the Dijkstra algorithm (for equal arrival times, the path can be a different one).
+        @param source: the source node
+        @param target: the target node
+        @param start_time: the start time in minutes
+        @param transfer_time: the transfer time in minutes
+        """
+        logging.info(
+            f"Find shortest path (connection scan) from {source} to {target} starting at {start_time}"
+        )
+        if source == target:
+            return start_time, []
+        infinity = float("inf")
+        # earliest arrival time per station (like in the Dijkstra algorithm, only stations that are nodes of the graph are considered)
+        earliest_arrival_times = {source: start_time}
+        # connection (index) with the earliest arrival per station, and per station and trip (to stay in the same train without transfer)
+        arrival_connection = {source: None}
+        earliest_arrival_times_trip = {}
+        arrival_connection_trip = {}
+        # connection (index) used to get to the departure station of a connection (to reconstruct the path)
+        predecessors = {}
+
+        connections = self.connections
+        for index in range(bisect_left(self.departures, start_time), len(connections)):
+            connection = connections[index]
+            departure_time = connection["planned_departure"]
+            # all following connections depart after we have reached the target
+            if departure_time >= earliest_arrival_times.get(target, infinity):
+                break
+            departure_station = connection["from"]
+            trip = connection["trip_id"]
+            # stay in the same train (no transfer needed)
+            if (
+                earliest_arrival_times_trip.get((departure_station, trip), infinity)
+                <= departure_time
+            ):
+                predecessor = arrival_connection_trip[(departure_station, trip)]
+            # start at the source (no transfer time needed) or transfer from another train
+            elif (departure_station == source and start_time <= departure_time) or (
+                earliest_arrival_times.get(departure_station, infinity) + transfer_time
+                <= departure_time
+            ):
+                predecessor = arrival_connection[departure_station]
+            else:
+                continue
+
+            arrival_station = connection["to"]
+            if arrival_station not in self.graph:
+                continue
+            arrival_time = connection["planned_arrival"]
+            predecessors[index] = predecessor
+            if arrival_time < earliest_arrival_times.get(arrival_station, infinity):
+                earliest_arrival_times[arrival_station] = arrival_time
+                arrival_connection[arrival_station] = index
+            if arrival_time < earliest_arrival_times_trip.get(
+                (arrival_station, trip), infinity
+            ):
+                earliest_arrival_times_trip[(arrival_station, trip)] = arrival_time
+                arrival_connection_trip[(arrival_station, trip)] = index
+
+        if target not in earliest_arrival_times:
+            logging.info("No shortest path could be found.")
+            return 0, []
+
+        # reconstruct the shortest path (same structure as the graph)
+        path = []
+        index = arrival_connection[target]
+        while index is not None:
+            connection = connections[index]
+            path.append(
+                {
+                    "from": connection["from"],
+                    "to": connection["to"],
+                    "planned_departure": connection["planned_departure"],
+                    "planned_arrival": connection["planned_arrival"],
+                    "trip_id": connection["trip_id"],
+                    "actual_times": connection["actual_times"],
+                }
+            )
+            index = predecessors[index]
+        # reverse the path to get the correct order (from source to target)
+        path.reverse()
+
+        # go through path and consolidate trips where the same train is used (remove intermediate stations)
+        consolidated_path = consolidate_path(path)
+
+        return earliest_arrival_times[target], consolidated_path
+
+    def earliest_arrival_profile(
+        self,
+        source,
+        target,
+        start_time: int,
+        end_time: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+    ) -> list[tuple[int, int, list[dict]]]:
+        """
+        Compute the earliest arrival at the target for all departure times at the source between start_time and end_time with one (backward) scan
+        over the connections (profile variant of the Connection Scan Algorithm), same transfer rules as earliest_arrival
+        Returns the steps of the profile: (latest departure time at the source, earliest arrival time, path) sorted by departure time,
+        the earliest arrival when starting at time t is the one of the first step departing at or after t (see get_earliest_arrival_from_profile).
+        The first step departing at or after end_time is included, so the profile covers all start times up to end_time
+        (the profile is empty if there is no path or the source is the target).
+        """
+        logging.info(
+            f"Find earliest arrival profile (connection scan) from {source} to {target} for departures between {start_time} and {end_time}"
+        )
+        if source == target:
+            return []
+        infinity = float("inf")
+        # profiles per station and per station and trip (to stay in the same train): negative departure times (ascending, the connections are scanned
+        # with the latest departure first), earliest arrival at the target when departing at or after this time and the connection (index) taken
+        station_profiles = {}
+        trip_profiles = {}
+        # next connection (index) after a connection on the fastest way to the target (None if the connection arrives at the target)
+        next_connections = {}
+
+        def evaluate(profile, earliest_departure) -> tuple:
+            # earliest arrival and connection of the last entry departing at or after the earliest departure
+            if profile is None:
+                return infinity, None
+            negative_departure_times, arrival_times, connection_indices = profile
+            index = bisect_right(negative_departure_times, -earliest_departure) - 1
+            if index < 0:
+                return infinity, None
+            return arrival_times[index], connection_indices[index]
+
+        def add(profiles: dict, key, departure_time: int, arrival_time, index: int):
+            # only entries that arrive earlier than all entries departing later are added
+            profile = profiles.setdefault(key, ([], [], []))
+            negative_departure_times, arrival_times, connection_indices = profile
+            if arrival_times and arrival_time >= arrival_times[-1]:
+                return
+            if negative_departure_times and negative_departure_times[-1] == -departure_time:
+                arrival_times[-1] = arrival_time
+                connection_indices[-1] = index
+                return
+            negative_departure_times.append(-departure_time)
+            arrival_times.append(arrival_time)
+            connection_indices.append(index)
+
+        connections = self.connections
+        first_index = bisect_left(self.departures, start_time)
+        for index in range(len(connections) - 1, first_index - 1, -1):
+            connection = connections[index]
+            arrival_station = connection["to"]
+            if arrival_station not in self.graph:
+                continue
+            arrival_time = connection["planned_arrival"]
+            trip = connection["trip_id"]
+            # arrive at the target, stay in the same train, or transfer to another train (the first one of equal arrivals)
+            options = [(arrival_time, None)] if arrival_station == target else []
+            options.append(evaluate(trip_profiles.get((arrival_station, trip)), arrival_time))
+            options.append(
+                evaluate(station_profiles.get(arrival_station), arrival_time + transfer_time)
+            )
+            earliest_arrival, next_connection = min(options, key=lambda option: option[0])
+            if earliest_arrival == infinity:
+                continue
+            next_connections[index] = next_connection
+            departure_station = connection["from"]
+            departure_time = connection["planned_departure"]
+            add(trip_profiles, (departure_station, trip), departure_time, earliest_arrival, index)
+            add(station_profiles, departure_station, departure_time, earliest_arrival, index)
+
+        source_profile = station_profiles.get(source)
+        if source_profile is None:
+            logging.info("No shortest path could be found.")
+            return []
+        # the entries of the source profile are sorted by descending departure time
+        negative_departure_times, arrival_times, connection_indices = source_profile
+        departure_times = [-negative_departure_time for negative_departure_time in reversed(negative_departure_times)]
+        # the steps departing after the first step at or after end_time are not needed
+        number_steps = min(bisect_left(departure_times, end_time) + 1, len(departure_times))
+        return [
+            (
+                departure_times[position],
+                arrival_times[-1 - position],
+                self._get_profile_path(connection_indices[-1 - position], next_connections),
+            )
+            for position in range(number_steps)
+        ]
+
+    def _get_profile_path(self, index: int, next_connections: dict) -> list[dict]:
+        """
+        Reconstruct the path of a profile entry from its first connection (index) and the next connection of each connection
+        """
+        path = []
+        while index is not None:
+            connection = self.connections[index]
+            path.append(
+                {
+                    "from": connection["from"],
+                    "to": connection["to"],
+                    "planned_departure": connection["planned_departure"],
+                    "planned_arrival": connection["planned_arrival"],
+                    "trip_id": connection["trip_id"],
+                    "actual_times": connection["actual_times"],
+                }
+            )
+            index = next_connections[index]
+
+        # go through path and consolidate trips where the same train is used (remove intermediate stations)
+        return consolidate_path(path)
+
+
+def get_earliest_arrival_from_profile(
+    profile: list[tuple[int, int, list[dict]]], start_time: int
+) -> tuple[int, list[dict]]:
+    """
+    Get the earliest arrival and the path when starting at the start time from a profile (see ConnectionScan.earliest_arrival_profile),
+    same result structure as ConnectionScan.earliest_arrival ((0, []) if there is no path)
+    """
+    position = bisect_left([departure_time for departure_time, _, _ in profile], start_time)
+    if position == len(profile):
+        return 0, []
+    _, arrival_time, path = profile[position]
+    return arrival_time, path
@@ -0,0 +1,591 @@
+# This file contains a time-dependent contraction hierarchy (CH) for earliest arrival queries, an alternative to the Dijkstra algorithm of the graph class
+# and the Connection Scan Algorithm (same results as the connection scan).
+# The stations are contracted one after the other (least important first, ordered by edge difference), the connections between the neighbors of a
+# contracted station are replaced by shortcuts, unless a witness search finds a path that is at least as good without the station.
+# Each edge (station pair) has a profile: the (non-dominated) connections or shortcuts with departure and arrival time, and the first and the last trip
+# (staying in the same train needs no transfer time, like in the connection scan). A query searches upwards from the source (edges to more important
+# stations) and downwards to the target (only edges from which the target can be reached downwards).
+# The preprocessing is stored on disk (one .npy file per column, like the network snapshots), so it is only done once per network.
+# References: "Contraction Hierarchies: Faster and Simpler Hierarchical Routing in Road Networks" (Geisberger et al., 2008),
+# "Time-Dependent Contraction Hierarchies and Approximation" (Batz et al., 2010), old/ContractionHierarchy_Prototype.py
+import hashlib
+import json
+import logging
+import os
+import shutil
+from bisect import bisect_left
+from heapq import heappop, heappush
+from pathlib import Path
+
+import numpy as np
+
+from algorithm.helper import consolidate_path
+from algorithm.reliability import TRANSFER_TIME_DEFAULT
+from constants import LOG_LEVEL
+from storage import METADATA_FILE_NAME, evict_least_recently_used
+
+# set log level
+logging.basicConfig(level=LOG_LEVEL)
+
+# default location of the stored contraction hierarchies (relative to the prototype folder, like the network snapshots)
+CONTRACTION_HIERARCHY_DIRECTORY = "../data/contraction_hierarchies"
+# maximum size of all stored contraction hierarchies (the least recently used ones are deleted, like the network snapshots)
+CONTRACTION_HIERARCHY_MAX_SIZE = 1024**3  # 1 GB
+# increase if the format changes (old contraction hierarchies are not used anymore)
+CONTRACTION_HIERARCHY_FORMAT_VERSION = 1
+# maximum number of labels settled by a witness search (if no witness is found, the shortcut is added)
+WITNESS_SEARCH_LIMIT = 50
+
+
+# positions in an entry of a profile (departure, arrival, first trip, last trip, contracted station and the two entries of a shortcut)
+DEPARTURE, ARRIVAL, FIRST_TRIP, LAST_TRIP, VIA, FIRST_PART, SECOND_PART = range(7)
+
+
+class ContractionHierarchy:
+    """
+    Time-dependent contraction hierarchy of a network (graph dictionary) for a transfer time
+    Entries (connections and shortcuts) are stored once in a list, the profiles of the edges are lists of entry indices sorted by departure time
+    """
+
+    def __init__(
+        self,
+        graph: dict | None = None,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+        witness_search_limit=WITNESS_SEARCH_LIMIT,
+    ):
+        self.transfer_time = transfer_time
+        # all entries: (departure, arrival, first trip, last trip, via, first part, second part), via and parts are None for connections
+        self.entries = []
+        # position of each station in the hierarchy (contraction order)
+        self.rank = {}
+        # edges to more important stations (upward) and to less important stations (downward): station -> {station: profile}
+        # a profile is a tuple of the departure times and the entry indices (sorted by departure time)
+        self.upward_edges = {}
+        self.downward_edges = {}
+        # stations with a downward edge to a station (for the backward search from the target)
+        self.downward_predecessors = {}
+        if graph is not None:
+            self._build(graph, witness_search_limit)
+
+    def _dominates(self, entry: tuple, other_entry: tuple) -> bool:
+        """
+        Check if an entry is at least as good as another entry: it departs not earlier and arrives not later, if the first (last) trips
+        are different, the transfer time is needed before (after) the entry
+        """
+        return (
+            entry[DEPARTURE] >= other_entry[DEPARTURE]
+            and (
+                entry[FIRST_TRIP] == other_entry[FIRST_TRIP]
+                or entry[DEPARTURE] >= other_entry[DEPARTURE] + self.transfer_time
+            )
+            and entry[ARRIVAL]
+            + (0 if entry[LAST_TRIP] == other_entry[LAST_TRIP] else self.transfer_time)
+            <= other_entry[ARRIVAL]
+        )
+
+    def _reduce(self, entries: list[tuple]) -> list[tuple]:
+        """
+        Keep the non-dominated entries (sorted by departure time), of equal entries the first one is kept
+        entries: list of (entry, index), the index is None for new entries
+        """
+        kept = []
+        for item in sorted(entries, key=lambda item: (-item[0][DEPARTURE], item[0][ARRIVAL])):
+            if not any(self._dominates(other[0], item[0]) for other in kept):
+                kept.append(item)
+        kept.reverse()
+        return kept
+
+    def _create_profile(self, items: list[tuple]) -> tuple[list[int], list[int]]:
+        """
+        Create a profile from (entry, index) items sorted by departure time, new entries are added to the list of entries
+        """
+        indices = []
+        for entry, index in items:
+            if index is None:
+                index = len(self.entries)
+                self.entries.append(entry)
+            indices.append(index)
+        return [self.entries[index][DEPARTURE] for index in indices], indices
+
+    def _evaluate(self, profile: tuple[list[int], list[int]], time: int, trip) -> list[int]:
+        """
+        Get the entries of a profile that can be used when being at the station at the time with the trip (None at the source, no transfer time needed)
+        Entries that depart later than the transfer time after the earliest arrival can not be better, they are skipped
+        """
+        departure_times, indices = profile
+        entries = self.entries
+        usable_indices = []
+        earliest_arrival = float("inf")
+        for position in range(bisect_left(departure_times, time), len(indices)):
+            departure_time = departure_times[position]
+            if departure_time >= earliest_arrival + self.transfer_time:
+                break
+            entry = entries[indices[position]]
+            # a transfer is needed if the entry starts with another trip
+            if (
+                trip is not None
+                and entry[FIRST_TRIP] != trip
+                and departure_time < time + self.transfer_time
+            ):
+                continue
+            earliest_arrival = min(earliest_arrival, entry[ARRIVAL])
+            usable_indices.append(indices[position])
+        return usable_indices
+
+    def _is_dominated_label(self, bag: list[tuple], time: int, trip) -> bool:
+        """
+        Check if a label (arrival time and trip at a station) is dominated by a label of the bag (the same trip earlier, or another trip the transfer time earlier)
+        """
+        return any(
+            other_time + (0 if other_trip == trip else self.transfer_time) <= time
+            for other_time, other_trip in bag
+        )
+
+    def _has_witness(
+        self, outgoing: dict, source, target, excluded, entry: tuple, witness_search_limit: int
+    ) -> bool:
+        """
+        Search a path from source to target without the excluded station that is at least as good as the entry (witness search)
+        The search starts at the departure time of the entry with its first trip (other trips need the transfer time)
+        """
+        heap = [(entry[DEPARTURE], 0, source, entry[FIRST_TRIP])]
+        bags = {}
+        counter = 0
+        number_settled = 0
+        while heap and number_settled < witness_search_limit:
+            time, _, node, trip = heappop(heap)
+            if node == target:
+                if time + (0 if trip == entry[LAST_TRIP] else self.transfer_time) <= entry[ARRIVAL]:
+                    return True
+                continue
+            bag = bags.setdefault(node, [])
+            if self._is_dominated_label(bag, time, trip):
+                continue
+            bag.append((time, trip))
+            number_settled += 1
+            for neighbor, profile in outgoing[node].items():
+                if neighbor == excluded:
+                    continue
+                for index in self._evaluate(profile, time, trip):
+                    next_entry = self.entries[index]
+                    if next_entry[ARRIVAL] <= entry[ARRIVAL]:
+                        counter += 1
+                        heappush(
+                            heap, (next_entry[ARRIVAL], counter, neighbor, next_entry[LAST_TRIP])
+                        )
+        return False
+
+    def _get_shortcuts(
+        self, outgoing: dict, incoming: dict, node, witness_search_limit: int
+    ) -> dict[tuple, list[tuple]]:
+        """
+        Get the shortcuts needed when contracting the station: (station before, station after) -> new entries
+        """
+        shortcuts = {}
+        for predecessor in incoming[node]:
+            first_profile = outgoing[predecessor][node]
+            for successor, second_profile in outgoing[node].items():
+                if successor == predecessor:
+                    continue
+                # link the entries of both edges
+                new_entries = []
+                for first_index in first_profile[1]:
+                    first_entry = self.entries[first_index]
+                    for second_index in self._evaluate(
+                        second_profile, first_entry[ARRIVAL], first_entry[LAST_TRIP]
+                    ):
+                        second_entry = self.entries[second_index]
+                        new_entries.append(
+                            (
+                                first_entry[DEPARTURE],
+                                second_entry[ARRIVAL],
+                                first_entry[FIRST_TRIP],
+                                second_entry[LAST_TRIP],
+                                node,
+                                first_index,
+                                second_index,
+                            )
+                        )
+                if not new_entries:
+                    continue
+                # only the new entries that are not dominated by the existing edge or by a witness path
+                existing_profile = outgoing[predecessor].get(successor, ([], []))
+                items = self._reduce(
+                    [(self.entries[index], index) for index in existing_profile[1]]
+                    + [(entry, None) for entry in new_entries]
+                )
+                needed_entries = [
+                    entry
+                    for entry, index in items
+                    if index is None
+                    and not self._has_witness(
+                        outgoing, predecessor, successor, node, entry, witness_search_limit
+                    )
+                ]
+                if needed_entries:
+                    shortcuts[(predecessor, successor)] = needed_entries
+        return shortcuts
+
+    def _get_priority(
+        self, outgoing: dict, incoming: dict, contracted_neighbors: dict, node, witness_search_limit: int
+    ) -> int:
+        """
+        Importance of a station: edge difference (number of shortcuts minus number of removed edges) plus number of contracted neighbors
+        """
+        shortcuts = self._get_shortcuts(outgoing, incoming, node, witness_search_limit)
+        return (
+            len(shortcuts)
+            - len(incoming[node])
+            - len(outgoing[node])
+            + contracted_neighbors[node]
+        )
+
+    def _build(self, graph: dict, witness_search_limit: int):
+        """
+        Contract all stations of the network (least important first)
+        """
+        logging.info(f"Build contraction hierarchy for {len(graph)} stations")
+        # remaining network (stations that are not contracted yet): station -> {station: profile} and station -> stations with an edge to it
+        outgoing = {node: {} for node in graph}
+        incoming = {node: set() for node in graph}
+        connections_per_edge = {}
+        for node in graph:
+            for connection in graph[node]:
+                neighbor = connection["to"]
+                # like in the connection scan, only stations that are nodes of the graph are considered
+                if neighbor not in outgoing or neighbor == node:
+                    continue
+                connections_per_edge.setdefault((node, neighbor), []).append(
+                    (
+                        (
+                            connection["planned_departure"],
+                            connection["planned_arrival"],
+                            connection["trip_id"],
+                            connection["trip_id"],
+                            None,
+                            None,
+                            None,
+                        ),
+                        None,
+                    )
+                )
+        for (node, neighbor), items in connections_per_edge.items():
+            outgoing[node][neighbor] = self._create_profile(self._reduce(items))
+            incoming[neighbor].add(node)
+
+        # priority queue of the stations (lazy updates: the priority is recomputed when a station is popped)
+        contracted_neighbors = {node: 0 for node in graph}
+        priority_queue = []
+        for counter, node in enumerate(graph):
+            heappush(
+                priority_queue,
+                (
+                    self._get_priority(outgoing, incoming, contracted_neighbors, node, witness_search_limit),
+                    counter,
+                    node,
+                ),
+            )
+        number_shortcuts = 0
+        while priority_queue:
+            _, counter, node = heappop(priority_queue)
+            priority = self._get_priority(
+                outgoing, incoming, contracted_neighbors, node, witness_search_limit
+            )
+            if priority_queue and priority > priority_queue[0][0]:
+                heappush(priority_queue, (priority, counter, node))
+                continue
+
+            # contract the station: add the shortcuts between its neighbors
+            for (predecessor, successor), new_entries in self._get_shortcuts(
+                outgoing, incoming, node, witness_search_limit
+            ).items():
+                existing_profile = outgoing[predecessor].get(successor, ([], []))
+                outgoing[predecessor][successor] = self._create_profile(
+                    self._reduce(
+                        [(self.entries[index], index) for index in existing_profile[1]]
+                        + [(entry, None) for entry in new_entries]
+                    )
+                )
+                incoming[successor].add(predecessor)
+                number_shortcuts += 1
+            # the remaining edges of the station go to more important stations (upward) or come from them (downward)
+            self.rank[node] = len(self.rank)
+            self.upward_edges[node] = outgoing.pop(node)
+            self.downward_edges.setdefault(node, {})
+            self.downward_predecessors.setdefault(node, set())
+            for predecessor in incoming.pop(node):
+                self.downward_edges.setdefault(predecessor, {})[node] = outgoing[predecessor].pop(node)
+                self.downward_predecessors[node].add(predecessor)
+                contracted_neighbors[predecessor] += 1
+            for successor in self.upward_edges[node]:
+                incoming[successor].discard(node)
+                contracted_neighbors[successor] += 1
+        logging.info(
+            f"Contraction hierarchy built with {number_shortcuts} shortcut edges and {len(self.entries)} entries"
+        )
+
+    def earliest_arrival(
+        self, source, target, start_time: int, connection_index
+    ) -> tuple[int, list[dict]]:
+        """
+        Compute the shortest path (in terms of earliest arrival time) between the source and target node, same result structure as Graph.dijkstra
+        The search goes upwards from the source and downwards to the target (only to the stations from which the target can be reached downwards)
+        @param connection_index: the index of the connections of the network (ConnectionIndex, to get the connections of the path)
+        """
+        logging.info(
+            f"Find shortest path (contraction hierarchy) from {source} to {target} starting at {start_time}"
+        )
+        if source == target:
+            return start_time, []
+        if source not in self.rank or target not in self.rank:
+            logging.info("No shortest path could be found.")
+            return 0, []
+        # stations from which the target can be reached with downward edges (backward search)
+        target_cone = {target}
+        stack = [target]
+        while stack:
+            node = stack.pop()
+            for predecessor in self.downward_predecessors[node]:
+                if predecessor not in target_cone:
+                    target_cone.add(predecessor)
+                    stack.append(predecessor)
+
+        # labels: (arrival time, counter, station, trip, is downward, parent), once the search went downwards, it only continues downwards
+        # the parent is (parent of the previous label, station, next station, entry index) to reconstruct the path
+        heap = [(start_time, 0, source, None, False, None)]
+        bags = {}
+        counter = 0
+        while heap:
+            time, _, node, trip, is_downward, parent = heappop(heap)
+            if node == target:
+                return time, self._get_path(parent, connection_index)
+            bag = bags.setdefault((node, is_downward), [])
+            if self._is_dominated_label(bag, time, trip):
+                continue
+            bag.append((time, trip))
+            edges = [] if is_downward else [(self.upward_edges[node], False)]
+            edges.append((self.downward_edges[node], True))
+            for neighbors, is_downward_edge in edges:
+                for neighbor, profile in neighbors.items():
+                    if is_downward_edge and neighbor not in target_cone:
+                        continue
+                    for index in self._evaluate(profile, time, trip):
+                        entry = self.entries[index]
+                        counter += 1
+                        heappush(
+                            heap,
+                            (
+                                entry[ARRIVAL],
+                                counter,
+                                neighbor,
+                                entry[LAST_TRIP],
+                                is_downward_edge,
+                                (parent, node, neighbor, index),
+                            ),
+                        )
+        logging.info("No shortest path could be found.")
+        return 0, []
+
+    def _get_path(self, parent, connection_index) -> list[dict]:
+        """
+        Reconstruct the path (connections, consolidated like in Graph.dijkstra) from the labels, shortcuts are replaced by their connections
+        """
+        steps = []
+        while parent is not None:
+            parent, node, neighbor, index = parent
+            steps.append((node, neighbor, index))
+        path = []
+        # the stack has the next part of the path on top
+        stack = steps
+        while stack:
+            node, neighbor, index = stack.pop()
+            entry = self.entries[index]
+            if entry[VIA] is not None:
+                stack.append((entry[VIA], neighbor, entry[SECOND_PART]))
+                stack.append((node, entry[VIA], entry[FIRST_PART]))
+                continue
+            connection = connection_index.get(node, (entry[FIRST_TRIP], entry[DEPARTURE], neighbor))
+            path.append(
+                {
+                    "from": connection["from"],
+                    "to": connection["to"],
+                    "planned_departure": connection["planned_departure"],
+                    "planned_arrival": connection["planned_arrival"],
+                    "trip_id": connection["trip_id"],
+                    "actual_times": connection["actual_times"],
+                }
+            )
+        return consolidate_path(path)
+
+
+def get_contraction_hierarchy_key(graph: dict, transfer_time=TRANSFER_TIME_DEFAULT) -> str:
+    """
+    Get the key of the contraction hierarchy of a network (hash of all connections and the transfer time)
+    """
+    connections = sorted(
+        repr(
+            (
+                connection["from"],
+                connection["to"],
+                connection["planned_departure"],
+                connection["planned_arrival"],
+                connection["trip_id"],
+            )
+        )
+        for node in graph
+        for connection in graph[node]
+    )
+    inputs = {
+        "nodes": sorted(repr(node) for node in graph),
+        "connections": connections,
+        "transfer_time": transfer_time,
+        "format_version": CONTRACTION_HIERARCHY_FORMAT_VERSION,
+    }
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+
+def _value_array(values: list) -> np.ndarray:
+    """
+    Stations and trips are either numbers or strings, both are stored as fixed size arrays (without pickle)
+    """
+    if all(isinstance(value, (int, np.integer)) for value in values):
+        return np.array(values, dtype=np.int64)
+    return np.array([str(value) for value in values], dtype=np.str_)
+
+
+def save_contraction_hierarchy(
+    contraction_hierarchy: ContractionHierarchy,
+    key: str,
+    directory=CONTRACTION_HIERARCHY_DIRECTORY,
+    max_size=CONTRACTION_HIERARCHY_MAX_SIZE,
+):
+    """
+    Save the contraction hierarchy (one .npy file per column, entries and edges as flat arrays)
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    nodes = sorted(contraction_hierarchy.rank, key=contraction_hierarchy.rank.get)
+    node_index = {node: index for index, node in enumerate(nodes)}
+    entries = contraction_hierarchy.entries
+    trips = list(dict.fromkeys(entry[trip_position] for entry in entries for trip_position in (FIRST_TRIP, LAST_TRIP)))
+    trip_index = {trip: index for index, trip in enumerate(trips)}
+
+    def part(value):
+        return -1 if value is None else value
+
+    edges = [
+        (node_index[node], node_index[neighbor], is_upward, profile[1])
+        for is_upward, edges_per_node in ((True, contraction_hierarchy.upward_edges), (False, contraction_hierarchy.downward_edges))
+        for node, neighbors in edges_per_node.items()
+        for neighbor, profile in neighbors.items()
+    ]
+    columns = {
+        "nodes": _value_array(nodes),
+        "trips": _value_array(trips),
+        "departure": np.array([entry[DEPARTURE] for entry in entries], dtype=np.int32),
+        "arrival": np.array([entry[ARRIVAL] for entry in entries], dtype=np.int32),
+        "first_trip": np.array([trip_index[entry[FIRST_TRIP]] for entry in entries], dtype=np.int32),
+        "last_trip": np.array([trip_index[entry[LAST_TRIP]] for entry in entries], dtype=np.int32),
+        "via": np.array([part(None if entry[VIA] is None else node_index[entry[VIA]]) for entry in entries], dtype=np.int32),
+        "first_part": np.array([part(entry[FIRST_PART]) for entry in entries], dtype=np.int64),
+        "second_part": np.array([part(entry[SECOND_PART]) for entry in entries], dtype=np.int64),
+        "edge_from": np.array([edge[0] for edge in edges], dtype=np.int32),
+        "edge_to": np.array([edge[1] for edge in edges], dtype=np.int32),
+        "edge_is_upward": np.array([edge[2] for edge in edges], dtype=bool),
+        "edge_offsets": np.concatenate(([0], np.cumsum([len(edge[3]) for edge in edges], dtype=np.int64))),
+        "edge_entries": np.array([index for edge in edges for index in edge[3]], dtype=np.int64),
+    }
+
+    # write to a temporary directory first, so there is never a partially written contraction hierarchy
+    temporary_directory = directory / f".{key}.{os.getpid()}.tmp"
+    if temporary_directory.exists():
+        shutil.rmtree(temporary_directory)
+    temporary_directory.mkdir()
+    for name, values in columns.items():
+        np.save(temporary_directory / f"{name}.npy", values, allow_pickle=False)
+    with open(temporary_directory / METADATA_FILE_NAME, "w") as metadata_file:
+        json.dump(
+            {
+                "key": key,
+                "transfer_time": contraction_hierarchy.transfer_time,
+                "format_version": CONTRACTION_HIERARCHY_FORMAT_VERSION,
+            },
+            metadata_file,
+        )
+    target_directory = directory / key
+    if target_directory.exists():
+        shutil.rmtree(target_directory)
+    os.replace(temporary_directory, target_directory)
+    logging.info(f"Contraction hierarchy saved to {target_directory}")
+
+    # keep the contraction hierarchies within the size limit (one is stored for every network, e.g., every time window)
+    evict_least_recently_used(
+        directory,
+        max_size,
+        lambda metadata: metadata.get("format_version") != CONTRACTION_HIERARCHY_FORMAT_VERSION,
+        description="contraction hierarchy",
+    )
+
+
+def load_contraction_hierarchy(
+    key: str, directory=CONTRACTION_HIERARCHY_DIRECTORY
+) -> ContractionHierarchy | None:
+    """
+    Load a contraction hierarchy, returns None if there is none for the key
+    """
+    directory = Path(directory) / key
+    if not (directory / METADATA_FILE_NAME).exists():
+        return None
+    try:
+        with open(directory / METADATA_FILE_NAME) as metadata_file:
+            metadata = json.load(metadata_file)
+        columns = {
+            path.stem: np.load(path, allow_pickle=False) for path in directory.glob("*.npy")
+        }
+    except (OSError, ValueError):
+        logging.info(f"Contraction hierarchy {directory} could not be read")
+        return None
+    # mark the contraction hierarchy as used (for the eviction of the least recently used ones)
+    os.utime(directory / METADATA_FILE_NAME)
+
+    contraction_hierarchy = ContractionHierarchy(transfer_time=metadata["transfer_time"])
+    nodes = columns["nodes"].tolist()
+    trips = columns["trips"].tolist()
+    contraction_hierarchy.entries = [
+        (
+            departure,
+            arrival,
+            trips[first_trip],
+            trips[last_trip],
+            None if via < 0 else nodes[via],
+            None if first_part < 0 else first_part,
+            None if second_part < 0 else second_part,
+        )
+        for departure, arrival, first_trip, last_trip, via, first_part, second_part in zip(
+            columns["departure"].tolist(),
+            columns["arrival"].tolist(),
+            columns["first_trip"].tolist(),
+            columns["last_trip"].tolist(),
+            columns["via"].tolist(),
+            columns["first_part"].tolist(),
+            columns["second_part"].tolist(),
+        )
+    ]
+    contraction_hierarchy.rank = {node: rank for rank, node in enumerate(nodes)}
+    contraction_hierarchy.upward_edges = {node: {} for node in nodes}
+    contraction_hierarchy.downward_edges = {node: {} for node in nodes}
+    contraction_hierarchy.downward_predecessors = {node: set() for node in nodes}
+    offsets = columns["edge_offsets"].tolist()
+    edge_entries = columns["edge_entries"].tolist()
+    for position, (node, neighbor, is_upward) in enumerate(
+        zip(columns["edge_from"].tolist(), columns["edge_to"].tolist(), columns["edge_is_upward"].tolist())
+    ):
+        indices = edge_entries[offsets[position]:offsets[position + 1]]
+        profile = ([contraction_hierarchy.entries[index][DEPARTURE] for index in indices], indices)
+        if is_upward:
+            contraction_hierarchy.upward_edges[nodes[node]][nodes[neighbor]] = profile
+        else:
+            contraction_hierarchy.downward_edges[nodes[node]][nodes[neighbor]] = profile
+            contraction_hierarchy.downward_predecessors[nodes[neighbor]].add(nodes[node])
+    logging.info(f"Contraction hierarchy loaded from {directory}")
+    return contraction_hierarchy
@@ -4,18 +4,38 @@
 # Also, the dijkstra algorithm is based on a ChatGPT chat (2024-11-20): https://chatgpt.com/c/673cb220-5308-8013-bf0d-36f55f78e707
 # And also the chat on (2024-11-24): https://chatgpt.com/share/67431b48-4a30-8013-9c88-6cc073907030 (adjustments for arrival time and different data structure)
 import logging
-from copy import deepcopy
+from bisect import bisect_left, bisect_right
+
+import numpy as np
 
 # The heap queue is a regular heap data structure, where the smallest element is always popped first. (for us with the smallest distance)
 from heapq import heapify, heappop, heappush
 
+from algorithm.connection_index import ConnectionIndex
+from algorithm.connection_scan import ConnectionScan
+from algorithm.contraction_hierarchy import (
+    ContractionHierarchy,
+    CONTRACTION_HIERARCHY_DIRECTORY,
+    get_contraction_hierarchy_key,
+    load_contraction_hierarchy,
+    save_contraction_hierarchy,
+)
 from algorithm.helper import (
     is_transfer_needed,
     consolidate_path,
     merge_actual_times,
-    get_specific_station_name_from_identifier,
 )
-from algorithm.reliability import compute_reliability, TRANSFER_TIME_DEFAULT
+from algorithm.label_dominance import ParetoBags, get_pareto_front
+from algorithm.priority_queue import LazyPriorityQueue
+from algorithm.raptor import MAXIMUM_NUMBER_OF_TRIPS, Raptor
+from algorithm.reliability_bound import ArrivalLowerBound, ReliabilityUpperBound
+from algorithm.reliability import (
+    compute_reliability,
+    create_partial_path_reliability,
+    get_reliability_from_arrival_cdf,
+    ReliabilityCache,
+    TRANSFER_TIME_DEFAULT,
+)
 from constants import LOG_LEVEL
 
 # set log level
@@ -26,11 +46,53 @@ logging.basicConfig(level=LOG_LEVEL)
 # We assume we have a network (graph) with nodes representing locations/stations and multiple edges representing connections between the nodes (with departure and arrival times in minutes)
 
 
+class PathLabel:
+    """
+    Partial path (sequence of trips) in the search for the most reliable path, stored as the last (tail) trip and a pointer to the path before it
+    Labels are never changed after creation, so extending a path shares all trips before the tail trip (no copying of the whole path)
+    The key identifies the path in the reliability cache (None if the reliability is not cached)
+    """
+
+    __slots__ = ("parent", "trip", "length", "key")
+
+    def __init__(self, parent, trip: dict, key=None):
+        self.parent = parent
+        self.trip = trip
+        self.key = key
+        # number of trips in the path (including the trip at the source)
+        self.length = parent.length + 1 if parent is not None else 1
+
+    def to_path(self) -> list[dict]:
+        """
+        Get the list of trips of the path (from the source to the tail trip)
+        """
+        path = []
+        label = self
+        while label is not None:
+            path.append(dict(label.trip))
+            label = label.parent
+        path.reverse()
+        return path
+
+
 class Graph:
-    def __init__(self, graph=None):
+    def __init__(self, graph=None, reliability_cache=None, enable_reliability_cache=True):
         if graph is None:
             graph = {}
         self.graph = graph
+        # cache for the reliability information of partial paths, one per network (the cached results depend on the actual times of the trips),
+        # a cache can only be shared by graphs of the same network (e.g., the network of the whole day)
+        if reliability_cache is None and enable_reliability_cache:
+            reliability_cache = ReliabilityCache()
+        self.reliability_cache = reliability_cache
+        # index of the connections per node (to check in constant time if a connection already exists, created when it is used for the first time)
+        self.connection_index = None
+        # all connections sorted by departure time for the connection scan (created when it is used for the first time)
+        self.connection_scan = None
+        # contraction hierarchies per transfer time (loaded or built when they are used for the first time)
+        self.contraction_hierarchies = {}
+        # routes of the network for RAPTOR (created when they are used for the first time)
+        self.raptor = None
         # sort the connections by departure time
         self.sort_connections()
 
@@ -40,6 +102,7 @@ class Graph:
         """
         if node not in self.graph:
             self.graph[node] = []
+            self.departure_times[node] = []
 
     def add_edge(
         self, node1, node2, identifier, departure_time, arrival_time, actual_times
@@ -53,17 +116,22 @@ class Graph:
             self.add_node(node1)
         if node2 not in self.graph:
             self.add_node(node2)
-        # add the connection to the graph
-        self.graph[node1].append(
-            {
-                "from": node1,
-                "to": node2,
-                "planned_departure": departure_time,
-                "planned_arrival": arrival_time,
-                "trip_id": identifier,
-                "actual_times": actual_times,
-            }
-        )
+        connection = {
+            "from": node1,
+            "to": node2,
+            "planned_departure": departure_time,
+            "planned_arrival": arrival_time,
+            "trip_id": identifier,
+            "actual_times": actual_times,
+        }
+        # add the connection to the graph (only if it does not exist yet), at the position of its departure time (connections stay sorted)
+        if self.get_connection_index().add(connection):
+            position = bisect_right(self.departure_times[node1], departure_time)
+            self.graph[node1].insert(position, connection)
+            self.departure_times[node1].insert(position, departure_time)
+            self.connection_scan = None
+            self.contraction_hierarchies = {}
+            self.raptor = None
 
     def sort_connections(self):
         """
@@ -73,6 +141,18 @@ class Graph:
         for node in self.graph:
             # sort the connections of the node by departure time
             self.graph[node].sort(key=lambda x: x["planned_departure"])
+        # parallel lists with the departure times of the connections per node (for the binary search of the first possible connection)
+        self.departure_times = {
+            node: [connection["planned_departure"] for connection in self.graph[node]]
+            for node in self.graph
+        }
+
+    def get_connections_departing_from(self, node, earliest_departure) -> list[dict]:
+        """
+        Get the connections of a node that depart at or after the earliest departure time (binary search on the sorted departure times)
+        """
+        start = bisect_left(self.departure_times[node], earliest_departure)
+        return self.graph[node][start:]
 
     def dijkstra(
         self,
@@ -122,8 +202,12 @@ class Graph:
                 logging.debug(f"***Found target {current_node}")
                 break
 
-            # go through all connections of the current node
-            for connection in self.graph[current_node]:
+            # go through all connections of the current node that depart late enough (at or after the current arrival time,
+            # the transfer time for connections of other trips is checked below)
+            for connection in self.get_connections_departing_from(
+                current_node,
+                max(current_time, current_arrival + min(transfer_time, 0)),
+            ):
                 # get infos from the connection
                 departure_time = connection["planned_departure"]
                 neighbor = connection["to"]
@@ -221,6 +305,326 @@ class Graph:
 
         return earliest_arrival_times[target], consolidated_path
 
+    def connection_scan_earliest_arrival(
+        self,
+        source: str,
+        target: str,
+        start_time: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+    ) -> tuple[int, list[dict]]:
+        """
+        Compute the shortest path (in terms of earliest arrival time) between any source and target node based on the Connection Scan Algorithm
+        Same parameters and result as dijkstra
+        """
+        return self.get_connection_scan().earliest_arrival(
+            source, target, start_time, transfer_time=transfer_time
+        )
+
+    def connection_scan_earliest_arrival_profile(
+        self,
+        source: str,
+        target: str,
+        start_time: int,
+        end_time: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+    ) -> list[tuple[int, int, list[dict]]]:
+        """
+        Compute the earliest arrival (and path) for all departure times between start_time and end_time with one scan (profile Connection Scan Algorithm)
+        Returns the steps (latest departure time, earliest arrival time, path), see ConnectionScan.earliest_arrival_profile and get_earliest_arrival_from_profile
+        """
+        return self.get_connection_scan().earliest_arrival_profile(
+            source, target, start_time, end_time, transfer_time=transfer_time
+        )
+
+    def get_connection_index(self) -> ConnectionIndex:
+        """
+        Get the index of the connections per node (created when it is used for the first time, then updated when adding edges)
+        """
+        if self.connection_index is None:
+            self.connection_index = ConnectionIndex(self.graph)
+        return self.connection_index
+
+    def get_connection_scan(self) -> ConnectionScan:
+        """
+        Get all connections sorted by departure time (created when it is used for the first time, and again after adding edges)
+        """
+        if self.connection_scan is None:
+            self.connection_scan = ConnectionScan(self.graph)
+        return self.connection_scan
+
+    def contraction_hierarchy_earliest_arrival(
+        self,
+        source: str,
+        target: str,
+        start_time: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+    ) -> tuple[int, list[dict]]:
+        """
+        Compute the shortest path (in terms of earliest arrival time) between any source and target node based on the contraction hierarchy
+        Same parameters and result as dijkstra (the same earliest arrival as the Connection Scan Algorithm)
+        """
+        return self.get_contraction_hierarchy(transfer_time).earliest_arrival(
+            source, target, start_time, self.get_connection_index()
+        )
+
+    def get_contraction_hierarchy(
+        self, transfer_time=TRANSFER_TIME_DEFAULT, directory=CONTRACTION_HIERARCHY_DIRECTORY
+    ) -> ContractionHierarchy:
+        """
+        Get the contraction hierarchy of the graph for the transfer time (loaded from the directory if it was stored before, otherwise it is built and stored)
+        @param directory: directory of the stored contraction hierarchies, None to neither load nor store it
+        """
+        if transfer_time in self.contraction_hierarchies:
+            return self.contraction_hierarchies[transfer_time]
+        contraction_hierarchy = None
+        if directory is not None:
+            key = get_contraction_hierarchy_key(self.graph, transfer_time)
+            contraction_hierarchy = load_contraction_hierarchy(key, directory)
+        if contraction_hierarchy is None:
+            contraction_hierarchy = ContractionHierarchy(self.graph, transfer_time)
+            if directory is not None:
+                save_contraction_hierarchy(contraction_hierarchy, key, directory)
+        self.contraction_hierarchies[transfer_time] = contraction_hierarchy
+        return contraction_hierarchy
+
+    def raptor_earliest_arrival(
+        self,
+        source: str,
+        target: str,
+        start_time: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+        maximum_number_of_trips=MAXIMUM_NUMBER_OF_TRIPS,
+    ) -> tuple[int, list[dict]]:
+        """
+        Compute the shortest path (in terms of earliest arrival time) with at most maximum_number_of_trips trips based on RAPTOR
+        Same parameters and result as dijkstra (the same transfer rules as the Connection Scan Algorithm)
+        """
+        return self.get_raptor().earliest_arrival(
+            source, target, start_time, transfer_time, maximum_number_of_trips
+        )
+
+    def raptor_earliest_arrivals(
+        self,
+        source: str,
+        target: str,
+        start_time: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+        maximum_number_of_trips=MAXIMUM_NUMBER_OF_TRIPS,
+    ) -> list[tuple[int, int, list[dict]]]:
+        """
+        Compute the Pareto set of (number of trips, earliest arrival time, path) with at most maximum_number_of_trips trips based on RAPTOR (one round per trip)
+        """
+        return self.get_raptor().earliest_arrivals(
+            source, target, start_time, transfer_time, maximum_number_of_trips
+        )
+
+    def get_raptor(self) -> Raptor:
+        """
+        Get the routes of the graph for RAPTOR (created when they are used for the first time, and again after adding edges)
+        """
+        if self.raptor is None:
+            self.raptor = Raptor(self.graph)
+        return self.raptor
+
+    def find_most_reliable_raptor_candidate(
+        self,
+        source: str,
+        target: str,
+        start_time: int,
+        time_budget: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+        reliability_engine="analytic",
+        candidate_transfer_times=None,
+        maximum_number_of_trips=MAXIMUM_NUMBER_OF_TRIPS,
+    ) -> tuple[tuple[int, float, list[dict]], list[tuple[int, int, float, list[dict]]]]:
+        """
+        Find a reliable path by evaluating the reliability of the RAPTOR journeys only (instead of searching all partial paths like find_most_reliable_path)
+        The candidates are the Pareto sets of (number of trips, arrival time) journeys for each of the candidate transfer times (longer transfer times
+        give journeys with more buffer), the reliability is always computed with transfer_time.
+        Returns (arrival time, reliability, path) of the most reliable candidate ((None, 0, None) if no candidate arrives in time) and all candidates
+        as (number of trips, arrival time, reliability, path)
+        @param candidate_transfer_times: minimum transfer times for the candidate journeys, by default 1, 2 and 3 times the transfer time
+        """
+        if candidate_transfer_times is None:
+            candidate_transfer_times = (transfer_time, 2 * transfer_time, 3 * transfer_time)
+        candidates = []
+        paths = set()
+        for candidate_transfer_time in candidate_transfer_times:
+            for number_of_trips, arrival_time, path in self.raptor_earliest_arrivals(
+                source, target, start_time, candidate_transfer_time, maximum_number_of_trips
+            ):
+                # the same journey can be found with different transfer times
+                if not path:
+                    continue
+                path_key = tuple(
+                    (trip["from"], trip["trip_id"], trip["planned_departure"], trip["to"]) for trip in path
+                )
+                if path_key in paths:
+                    continue
+                paths.add(path_key)
+                reliability = compute_reliability(
+                    path, start_time, time_budget, transfer_time=transfer_time, reliability_engine=reliability_engine,
+                    reliability_cache=self.reliability_cache,
+                )
+                candidates.append((number_of_trips, arrival_time, reliability, path))
+        logging.debug(f"Evaluated {len(candidates)} RAPTOR candidates")
+        most_reliable_candidate = max(candidates, key=lambda candidate: candidate[2], default=None)
+        if most_reliable_candidate is None or most_reliable_candidate[2] == 0:
+            return (None, 0, None), candidates
+        _, arrival_time, reliability, path = most_reliable_candidate
+        return (arrival_time, reliability, path), candidates
+
+    def get_reliability_upper_bound(self, target, time_limit: int) -> ReliabilityUpperBound:
+        """
+        Compute the optimistic probability of arriving at the target at or before the time limit per station and departure time (backward pass over all connections)
+        """
+        return ReliabilityUpperBound(self.get_connection_scan().connections, target, time_limit)
+
+    @staticmethod
+    def get_optimistic_reliability(
+        reliability_upper_bound: ReliabilityUpperBound,
+        label: PathLabel,
+        partial_path_reliability,
+        reliability_engine="analytic",
+    ) -> float:
+        """
+        Optimistic reliability of any extension of a partial path (label) that reaches the target (see ReliabilityUpperBound)
+        The bound assumes independent trips, for the other reliability engines only the bound of the probability of making the connections is used
+        (the fraction of days can increase if a trip restricts the path to fewer operating days, see PartialPathScenarios.probability_connections_made_bound)
+        """
+        if reliability_engine != "analytic":
+            return partial_path_reliability.probability_connections_made_bound
+        return reliability_upper_bound.get_path_bound(label.trip, partial_path_reliability)
+
+    @staticmethod
+    def create_pareto_bags(reliability_engine="analytic") -> ParetoBags | None:
+        """
+        Create the Pareto bags for the dominance of partial paths, None if the reliability engine is not supported
+        (the dominance is based on the arrival time distributions of the analytic reliability)
+        """
+        return ParetoBags() if reliability_engine == "analytic" else None
+
+    def _create_source_label(
+        self, source, transfer_time=TRANSFER_TIME_DEFAULT, reliability_engine="analytic"
+    ) -> PathLabel:
+        """
+        Create the label of the empty path at the source (pseudo trip from the source to the source)
+        """
+        key = (
+            self.reliability_cache.get_root_key(reliability_engine, transfer_time)
+            if self.reliability_cache is not None
+            else None
+        )
+        return PathLabel(None, {"from": source, "to": source, "actual_times": []}, key)
+
+    def _create_label(
+        self, parent: PathLabel, trip: dict, transfer_needed, add_trip, transfer_time
+    ) -> tuple[PathLabel, object]:
+        """
+        Create the label of the path parent + trip and its reliability information, computed with add_trip (extend or replace_tail
+        of the reliability information) or taken from the reliability cache
+        """
+        if parent.key is None:
+            return PathLabel(parent, trip), add_trip(
+                trip, transfer_needed, transfer_time=transfer_time
+            )
+        key, partial_path_reliability = self.reliability_cache.get(
+            self.reliability_cache.get_key(parent.key, trip, transfer_needed),
+            lambda: add_trip(trip, transfer_needed, transfer_time=transfer_time),
+        )
+        return PathLabel(parent, trip, key), partial_path_reliability
+
+    def extend_path(
+        self, label: PathLabel, partial_path_reliability, transfer_time=TRANSFER_TIME_DEFAULT
+    ):
+        """
+        Extend a partial path (label) with all possible connections from the station of its last trip
+        Yields the connection, the extended path (label) and its reliability information for each extension
+        (paths with more than MAXIMUM_NUMBER_OF_TRIPS trips, not counting the trip at the source, are not extended further)
+        """
+        last_trip = label.trip
+        # get all edges/arcs (connections to other stations) that are adjacent (neighbors) to the last trip (e.g., all trips from Bern to somewhere else)
+        # first, we need the station (which is the arrival station, or "to")
+        last_station = last_trip["to"]
+        # then we can use the graph-structure to get all edges (connections) from this node/station
+        # if there are connections in the graph for this station, go through them, otherwise continue
+        if last_station not in self.graph:
+            logging.debug(f"No connections for this station {last_station}")
+            return
+
+        # possible connections = adjacent edges, only the ones departing at or after the planned arrival of the last trip
+        possible_connections = self.get_connections_departing_from(
+            last_station,
+            last_trip["planned_arrival"] if "planned_arrival" in last_trip else float("-inf"),
+        )
+        for connection in possible_connections:
+            # check if a transfer is needed between last trip and current connection, if no transfer is needed
+            # we consolidate the trips (e.g., we have a "direct" connection from A to C (same train), we can remove the connection from A to B and B to C,
+            # only using the actual times for departure from first trip and arrival from the last trip)
+            train_identifier_last_trip = (
+                last_trip["trip_id"] if "trip_id" in last_trip else ""
+            )
+            train_identifier_current_connection = connection["trip_id"]
+            transfer_needed = is_transfer_needed(
+                train_identifier_last_trip, train_identifier_current_connection
+            )
+            # consolidate the path if no transfer is needed (= same train)
+            if not transfer_needed:
+                actual_times = merge_actual_times(
+                    last_trip["actual_times"], connection["actual_times"]
+                )
+                logging.debug(f"Length of actual times: {len(actual_times)}")
+                if len(actual_times) > 0:
+                    # consolidate: update the last trip and current connection -> we remove the intermediate station,
+                    # so we set the arrival station of the last trip to the arrival station of the current connection and update the actual times and the planned arrival time
+                    # e.g., A -> B and B -> C, we remove B and have A -> C
+                    logging.debug("No transfer needed, consolidate path")
+                    # station identifiers only (looking up the names in the database for every consolidation is too slow)
+                    logging.debug(
+                        f"Trip: {last_trip['from']} -> {last_trip['to']} to {connection['to']}"
+                    )
+                    consolidated_trip = {
+                        **last_trip,
+                        "to": connection["to"],
+                        "planned_arrival": connection["planned_arrival"],
+                        # update the actual times
+                        "actual_times": actual_times,
+                    }
+                    # replace the last trip of the path (new label with the same parent)
+                    extended_label, extended_partial_path_reliability = self._create_label(
+                        label.parent,
+                        consolidated_trip,
+                        # only the reliability of the (consolidated) tail trip changes, the transfer is from the trip before
+                        is_transfer_needed(
+                            label.parent.trip["trip_id"] if "trip_id" in label.parent.trip else "",
+                            consolidated_trip["trip_id"],
+                        ),
+                        partial_path_reliability.replace_tail,
+                        transfer_time,
+                    )
+                else:
+                    # if no actual times are available, we just add the connection to the extended path
+                    extended_label, extended_partial_path_reliability = self._create_label(
+                        label, connection, transfer_needed, partial_path_reliability.extend, transfer_time
+                    )
+            else:
+                # if no actual times are available, we just add the connection to the extended path
+                extended_label, extended_partial_path_reliability = self._create_label(
+                    label, connection, transfer_needed, partial_path_reliability.extend, transfer_time
+                )
+
+            # simplification/efficiency improvement: if the number of trips is more than 4 (including the trip at the source), we skip all possible connections
+            # from here (we have already reached the maximum number of trips, MAXIMUM_NUMBER_OF_TRIPS, the same limit as the rounds of RAPTOR)
+            # This is a simplification to speed up the process, we assume that no one would transfer more than 2 times
+            # This is a bit different from in the paper - flight networks don't have the same structure as train networks, fewer nodes
+            if extended_label.length > MAXIMUM_NUMBER_OF_TRIPS + 1:
+                logging.debug(
+                    "More than 4 trips, skipping all possible connections from here"
+                )
+                continue
+
+            yield connection, extended_label, extended_partial_path_reliability
+
     def find_most_reliable_path(
         self,
         source: str,
@@ -230,7 +634,8 @@ class Graph:
         transfer_time=TRANSFER_TIME_DEFAULT,
         lower_bound_reliability=0.0,
         initial_most_reliable_path=None,
-        enable_efficiency_improvements=True
+        enable_efficiency_improvements=True,
+        reliability_engine="analytic",
     ) -> tuple[int, float, list[dict]]:
         """
         Find the most reliable "itinerary" / path using a network search algorithm, based on the reference paper "The most reliable flight itinerary problem" (Redmond et al., 2019)
@@ -238,6 +643,10 @@ class Graph:
         @:param source: origin of the path
         @:param target: destination of the path
         @:param start_time: start time of considered trips, when we start the "journey"
+        @:param lower_bound_reliability: not used anymore, the reliability of initial_most_reliable_path is the lower bound (if efficiency improvements are enabled)
+        @:param reliability_engine: "analytic" (distributions of the trips) or "scenario" (replay of the historical days), see RELIABILITY_ENGINES,
+        with "monte_carlo" the returned reliability is the (optimistically biased) sample score of the search, re-estimate it for the chosen path
+        with estimate_reliability_monte_carlo
         """
         logging.info(
             f"Find most reliable path from {source} to {target} starting at {start_time} with a time budget of {time_budget} minutes"
@@ -248,133 +657,69 @@ class Graph:
             most_reliable_path = initial_most_reliable_path
         else:
             most_reliable_path = None
+        # latest arrival at the target (for the probability of arriving in time)
+        time_limit = start_time + time_budget
+        if enable_efficiency_improvements:
+            # 3. (A*-like upper bound) efficiency improvement: optimistic probability of arriving at the target in time from each station,
+            # a partial path is only extended if its optimistic reliability is greater than the reliability of the most reliable path found so far
+            reliability_upper_bound = self.get_reliability_upper_bound(target, time_limit)
+        # 4. (label dominance) efficiency improvement: only keep the non-dominated partial paths per station and trip (for the analytic reliability)
+        pareto_bags = self.create_pareto_bags(reliability_engine) if enable_efficiency_improvements else None
         # Initialize k (used as additional "tiebreaker" for the comparison of the heap queue)
         k = 2
-        # Initialize list with partial paths/itineraries (reliability, label k (as additional identifier of the partial path, time between start time and the scheduled arrival
-        # of the current tail trip in the itinerary/path, probability of last/tail trip arriving at time t dependent on making the connections, and list of nodes part of the
-        # path (node with actual time information))
-        if enable_efficiency_improvements:
-            # lower bound reliability is either 0 or the reliability of the shortest path
-            priority_queue = [
-                # regarding using the shortest path as initial incumbent most reliable path, we use the reliability of the shortest path as lower bound
-                (lower_bound_reliability, k, 0, None, [{"from": source, "to": source, "actual_times": []}])
-            ]
-        else:
-            priority_queue = [
-                (0, k, 0, None, [{"from": source, "to": source, "actual_times": []}])
-            ]
+        # Initialize queue with partial paths/itineraries (reliability, label k (as additional identifier of the partial path, time between start time and the scheduled arrival
+        # of the current tail trip in the itinerary/path, probability of last/tail trip arriving at time t dependent on making the connections, list of nodes part of the
+        # path (node with actual time information), and the reliability information of the partial path (so extending the path only needs the computation for the tail trip))
+        # the partial path with the highest bound of the probability of making all connections is extended first (see probability_connections_made_bound,
+        # staying in the train can increase the probability of making the connections, so the probability itself is no bound for the extensions)
+        priority_queue = LazyPriorityQueue()
+        # the empty path at the source makes all connections (probability 1)
+        priority_queue.push(
+            1,
+            k,
+            (1, k, 0, None, self._create_source_label(source, transfer_time, reliability_engine), create_partial_path_reliability(reliability_engine)),
+        )
         position_of_trips = 4  # position of the trips in the tuple
         position_of_reliability = 0  # position of the reliability in the tuple
-
-        # heapify the priority queue to maintain the heap property (from the initial list)
-        heapify(priority_queue)
+        position_of_partial_path_reliability = 5  # position of the reliability information in the tuple
+        if enable_efficiency_improvements and most_reliable_path is not None:
+            # regarding using the shortest path as initial incumbent most reliable path, we use the reliability of the shortest path as lower bound
+            priority_queue.raise_threshold(most_reliable_path[position_of_reliability])
 
         while priority_queue:
-            # get path with the highest reliability from queue
-            path_highest_reliability = heappop(priority_queue)
-            # get the last (tail) trip from the path with the highest reliability
-            last_trip = deepcopy(
-                path_highest_reliability[position_of_trips][-1]
-            )  # is the element position of the trips, -1 is the last
-            # get all edges/arcs (connections to other stations) that are adjacent (neighbors) to the last trip (e.g., all trips from Bern to somewhere else)
-            # first, we need the station (which is the arrival station, or "to")
-            last_station = last_trip["to"]
-            # then we can use the graph-structure to get all edges (connections) from this node/station
-            # @todo: add function that returns only the connections that are after our current time? (already after start time because of network generation)
-            # if there are connections in the graph for this station, go through them, otherwise continue
-            if last_station not in self.graph:
-                logging.debug(f"No connections for this station {last_station}")
+            # get path with the highest reliability from queue (paths that are less reliable than the most reliable path found so far are dropped)
+            path_highest_reliability = priority_queue.pop()
+            if path_highest_reliability is None:
+                break
+            # get the last (tail) trip from the path with the highest reliability (the label of the path, it is never changed)
+            label = path_highest_reliability[position_of_trips]
+            # 4. (label dominance) efficiency improvement: skip the path if it was dominated by another path after it was added
+            if pareto_bags is not None and pareto_bags.is_dominated(path_highest_reliability[1]):
                 continue
-
-            possible_connections = self.graph[
-                last_station
-            ]  # possible connections = adjacent edges
-            # go through all adjacent edges to "build"/extend our path towards our target/destination further
-            for connection in possible_connections:
-                # check if the planned departure time of the connection is greater than the planned arrival time of the last trip
-                if (
-                    "planned_arrival" in last_trip
-                    and connection["planned_departure"] < last_trip["planned_arrival"]
-                ):
-                    # logging.debug(f"Connection is before arrival of last trip {last_trip}, connection: {connection}")
-                    continue
-
-                # prepare the extended path (add the connection to the path)
-                extended_trips = deepcopy(
-                    path_highest_reliability[position_of_trips]
-                )  # the trips in the tuple
-
-                # check if a transfer is needed between last trip and current connection, if no transfer is needed
-                # we consolidate the trips (e.g., we have a "direct" connection from A to C (same train), we can remove the connection from A to B and B to C,
-                # only using the actual times for departure from first trip and arrival from the last trip)
-                train_identifier_last_trip = (
-                    last_trip["trip_id"] if "trip_id" in last_trip else ""
-                )
-                train_identifier_current_connection = connection["trip_id"]
-                transfer_needed = is_transfer_needed(
-                    train_identifier_last_trip, train_identifier_current_connection
+            # 3. (A*-like upper bound) efficiency improvement: skip the path if it can not be more reliable than the most reliable path found in the meantime
+            if (
+                enable_efficiency_improvements
+                and label.parent is not None
+                and most_reliable_path is not None
+                and self.get_optimistic_reliability(
+                    reliability_upper_bound,
+                    label,
+                    path_highest_reliability[position_of_partial_path_reliability],
+                    reliability_engine,
                 )
-                # consolidate the path if no transfer is needed (= same train)
-                if not transfer_needed:
-                    actual_times = merge_actual_times(
-                        last_trip["actual_times"], connection["actual_times"]
-                    )
-                    logging.debug(f"Length of actual times: {len(actual_times)}")
-                    if len(actual_times) > 0:
-                        # consolidate: update the last trip and current connection -> we remove the intermediate station,
-                        # so we set the arrival station of the last trip to the arrival station of the current connection and update the actual times and the planned arrival time
-                        # e.g., A -> B and B -> C, we remove B and have A -> C
-                        logging.debug(
-                            "No transfer needed, consolidate path)"
-                        )  # {extended_trips}")
-                        last_trip_departure_station = (
-                            get_specific_station_name_from_identifier(
-                                stop_id=last_trip["from"]
-                            )
-                            if last_trip["from"] is not None
-                            else "None"
-                        )
-                        last_trip_arrival_station = (
-                            get_specific_station_name_from_identifier(
-                                stop_id=last_trip["to"]
-                            )
-                        )
-                        connection_arrival_station = (
-                            get_specific_station_name_from_identifier(
-                                stop_id=connection["to"]
-                            )
-                        )
-                        logging.debug(
-                            f"Trip: {last_trip_departure_station} -> {last_trip_arrival_station} to {connection_arrival_station}"
-                        )
-                        last_trip["to"] = connection["to"]
-                        last_trip["planned_arrival"] = connection["planned_arrival"]
-                        # update the actual times
-                        last_trip["actual_times"] = actual_times
-                        # overwrite the last trip in the extended path
-                        extended_trips[-1] = last_trip
-                    else:
-                        # if no actual times are available, we just add the connection to the extended path
-                        extended_trips.append(connection)
-                else:
-                    # if no actual times are available, we just add the connection to the extended path
-                    extended_trips.append(connection)
-
-                # simplification/efficiency improvement: if the number of trips is more than 4, we skip all possible connections from here (we have already reached the maximum number of trips)
-                # This is a simplification to speed up the process, we assume that no one would transfer more than 3 times
-                # This is a bit different from in the paper - flight networks don't have the same structure as train networks, fewer nodes
-                if len(extended_trips) > 4:
-                    logging.debug(
-                        "More than 4 trips, skipping all possible connections from here"
-                    )
-                    continue
-
-                probability_arrival, probability_connection_made = compute_reliability(
-                    extended_trips,
-                    start_time,
-                    time_budget,
-                    complete_path=False,
-                    transfer_time=transfer_time,
+                <= most_reliable_path[position_of_reliability]
+            ):
+                continue
+            # go through all adjacent edges to "build"/extend our path towards our target/destination further
+            for connection, extended_label, partial_path_reliability in self.extend_path(
+                label,
+                path_highest_reliability[position_of_partial_path_reliability],
+                transfer_time,
+            ):
+                # reliability of the extended path (only the tail trip is computed, the rest is carried by the partial path)
+                probability_arrival = partial_path_reliability.probability_arrival(time_limit)
+                probability_connection_made = (
+                    partial_path_reliability.probability_connections_made
                 )
 
                 # adjust the total time (time between start time and the scheduled arrival of the current tail flight in the itinerary/path)
@@ -388,7 +733,8 @@ class Graph:
                     k,
                     total_time_between_start_scheduled_arrival,
                     probability_arrival,
-                    extended_trips,
+                    extended_label,
+                    partial_path_reliability,
                 )
 
                 # Update k (label for the path)
@@ -402,19 +748,19 @@ class Graph:
                     logging.debug(
                         f"Reliability path: {reliability_path}, probability arrival: {probability_arrival}, probability connection made: {probability_connection_made}"
                     )
-                    logging.debug(f"For path: {extended_trips}")
-                    new_most_reliable_path = (
-                        reliability_path,
-                        k,
-                        total_time_between_start_scheduled_arrival,
-                        probability_arrival,
-                        extended_trips,
-                    )
                     # check if the new path is more reliable than the current most reliable path
                     if (
                         most_reliable_path is None
                         or reliability_path > most_reliable_path[position_of_reliability]
                     ):
+                        # the list of trips is only needed for the most reliable path (created from the label, without the first element (the source station))
+                        new_most_reliable_path = (
+                            reliability_path,
+                            k,
+                            total_time_between_start_scheduled_arrival,
+                            probability_arrival,
+                            extended_label.to_path()[1:],
+                        )
                         logging.debug(
                             f"New most reliable path: {new_most_reliable_path}"
                         )
@@ -422,23 +768,41 @@ class Graph:
 
                         if enable_efficiency_improvements:
                             # 2a. (R6 in paper) efficiency improvement: after adding the most reliable path, we can prune all other paths/itineraries that are less reliable
-                            # prune priority queue
-                            priority_queue = [
-                                path
-                                for path in priority_queue
-                                if path[position_of_reliability] > most_reliable_path[position_of_reliability]
-                            ]
+                            # prune priority queue (lazily, the paths are dropped when they are popped or the queue is compacted)
+                            priority_queue.raise_threshold(most_reliable_path[position_of_reliability])
                 else:
                     # only add the extended path to the priority queue if the reliability of the partial itinerary is greater than the most reliable path found so far
                     if enable_efficiency_improvements:
                         # 2b. (R6 in paper) efficiency improvement: only add the extended path to the priority queue if the reliability of the partial itinerary is
                         # greater than the most reliable path found so far
-                        # the reliability of the partial path is the product of all probabilities of connections made
-                        if most_reliable_path is not None and probability_connection_made > most_reliable_path[position_of_reliability]:
+                        # the reliability of any extension is at most the bound of the probability of making all connections
+                        # (if no path was found so far, all extended paths are added)
+                        if (most_reliable_path is None or (
+                            partial_path_reliability.probability_connections_made_bound
+                            > most_reliable_path[position_of_reliability]
+                            # 3. (A*-like upper bound) efficiency improvement: the same for the optimistic reliability of the extended path
+                            and self.get_optimistic_reliability(
+                                reliability_upper_bound, extended_label, partial_path_reliability, reliability_engine
+                            )
+                            > most_reliable_path[position_of_reliability]
+                        )) and (
+                            # 4. (label dominance) efficiency improvement: the extended path is not dominated by another path on the same trip
+                            pareto_bags is None
+                            or pareto_bags.add(extended_label, partial_path_reliability, extended_path[1])
+                        ):
                             # add the extended path to the priority queue
-                            heappush(priority_queue, extended_path)
+                            priority_queue.push(
+                                partial_path_reliability.probability_connections_made_bound, extended_path[1], extended_path
+                            )
                     else:
-                        heappush(priority_queue, extended_path)
+                        priority_queue.push(
+                            partial_path_reliability.probability_connections_made_bound, extended_path[1], extended_path
+                        )
+        logging.debug(
+            f"Pruned partial paths: {priority_queue.number_stale}, compactions of the priority queue: {priority_queue.number_compactions}"
+        )
+        if pareto_bags is not None:
+            logging.debug(f"Dominated partial paths: {pareto_bags.number_dominated}")
         reliability = most_reliable_path[position_of_reliability] if most_reliable_path is not None else 0
         # check if the reliability is 0 (no reliable path found)
         if reliability == 0:
@@ -446,7 +810,218 @@ class Graph:
             return None, 0, None
         # get the arrival time of the most reliable path
         arrival_time = start_time + most_reliable_path[2]
-        most_reliable_path_transformed = most_reliable_path[position_of_trips]
-        # remove first element (the source station)
-        most_reliable_path_transformed.pop(0)
+        # copy the trips (the initial most reliable path is the list of the caller, e.g., the shortest path)
+        most_reliable_path_transformed = list(most_reliable_path[position_of_trips])
         return arrival_time, reliability, most_reliable_path_transformed
+
+    def find_most_reliable_paths_for_time_budgets(
+        self,
+        source: str,
+        target: str,
+        start_time: int,
+        time_budgets: list[int],
+        transfer_time=TRANSFER_TIME_DEFAULT,
+        reliability_engine="analytic",
+    ) -> dict[int, tuple[int, float, list[dict]]]:
+        """
+        Find the most reliable path for several time budgets with one search (extending the paths like find_most_reliable_path)
+        For every path that reaches the target, the reliability for all time budgets is taken from the arrival time CDF of the path.
+        A partial path is only extended further if its optimistic reliability (see get_optimistic_reliability) is greater than the reliability of the
+        most reliable path found so far for at least one time budget.
+        Returns (arrival time, reliability, path) for each time budget, (None, 0, None) if no reliable path was found for the time budget
+        """
+        logging.info(
+            f"Find most reliable paths from {source} to {target} starting at {start_time} for the time budgets {time_budgets}"
+        )
+        time_budgets = list(time_budgets)
+        time_limits = start_time + np.asarray(time_budgets)
+        # reliability and (arrival time, reliability, path) of the most reliable path per time budget
+        best_reliabilities = np.zeros(len(time_budgets))
+        most_reliable_paths = [(None, 0, None)] * len(time_budgets)
+        # optimistic probability of arriving at the target in time from each station per time budget
+        reliability_upper_bounds = [
+            self.get_reliability_upper_bound(target, time_limit) for time_limit in time_limits
+        ]
+
+        def can_be_more_reliable(label: PathLabel, partial_path_reliability) -> bool:
+            # the optimistic reliability of the path is greater than the reliability of the most reliable path for at least one time budget
+            return any(
+                self.get_optimistic_reliability(
+                    reliability_upper_bound, label, partial_path_reliability, reliability_engine
+                )
+                > best_reliability
+                for reliability_upper_bound, best_reliability in zip(
+                    reliability_upper_bounds, best_reliabilities
+                )
+            )
+
+        # non-dominated partial paths per station and trip (dominated paths can not be more reliable for any time budget)
+        pareto_bags = self.create_pareto_bags(reliability_engine)
+        # Initialize k (used as additional "tiebreaker" for the comparison of the heap queue)
+        k = 0
+        # priority queue with the partial paths (label k, path, reliability information of the path), the path with the highest bound of the probability of
+        # making all connections first (see probability_connections_made_bound, paths at or below the lowest reliability of the most reliable paths found so far are dropped)
+        priority_queue = LazyPriorityQueue()
+        priority_queue.push(
+            1,
+            k,
+            (
+                k,
+                self._create_source_label(source, transfer_time, reliability_engine),
+                create_partial_path_reliability(reliability_engine),
+            ),
+        )
+        while priority_queue:
+            entry = priority_queue.pop()
+            if entry is None:
+                break
+            label_id, label, partial_path_reliability = entry
+            if pareto_bags is not None and pareto_bags.is_dominated(label_id):
+                continue
+            # the path can not be more reliable than the most reliable paths found in the meantime
+            if label.parent is not None and not can_be_more_reliable(
+                label, partial_path_reliability
+            ):
+                continue
+            for connection, extended_label, extended_partial_path_reliability in self.extend_path(
+                label, partial_path_reliability, transfer_time
+            ):
+                # no extension of the path (and not the path itself) can be more reliable than the most reliable paths for all time budgets
+                probability_connections_made_bound = (
+                    extended_partial_path_reliability.probability_connections_made_bound
+                )
+                if probability_connections_made_bound <= best_reliabilities.min():
+                    continue
+                k += 1
+                if connection["to"] == target:
+                    # reliability of the path for all time budgets
+                    reliabilities = get_reliability_from_arrival_cdf(
+                        extended_partial_path_reliability.arrival_cdf(), time_limits
+                    )
+                    is_more_reliable = reliabilities > best_reliabilities
+                    if is_more_reliable.any():
+                        # remove first element (the source station)
+                        path = extended_label.to_path()[1:]
+                        for index in np.flatnonzero(is_more_reliable):
+                            best_reliabilities[index] = reliabilities[index]
+                            most_reliable_paths[index] = (
+                                connection["planned_arrival"],
+                                float(reliabilities[index]),
+                                path,
+                            )
+                        priority_queue.raise_threshold(best_reliabilities.min())
+                elif can_be_more_reliable(extended_label, extended_partial_path_reliability) and (
+                    pareto_bags is None
+                    or pareto_bags.add(extended_label, extended_partial_path_reliability, k)
+                ):
+                    priority_queue.push(
+                        probability_connections_made_bound,
+                        k,
+                        (k, extended_label, extended_partial_path_reliability),
+                    )
+        return dict(zip(time_budgets, most_reliable_paths))
+
+    def find_pareto_paths(
+        self,
+        source: str,
+        target: str,
+        start_time: int,
+        time_budget: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+        reliability_engine="analytic",
+        enable_efficiency_improvements=True,
+    ) -> list[tuple[float, float, int, list[dict]]]:
+        """
+        Find the Pareto front of the paths regarding expected arrival, reliability (for the time budget) and number of transfers with one search,
+        similar to the multi-criteria variant of RAPTOR (McRAPTOR, "Round-Based Public Transit Routing", Delling et al., 2015)
+        The partial paths are extended round by round (round k has k trips, at most MAXIMUM_NUMBER_OF_TRIPS) instead of a search per trade-off.
+        Partial paths that can not arrive in time (optimistic reliability 0) are not extended, so only paths with a reliability greater than 0 are returned.
+        @:param enable_efficiency_improvements: target pruning (analytic reliability only), a partial path is not extended if a path found before dominates
+        all its possible extensions (see get_optimistic_reliability and ArrivalLowerBound), otherwise all partial paths are extended
+        Returns (expected arrival given that all connections are made, reliability, number of transfers, path) of each path of the front, sorted by the expected arrival
+        """
+        logging.info(
+            f"Find Pareto paths from {source} to {target} starting at {start_time} with a time budget of {time_budget} minutes"
+        )
+        time_limit = start_time + time_budget
+        # optimistic probability of arriving at the target in time from each station (partial paths that can not arrive in time are not extended)
+        reliability_upper_bound = self.get_reliability_upper_bound(target, time_limit)
+        # the optimistic reliability is only an upper bound for the analytic reliability (with the scenarios, restricting the days can increase it)
+        is_target_pruning_enabled = enable_efficiency_improvements and reliability_engine == "analytic"
+        if is_target_pruning_enabled:
+            arrival_lower_bound = ArrivalLowerBound(self.get_connection_scan().connections, target)
+        # all paths to the target (expected arrival, reliability, number of transfers, path)
+        paths = []
+
+        def is_dominated_by_path(label: PathLabel, optimistic_reliability: float) -> bool:
+            # the last trip of any extension departs at or after the tail trip, and it has at least as many transfers
+            earliest_expected_arrival = arrival_lower_bound.get(label.trip["planned_departure"])
+            return any(
+                expected_arrival <= earliest_expected_arrival
+                and reliability >= optimistic_reliability
+                and number_of_transfers <= label.length - 2
+                for expected_arrival, reliability, number_of_transfers, _ in paths
+            )
+
+        # partial paths per round (number of trips, including the trip at the source) with their reliability information and optimistic reliability
+        rounds = {
+            1: [
+                (
+                    self._create_source_label(source, transfer_time, reliability_engine),
+                    create_partial_path_reliability(reliability_engine),
+                    1,
+                )
+            ]
+        }
+        for length in range(1, MAXIMUM_NUMBER_OF_TRIPS + 2):
+            round_labels = rounds.pop(length, [])
+            # consolidated paths (same train) stay in the same round, they are added to the list while it is processed
+            index = 0
+            while index < len(round_labels):
+                label, partial_path_reliability, optimistic_reliability = round_labels[index]
+                index += 1
+                # the paths found in the meantime can dominate the partial path
+                if (
+                    is_target_pruning_enabled
+                    and label.parent is not None
+                    and is_dominated_by_path(label, optimistic_reliability)
+                ):
+                    continue
+                for connection, extended_label, extended_partial_path_reliability in self.extend_path(
+                    label, partial_path_reliability, transfer_time
+                ):
+                    if connection["to"] == target:
+                        reliability = (
+                            extended_partial_path_reliability.probability_arrival(time_limit)
+                            * extended_partial_path_reliability.probability_connections_made
+                        )
+                        if reliability > 0:
+                            paths.append(
+                                (
+                                    extended_partial_path_reliability.expected_arrival(),
+                                    reliability,
+                                    # the trip at the source and the first trip are no transfers
+                                    extended_label.length - 2,
+                                    # remove first element (the source station)
+                                    extended_label.to_path()[1:],
+                                )
+                            )
+                        continue
+                    optimistic_reliability = self.get_optimistic_reliability(
+                        reliability_upper_bound, extended_label, extended_partial_path_reliability, reliability_engine
+                    )
+                    if optimistic_reliability == 0 or (
+                        is_target_pruning_enabled and is_dominated_by_path(extended_label, optimistic_reliability)
+                    ):
+                        continue
+                    if extended_label.length == length:
+                        round_labels.append(
+                            (extended_label, extended_partial_path_reliability, optimistic_reliability)
+                        )
+                    else:
+                        rounds.setdefault(extended_label.length, []).append(
+                            (extended_label, extended_partial_path_reliability, optimistic_reliability)
+                        )
+        pareto_front = get_pareto_front(paths)
+        logging.debug(f"Pareto front with {len(pareto_front)} of {len(paths)} paths to the target")
+        return pareto_front
@@ -2,9 +2,22 @@
 import logging
 
 import duckdb
+import numpy as np
 
+from algorithm.actual_times import ActualTimes, as_actual_times
 from constants import LOG_LEVEL
-from retrieve_data.Network_wcancelled import get_data, process_route_data
+from retrieve_data.Network_wcancelled import (
+    get_data,
+    process_route_data,
+    slice_network,
+)
+from retrieve_data.network_snapshot import (
+    NETWORK_SNAPSHOT_DIRECTORY,
+    get_data_version,
+    get_snapshot_key,
+    load_network_snapshot,
+    save_network_snapshot,
+)
 
 logging.basicConfig(level=LOG_LEVEL)
 
@@ -25,10 +38,20 @@ def is_transfer_needed(
 
 
 def get_graph_data(
-    desired_date, data_path, start_time, end_time, start_station, use_example_data=False
+    desired_date,
+    data_path,
+    start_time,
+    end_time,
+    start_station,
+    use_example_data=False,
+    use_snapshot=True,
+    snapshot_directory=NETWORK_SNAPSHOT_DIRECTORY,
+    use_day_network=False,
 ):
     """
     Get the graph data
+    If use_snapshot is set, a previously built network for the same inputs is loaded from disk (and stored after building it otherwise)
+    If use_day_network is set, the network of the whole day (all stations) is built once and sliced to the time window and start station
     """
     # Data structure (tuples sorted by departure time for faster access)
     # We have a dictionary with the nodes as keys and the values are an array with tuples (departure_time, neighbor, arrival_time, trip identifier)
@@ -165,14 +188,105 @@ def get_graph_data(
         }
         return graph
 
+    # one network per day, shared by all queries of this day
+    if use_day_network:
+        day_network = get_day_network(
+            desired_date,
+            data_path,
+            use_snapshot=use_snapshot,
+            snapshot_directory=snapshot_directory,
+        )
+        return slice_network(day_network, start_time, end_time, start_station)
+
+    # check if the network was already built for the same inputs (and the same version of the delay data)
+    if use_snapshot:
+        data_version = get_data_version(data_path)
+        snapshot_key = get_snapshot_key(
+            desired_date, start_time, end_time, start_station, data_version
+        )
+        graph = load_network_snapshot(snapshot_key, snapshot_directory)
+        if graph is not None:
+            return graph
+
     # if the transport_data.db is in a different location, you can specify the path here
     # Also, here you can specify the date of interest
     # train_data = get_data(desired_date, database_path=data_path)
-    train_data = get_data(database_path=data_path)
+    # only the services in the time window are retrieved from the database
+    train_data = get_data(
+        database_path=data_path, start_time=start_time, end_time=end_time
+    )
     logging.info(f"Data loaded for {desired_date}")
 
     # get graph structure from train data
-    return process_route_data(train_data, start_time, end_time, start_station)
+    graph = process_route_data(train_data, start_time, end_time, start_station)
+    if use_snapshot:
+        save_network_snapshot(
+            graph,
+            snapshot_key,
+            data_version,
+            snapshot_directory=snapshot_directory,
+            database_path=data_path,
+        )
+    return graph
+
+
+def get_network_key(
+    desired_date,
+    data_path,
+    start_time=None,
+    end_time=None,
+    start_station=None,
+    use_example_data=False,
+    use_day_network=False,
+) -> tuple:
+    """
+    Get the key of the network built by get_graph_data for the inputs, networks with the same key have the same trips (and actual times)
+    All networks sliced from the network of a day have the key of the day network (e.g., to share the reliability cache between their queries)
+    """
+    if use_example_data:
+        return ("example",)
+    data_version = get_data_version(data_path)
+    if use_day_network:
+        return str(desired_date), str(data_path), data_version
+    return str(desired_date), str(data_path), data_version, start_time, end_time, str(start_station)
+
+
+# networks of whole days (all stations) that were already built, per date and database
+day_networks = {}
+
+
+def get_day_network(
+    desired_date,
+    data_path,
+    use_snapshot=True,
+    snapshot_directory=NETWORK_SNAPSHOT_DIRECTORY,
+):
+    """
+    Get the network of the whole day (all stations, all connections of the day), it is only built once per date
+    """
+    day_network_key = get_network_key(desired_date, data_path, use_day_network=True)
+    data_version = day_network_key[2]
+    if day_network_key in day_networks:
+        return day_networks[day_network_key]
+
+    graph = None
+    if use_snapshot:
+        snapshot_key = get_snapshot_key(desired_date, None, None, None, data_version)
+        graph = load_network_snapshot(snapshot_key, snapshot_directory)
+    if graph is None:
+        train_data = get_data(desired_date, database_path=data_path)
+        logging.info(f"Data loaded for {desired_date} (whole day)")
+        graph = process_route_data(train_data, None, None, None)
+        if use_snapshot:
+            save_network_snapshot(
+                graph,
+                snapshot_key,
+                data_version,
+                snapshot_directory=snapshot_directory,
+                database_path=data_path,
+            )
+    day_networks[day_network_key] = graph
+    return graph
 
 
 def print_path(path, start_node, start_time=0, convert_ids_to_names=False):
@@ -264,6 +378,24 @@ def merge_actual_times(actual_times_first_trip, actual_times_second_trip):
     Note: This is a simplification, we could use a more advanced (or should in a realistic condition) to properly match the actual times
     Because it could potentially be that we have a different number of actual time observations/historical departure and arrival times
     """
+    # actual times as arrays: departures from the last trip and arrivals from the current connection of the same operating day
+    # (without information about the operating days, the position is used as operating day, like in the simplification below)
+    if isinstance(actual_times_first_trip, ActualTimes) or isinstance(
+        actual_times_second_trip, ActualTimes
+    ):
+        actual_times_first_trip = as_actual_times(actual_times_first_trip)
+        actual_times_second_trip = as_actual_times(actual_times_second_trip)
+        operating_days, indices_first_trip, indices_second_trip = np.intersect1d(
+            actual_times_first_trip.operating_days,
+            actual_times_second_trip.operating_days,
+            assume_unique=True,
+            return_indices=True,
+        )
+        return ActualTimes(
+            actual_times_first_trip.departures[indices_first_trip],
+            actual_times_second_trip.arrivals[indices_second_trip],
+            operating_days,
+        )
 
     # get actual times from last trip and current connection, using the departure times from the last trip and the arrival times from the current connection
     actual_times = []
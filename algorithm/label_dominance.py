@@ -0,0 +1,151 @@
+# This file contains the Pareto bags of partial paths (labels) per station and trip, used for pruning dominated paths in the search for the most reliable path.
+# A partial path dominates another one on the same trip at the same station if it is at least as likely to be at the station at any time
+# (the arrival time CDF multiplied by the probability of making the connections is greater or equal at all times), then no extension
+# of the dominated path can be more reliable than the same extension of the dominating path.
+# Reference: multi-criteria labels in public transit routing, e.g., "Round-Based Public Transit Routing" (Delling et al., 2015)
+import logging
+
+import numpy as np
+
+from algorithm.helper import is_transfer_needed
+from constants import LOG_LEVEL
+
+# set log level
+logging.basicConfig(level=LOG_LEVEL)
+
+# tolerance for comparing probabilities (rounding errors)
+DOMINANCE_TOLERANCE = 1e-12
+
+
+def is_arrival_cdf_dominated(
+    arrival_cdf: tuple[np.ndarray, np.ndarray], other_arrival_cdf: tuple[np.ndarray, np.ndarray]
+) -> bool:
+    """
+    Check if an arrival time CDF (times and probabilities of arriving at or before them) is at most the other CDF at all times
+    Both are step functions, so it is enough to compare them at the times where the first one increases
+    """
+    times, probabilities = arrival_cdf
+    if len(times) == 0:
+        return True
+    other_times, other_probabilities = other_arrival_cdf
+    if len(other_times) == 0:
+        return bool(np.all(probabilities <= DOMINANCE_TOLERANCE))
+    # value of the other CDF at the times (0 before its first time)
+    index = np.searchsorted(other_times, times, side="right")
+    other_probabilities_at_times = np.where(
+        index > 0, other_probabilities[np.maximum(index - 1, 0)], 0
+    )
+    return bool(np.all(probabilities <= other_probabilities_at_times + DOMINANCE_TOLERANCE))
+
+
+class ParetoBags:
+    """
+    Non-dominated partial paths per station and trip (for the analytic reliability, see PartialPathReliability)
+    Paths are only compared if they boarded the trip at the same station (same tail trip, the trip can still be consolidated with the next
+    connection of the same train), so a path dominates another one if it has at most as many trips and its arrival time CDFs before and after
+    the tail trip (multiplied by the probabilities of making the connections) are at least as high at all times.
+    Paths that are dominated later (by a new path) are only marked, they are skipped when they are taken from the priority queue.
+    """
+
+    def __init__(self):
+        # (station, trip identifier, boarding station, planned departure, transfer needed to the trip) -> [(label identifier, length, arrival CDFs)]
+        self.bags = {}
+        # identifiers of the labels that were dominated after they were added
+        self.dominated_labels = set()
+        # number of rejected and removed labels
+        self.number_dominated = 0
+
+    @staticmethod
+    def _get_key(label) -> tuple:
+        trip = label.trip
+        trip_before = label.parent.trip
+        return (
+            trip["to"],
+            trip["trip_id"],
+            trip["from"],
+            trip["planned_departure"],
+            bool(is_transfer_needed(trip_before.get("trip_id", ""), trip["trip_id"])),
+        )
+
+    @staticmethod
+    def _get_arrival_cdfs(partial_path_reliability) -> tuple:
+        """
+        Arrival time CDFs (multiplied by the probability of making the connections) of the trip before the tail trip and the tail trip
+        """
+        arrival_distribution_previous_trip = (
+            partial_path_reliability.arrival_distribution_previous_trip
+        )
+        if arrival_distribution_previous_trip is None:
+            # first trip of the path
+            arrival_cdf_previous_trip = None
+        else:
+            times, _, cumulative_probabilities = arrival_distribution_previous_trip
+            arrival_cdf_previous_trip = (
+                times,
+                cumulative_probabilities
+                * partial_path_reliability.probability_connections_made_before_tail,
+            )
+        return arrival_cdf_previous_trip, partial_path_reliability.arrival_cdf()
+
+    @staticmethod
+    def _is_dominated(length: int, arrival_cdfs: tuple, other_length: int, other_arrival_cdfs: tuple) -> bool:
+        if other_length > length:
+            return False
+        arrival_cdf_previous_trip, arrival_cdf = arrival_cdfs
+        other_arrival_cdf_previous_trip, other_arrival_cdf = other_arrival_cdfs
+        if (arrival_cdf_previous_trip is None) != (other_arrival_cdf_previous_trip is None):
+            return False
+        if arrival_cdf_previous_trip is not None and not is_arrival_cdf_dominated(
+            arrival_cdf_previous_trip, other_arrival_cdf_previous_trip
+        ):
+            return False
+        return is_arrival_cdf_dominated(arrival_cdf, other_arrival_cdf)
+
+    def add(self, label, partial_path_reliability, label_id) -> bool:
+        """
+        Add a partial path (label with its reliability information) to the bag of its station and trip
+        Returns False if the path is dominated by a path of the bag (it is not added), paths of the bag dominated by the new path are removed
+        """
+        key = self._get_key(label)
+        arrival_cdfs = self._get_arrival_cdfs(partial_path_reliability)
+        bag = self.bags.setdefault(key, [])
+        for _, other_length, other_arrival_cdfs in bag:
+            if self._is_dominated(label.length, arrival_cdfs, other_length, other_arrival_cdfs):
+                self.number_dominated += 1
+                return False
+        remaining_bag = []
+        for entry in bag:
+            other_label_id, other_length, other_arrival_cdfs = entry
+            if self._is_dominated(other_length, other_arrival_cdfs, label.length, arrival_cdfs):
+                self.dominated_labels.add(other_label_id)
+                self.number_dominated += 1
+            else:
+                remaining_bag.append(entry)
+        remaining_bag.append((label_id, label.length, arrival_cdfs))
+        self.bags[key] = remaining_bag
+        return True
+
+    def is_dominated(self, label_id) -> bool:
+        """
+        Check if a path was dominated after it was added
+        """
+        return label_id in self.dominated_labels
+
+
+def get_pareto_front(journeys: list[tuple]) -> list[tuple]:
+    """
+    Get the non-dominated journeys (expected arrival, reliability, number of transfers, path), sorted by the expected arrival
+    A journey dominates another one if it arrives not later (expected arrival), is at least as reliable and has at most as many transfers,
+    of journeys with equal criteria, the first one is kept
+    """
+    pareto_front = []
+    for journey in sorted(journeys, key=lambda journey: (journey[0], -journey[1], journey[2])):
+        expected_arrival, reliability, number_of_transfers, _ = journey
+        if not any(
+            other_expected_arrival <= expected_arrival + DOMINANCE_TOLERANCE
+            and other_reliability >= reliability - DOMINANCE_TOLERANCE
+            and other_number_of_transfers <= number_of_transfers
+            for other_expected_arrival, other_reliability, other_number_of_transfers, _ in pareto_front
+        ):
+            pareto_front.append(journey)
+    return pareto_front
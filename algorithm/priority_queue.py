@@ -0,0 +1,99 @@
+# This file contains a priority queue with lazy deletion for the search for the most reliable path.
+# When a more reliable path is found, all partial paths with a lower priority (bound of the probability of making the connections of their extensions)
+# can be pruned.
+# Instead of rebuilding the queue each time (linear time), the queue only stores the threshold and drops stale paths when they are popped.
+# If the queue contains too many stale paths, it is compacted (rebuilt without the stale paths), so pruning is amortized O(log n) per path.
+import logging
+from heapq import heapify, heappop, heappush
+
+from constants import LOG_LEVEL
+
+# set log level
+logging.basicConfig(level=LOG_LEVEL)
+
+# compact the queue if (estimated) more than this fraction of the paths are stale, and the queue has at least the minimum size
+COMPACTION_STALE_FRACTION = 0.5
+COMPACTION_MINIMUM_SIZE = 1024
+# number of entries of the queue used to estimate the fraction of stale paths
+COMPACTION_SAMPLE_SIZE = 32
+
+
+class LazyPriorityQueue:
+    """
+    Max-priority queue (the entry with the highest priority is popped first) with threshold-based lazy deletion:
+    entries with a priority at or below the threshold are stale, they are dropped when they are popped or when the queue is compacted
+    Entries with the same priority are popped in the order of their tiebreaker (lowest first)
+    """
+
+    def __init__(
+        self,
+        compaction_stale_fraction=COMPACTION_STALE_FRACTION,
+        compaction_minimum_size=COMPACTION_MINIMUM_SIZE,
+    ):
+        # heap of (negative priority, tiebreaker, entry)
+        self.heap = []
+        self.threshold = float("-inf")
+        self.compaction_stale_fraction = compaction_stale_fraction
+        self.compaction_minimum_size = compaction_minimum_size
+        # number of dropped stale entries and compactions (for logging)
+        self.number_stale = 0
+        self.number_compactions = 0
+
+    def push(self, priority: float, tiebreaker, entry):
+        """
+        Add an entry to the queue (entries at or below the threshold are not added)
+        """
+        if priority <= self.threshold:
+            self.number_stale += 1
+            return
+        heappush(self.heap, (-priority, tiebreaker, entry))
+
+    def pop(self):
+        """
+        Remove and return the entry with the highest priority above the threshold, None if there is no such entry
+        """
+        while self.heap:
+            negative_priority, _, entry = heappop(self.heap)
+            if -negative_priority > self.threshold:
+                return entry
+            # all remaining entries have a lower (or the same) priority, so they are stale as well
+            self.number_stale += len(self.heap) + 1
+            self.heap.clear()
+        return None
+
+    def raise_threshold(self, threshold: float):
+        """
+        Mark all entries with a priority at or below the threshold as stale (e.g., the reliability of a new most reliable path)
+        """
+        if threshold <= self.threshold:
+            return
+        self.threshold = threshold
+        if (
+            len(self.heap) >= self.compaction_minimum_size
+            and self._estimate_stale_fraction() > self.compaction_stale_fraction
+        ):
+            self.compact()
+
+    def _estimate_stale_fraction(self) -> float:
+        # check evenly spaced entries of the heap (the stale entries are mostly at the end, which is also sampled)
+        step = max(len(self.heap) // COMPACTION_SAMPLE_SIZE, 1)
+        sample = self.heap[::step]
+        return sum(-negative_priority <= self.threshold for negative_priority, _, _ in sample) / len(sample)
+
+    def compact(self):
+        """
+        Remove all stale entries from the queue (and restore the heap property)
+        """
+        size = len(self.heap)
+        self.heap = [item for item in self.heap if -item[0] > self.threshold]
+        heapify(self.heap)
+        self.number_stale += size - len(self.heap)
+        self.number_compactions += 1
+        logging.debug(f"Compacted priority queue from {size} to {len(self.heap)} entries")
+
+    def __len__(self) -> int:
+        # number of entries including the stale entries that were not dropped yet
+        return len(self.heap)
+
+    def __bool__(self) -> bool:
+        return bool(self.heap)
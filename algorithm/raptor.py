@@ -0,0 +1,257 @@
+# This file contains the Round-Based Public Transit Routing algorithm (RAPTOR) for earliest arrival queries with a bounded number of trips.
+# The trips of the network are grouped into routes (trips with the same sequence of stations that do not overtake each other).
+# Round k scans the routes of the stations reached in round k - 1 and gives the earliest arrival with at most k trips (k - 1 transfers),
+# so one query gives the Pareto set of (number of trips, arrival time) journeys. The journeys are candidates for the reliability evaluation.
+# Reference: "Round-Based Public Transit Routing" (Delling et al., 2015)
+import logging
+from bisect import bisect_left
+
+from algorithm.connection_scan import sort_connections
+from algorithm.helper import consolidate_path
+from algorithm.reliability import TRANSFER_TIME_DEFAULT
+from constants import LOG_LEVEL
+
+# set log level
+logging.basicConfig(level=LOG_LEVEL)
+
+# maximum number of trips of a path (the same limit as in the search for the most reliable path, at most 2 transfers)
+MAXIMUM_NUMBER_OF_TRIPS = 3
+
+
+class Route:
+    """
+    Trips with the same sequence of stations, sorted by departure time (no trip overtakes another one, so the first trip departing
+    at or after a time at a station is also the first one arriving at all following stations)
+    """
+
+    __slots__ = ("stations", "trips", "departure_times")
+
+    def __init__(self, stations: tuple):
+        self.stations = stations
+        # connections of each trip (one connection per pair of consecutive stations)
+        self.trips = []
+        # departure times per station position (one per trip, for the binary search of the first trip)
+        self.departure_times = [[] for _ in stations[:-1]]
+
+    def can_add(self, connections: list[dict]) -> bool:
+        """
+        Check if a trip can be added without overtaking the last trip of the route (the trips are added sorted by departure time)
+        """
+        if not self.trips:
+            return True
+        return all(
+            connection["planned_departure"] >= last_connection["planned_departure"]
+            and connection["planned_arrival"] >= last_connection["planned_arrival"]
+            for connection, last_connection in zip(connections, self.trips[-1])
+        )
+
+    def add(self, connections: list[dict]):
+        self.trips.append(connections)
+        for position, connection in enumerate(connections):
+            self.departure_times[position].append(connection["planned_departure"])
+
+    def get_earliest_trip(self, position: int, earliest_departure) -> int | None:
+        """
+        Get the index of the first trip departing from the station at the position at or after the earliest departure (None if there is none)
+        """
+        index = bisect_left(self.departure_times[position], earliest_departure)
+        return index if index < len(self.trips) else None
+
+
+def create_routes(graph: dict) -> tuple[list[Route], dict]:
+    """
+    Group the trips of the network (graph dictionary) into routes
+    A trip is a sequence of connections with the same trip identifier, where each connection departs at the arrival station of the previous one.
+    Like in the connection scan, only stations that are nodes of the graph are considered.
+    Returns the routes and the routes per station (station -> [(route index, position of the station)])
+    """
+    connections_per_trip = {}
+    for node in graph:
+        for connection in graph[node]:
+            if connection["to"] in graph:
+                connections_per_trip.setdefault(connection["trip_id"], []).append(connection)
+    trips = []
+    for connections in connections_per_trip.values():
+        # zero-duration connections of a trip departing at the same time are ordered along the stations of the trip
+        connections = sort_connections(connections)
+        # split the trip if the connections are not consecutive
+        trip = [connections[0]]
+        for connection in connections[1:]:
+            if (
+                connection["from"] == trip[-1]["to"]
+                and connection["planned_departure"] >= trip[-1]["planned_arrival"]
+            ):
+                trip.append(connection)
+            else:
+                trips.append(trip)
+                trip = [connection]
+        trips.append(trip)
+    # trips sorted by their first departure, each one is added to the first route of its stations it does not overtake
+    trips.sort(key=lambda trip: (trip[0]["planned_departure"], trip[-1]["planned_arrival"]))
+    routes = []
+    routes_per_stations = {}
+    for trip in trips:
+        stations = (trip[0]["from"],) + tuple(connection["to"] for connection in trip)
+        candidate_routes = routes_per_stations.setdefault(stations, [])
+        route = next((route for route in candidate_routes if route.can_add(trip)), None)
+        if route is None:
+            route = Route(stations)
+            candidate_routes.append(route)
+            routes.append(route)
+        route.add(trip)
+    routes_per_station = {}
+    for route_index, route in enumerate(routes):
+        for position, station in enumerate(route.stations[:-1]):
+            routes_per_station.setdefault(station, []).append((route_index, position))
+    logging.debug(f"Created {len(routes)} routes for {len(trips)} trips")
+    return routes, routes_per_station
+
+
+class Raptor:
+    """
+    Routes of a network (graph dictionary) for RAPTOR queries
+    """
+
+    def __init__(self, graph: dict):
+        self.graph = graph
+        self.routes, self.routes_per_station = create_routes(graph)
+
+    def earliest_arrivals(
+        self,
+        source,
+        target,
+        start_time: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+        maximum_number_of_trips=MAXIMUM_NUMBER_OF_TRIPS,
+    ) -> list[tuple[int, int, list[dict]]]:
+        """
+        Compute the earliest arrival at the target with at most 1, 2, ..., maximum_number_of_trips trips (one round per trip)
+        The transfer rules are the same as in the connection scan: no transfer time at the source and when staying in the same train,
+        otherwise transfer_time minutes between arrival and departure.
+        Returns the Pareto set of (number of trips, arrival time, path) sorted by the number of trips (each journey arrives earlier than the ones with fewer trips),
+        the paths are consolidated like in Graph.dijkstra
+        @param maximum_number_of_trips: the number of rounds, None for no limit (until no station is improved)
+        """
+        logging.info(
+            f"Find earliest arrivals (RAPTOR) from {source} to {target} starting at {start_time} with at most {maximum_number_of_trips} trips"
+        )
+        if source == target:
+            return [(0, start_time, [])]
+        infinity = float("inf")
+        # earliest arrival per station over all rounds
+        earliest_arrival_times = {source: start_time}
+        # labels per round: station -> (arrival time, route index, trip index, boarding position, alighting position), None at the source
+        labels = [{source: None}]
+        marked_stations = {source}
+        pareto_set = []
+        number_of_trips = 0
+        while marked_stations and (
+            maximum_number_of_trips is None or number_of_trips < maximum_number_of_trips
+        ):
+            number_of_trips += 1
+            # arrival times of the previous rounds (a trip can only be boarded at a station reached with fewer trips)
+            previous_arrival_times = dict(earliest_arrival_times)
+            # first marked position per route (the route is scanned from there)
+            route_positions = {}
+            for station in marked_stations:
+                for route_index, position in self.routes_per_station.get(station, []):
+                    if position < route_positions.get(route_index, infinity):
+                        route_positions[route_index] = position
+            round_labels = {}
+            for route_index, first_position in route_positions.items():
+                route = self.routes[route_index]
+                trip_index = None
+                boarding_position = None
+                for position in range(first_position, len(route.stations)):
+                    station = route.stations[position]
+                    # get off the current trip at the station
+                    if trip_index is not None:
+                        arrival_time = route.trips[trip_index][position - 1]["planned_arrival"]
+                        if arrival_time < min(
+                            earliest_arrival_times.get(station, infinity),
+                            earliest_arrival_times.get(target, infinity),
+                        ):
+                            earliest_arrival_times[station] = arrival_time
+                            round_labels[station] = (
+                                arrival_time,
+                                route_index,
+                                trip_index,
+                                boarding_position,
+                                position,
+                            )
+                    if position == len(route.stations) - 1 or station not in previous_arrival_times:
+                        continue
+                    # board an earlier trip at the station (no transfer time at the source)
+                    earliest_departure = previous_arrival_times[station] + (
+                        0 if station == source else transfer_time
+                    )
+                    if trip_index is None or earliest_departure <= route.departure_times[position][trip_index]:
+                        earliest_trip_index = route.get_earliest_trip(position, earliest_departure)
+                        if earliest_trip_index is not None and (
+                            trip_index is None or earliest_trip_index < trip_index
+                        ):
+                            trip_index = earliest_trip_index
+                            boarding_position = position
+            labels.append(round_labels)
+            marked_stations = set(round_labels)
+            if target in round_labels:
+                pareto_set.append(
+                    (number_of_trips, round_labels[target][0], self._get_path(labels, target))
+                )
+        if not pareto_set:
+            logging.info("No shortest path could be found.")
+        return pareto_set
+
+    def earliest_arrival(
+        self,
+        source,
+        target,
+        start_time: int,
+        transfer_time=TRANSFER_TIME_DEFAULT,
+        maximum_number_of_trips=MAXIMUM_NUMBER_OF_TRIPS,
+    ) -> tuple[int, list[dict]]:
+        """
+        Compute the shortest path (in terms of earliest arrival time) with at most maximum_number_of_trips trips, same result structure as Graph.dijkstra
+        """
+        pareto_set = self.earliest_arrivals(
+            source, target, start_time, transfer_time, maximum_number_of_trips
+        )
+        if not pareto_set:
+            return 0, []
+        _, arrival_time, path = pareto_set[-1]
+        return arrival_time, path
+
+    def _get_path(self, labels: list[dict], target) -> list[dict]:
+        """
+        Reconstruct the path to the target from the labels of the last round (the boarding station of each trip was reached in an earlier round)
+        """
+        path = []
+        station = target
+        round_index = len(labels) - 1
+        while True:
+            # latest round that reached the station (it has the earliest arrival of all rounds up to this one)
+            while station not in labels[round_index]:
+                round_index -= 1
+            label = labels[round_index][station]
+            if label is None:
+                break
+            _, route_index, trip_index, boarding_position, alighting_position = label
+            trip = self.routes[route_index].trips[trip_index]
+            for connection in reversed(trip[boarding_position:alighting_position]):
+                path.append(
+                    {
+                        "from": connection["from"],
+                        "to": connection["to"],
+                        "planned_departure": connection["planned_departure"],
+                        "planned_arrival": connection["planned_arrival"],
+                        "trip_id": connection["trip_id"],
+                        "actual_times": connection["actual_times"],
+                    }
+                )
+            station = self.routes[route_index].stations[boarding_position]
+            round_index -= 1
+        # reverse the path to get the correct order (from source to target)
+        path.reverse()
+
+        # go through path and consolidate trips where the same train is used (remove intermediate stations)
+        return consolidate_path(path)
@@ -1,15 +1,32 @@
-from copy import deepcopy
+from collections import OrderedDict
 from typing import List
 import logging
 
+import numpy as np
+
+from algorithm.actual_times import as_actual_times
 from algorithm.helper import is_transfer_needed
 from constants import LOG_LEVEL
 
 TRANSFER_TIME_DEFAULT = 5
+# engines for computing the reliability: "analytic" (distributions of the trips, assuming independent delays),
+# "scenario" (replay of the historical days, delays of the same day are kept together) or "monte_carlo" (sampled delays of the trips)
+RELIABILITY_ENGINES = ("analytic", "scenario", "monte_carlo")
+# Monte Carlo estimation: maximum number of samples, samples per batch (the estimation stops early if the confidence interval is narrow enough),
+# width of the confidence interval to stop at, z-value of the confidence level (1.96 -> 95%), and samples per partial path in the search
+MONTE_CARLO_MAX_SAMPLES = 20000
+MONTE_CARLO_BATCH_SIZE = 1000
+MONTE_CARLO_TOLERANCE = 0.01
+MONTE_CARLO_CONFIDENCE_Z = 1.96
+MONTE_CARLO_SAMPLES_SEARCH = 2000
+# maximum number of partial paths in the reliability cache (least recently used paths are removed first),
+# only the engines with deterministic results are cached (the Monte Carlo samples are drawn again for every path)
+RELIABILITY_CACHE_SIZE = 100000
+# maximum number of networks with a reliability cache (see get_reliability_cache)
+RELIABILITY_CACHE_NETWORKS = 8
+CACHED_RELIABILITY_ENGINES = ("analytic", "scenario")
 # set log level
 logging.basicConfig(level=LOG_LEVEL)
-# Improvement idea regarding efficiency: using lru_cache to store the results of the function (would need to use tuples instead of lists)
-# This library could be a good idea: https://github.com/lonelyenvoy/python-memoization (allows unhashable types like lists)
 
 
 def compute_probability(time: int, time_distribution: List[int]) -> float:
@@ -17,7 +34,7 @@ def compute_probability(time: int, time_distribution: List[int]) -> float:
     Compute the probability of a train departing or arriving at a given time given a list of departure times or arrival times
     """
     # count the number of trains departing/arriving at the given time
-    count = time_distribution.count(time)
+    count = np.count_nonzero(np.asarray(time_distribution) == time)
     # count the total number of trains
     total = len(time_distribution)
     # compute the probability
@@ -32,19 +49,25 @@ def add_departure_probabilities(station_trips: List[dict]):
     We assume the trains do not wait for other delayed trains
     """
     for trip in station_trips:
-        # get the actual departure times
-        actual_departure_times = [
-            actual_time[0] for actual_time in trip["actual_times"]
-        ]
-        # for each actual departure time, compute the probability of departing at that time
-        departure_probabilities = [
-            (time, compute_probability(time, actual_departure_times))
-            for time in actual_departure_times
-        ]
-        # only use unique departure probabilities
-        departure_probabilities = list(set(departure_probabilities))
+        # for each (unique) actual departure time, the probability of departing at that time (precomputed with the actual times)
+        departure_times, probabilities = as_actual_times(
+            trip["actual_times"]
+        ).departure_distribution
         # add the departure probabilities to the trip
-        trip["departure_probabilities"] = departure_probabilities
+        trip["departure_probabilities"] = list(
+            zip(departure_times.tolist(), probabilities.tolist())
+        )
+
+
+def get_probabilities_of_times(times) -> List[tuple[int, float]]:
+    """
+    Get the probability of each unique time in a list (or array) of departure or arrival times
+    """
+    unique_times, counts = np.unique(np.asarray(times), return_counts=True)
+    if len(unique_times) == 0:
+        return []
+    probabilities = counts / len(times)
+    return list(zip(unique_times.tolist(), probabilities.tolist()))
 
 
 def get_all_arrival_probabilities_trip(
@@ -54,52 +77,76 @@ def get_all_arrival_probabilities_trip(
     Get all arrival probabilities for a given trip
     """
     # get the actual arrival times
-    # for each actual arrival time, compute the probability of arriving at that time
-    arrival_probabilities = [
-        (time, compute_probability(time, arrival_times)) for time in arrival_times
-    ]
-    # only use unique arrival probabilities
-    arrival_probabilities = list(set(arrival_probabilities))
+    # for each (unique) actual arrival time, compute the probability of arriving at that time
+    arrival_probabilities = get_probabilities_of_times(arrival_times)
     # logging.debug(f"Arrival probabilities first trip: {arrival_probabilities}, Arrival times first trip: {arrival_times}")
     return arrival_probabilities
 
 
-def get_arrival_times_from_trip(trip: dict) -> List[int]:
+def get_arrival_times_from_trip(trip: dict) -> np.ndarray:
     """
     Get the arrival times distribution for a given trip
     """
-    # get the actual arrival times
-    actual_arrival_times = [actual_time[1] for actual_time in trip["actual_times"]]
-    return actual_arrival_times
+    # get the actual arrival times (the actual times can be a list of tuples or ActualTimes)
+    return as_actual_times(trip["actual_times"]).arrivals
+
+
+def get_departure_times_from_trip(trip: dict) -> np.ndarray:
+    """
+    Get the departure times distribution for a given trip
+    """
+    return as_actual_times(trip["actual_times"]).departures
+
+
+def _distribution_arrays(
+    probabilities_of_times: List[tuple[int, float]],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get the times and probabilities of a list of (time, probability) tuples as arrays (sorted by time)
+    """
+    if len(probabilities_of_times) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    probabilities_of_times = np.asarray(probabilities_of_times, dtype=float).reshape(-1, 2)
+    order = np.argsort(probabilities_of_times[:, 0], kind="stable")
+    return probabilities_of_times[order, 0], probabilities_of_times[order, 1]
+
+
+def get_joint_histogram(actual_times) -> np.ndarray:
+    """
+    Get the joint histogram of the actual (departure, arrival) times of a connection as matrix: number of observations per pair of
+    unique departure time (rows) and unique arrival time (columns), from the precomputed sparse joint histogram (see ActualTimes.distributions)
+    """
+    distributions = as_actual_times(actual_times).distributions
+    joint_histogram = np.zeros(
+        (len(distributions["departure_times"]), len(distributions["arrival_times"])),
+        dtype=np.int64,
+    )
+    joint_histogram[
+        distributions["joint_departure_indices"], distributions["joint_arrival_indices"]
+    ] = distributions["joint_counts"]
+    return joint_histogram
 
 
 def compute_probability_to_arrive_at_or_before(
-    time_limit: int,
+    time_limit: int | np.ndarray,
     arrival_probabilities: List[tuple[int, float]],
     arrival_times: List[int],
-) -> float:
+) -> float | np.ndarray:
     """
     Compute the probability of arriving at or before a given time given a list of arrival probabilities that were calculated beforehand
+    The time limit can also be an array of time limits (one probability per time limit)
     """
-    # get first (minimum) arrival time
-    min_arrival_time = min(
-        arrival_times
-    )  # @todo: note: should be the first if we get a sorted list -> would be more efficient
     # get last (maximum) arrival time -> either the latest arrival time or the time limit if that is earlier
-    max_arrival_time = min(
-        max(arrival_times), time_limit
-    )  # @todo: note: should be the last if we get a sorted list -> would be more efficient
+    max_arrival_time = np.minimum(int(np.max(arrival_times)), time_limit)
 
     # if we have arrival probabilities given, we can use them directly (e.g., probability to arrive at time t' given that we made the connection)
-    probabilities = [
-        arrival_time[1]
-        for arrival_time in arrival_probabilities
-        if arrival_time[0] <= max_arrival_time
+    # sum the probabilities of the arrival times up to the maximum arrival time (cumulative probabilities)
+    times, probabilities = _distribution_arrays(arrival_probabilities)
+    cumulative_probabilities = np.concatenate(([0.0], np.cumsum(probabilities)))
+    probability = cumulative_probabilities[
+        np.searchsorted(times, max_arrival_time, side="right")
     ]
-    # logging.debug(f"Arrival probabilities: {probabilities}, arrival times: {arrival_times}, compute_probability_to_arrive_at_or_before")
-    # sum the probabilities
-    probability = sum(probabilities)
-    return probability
+    return float(probability) if np.ndim(probability) == 0 else probability
 
 
 def compute_connection_probability(
@@ -112,25 +159,21 @@ def compute_connection_probability(
     """
     Compute the probability of making a connection given a list of departure times and a list of arrival time probabilities
     """
-    # for each departure time, compute the probability of making a connection
-    probabilities = []
-    # multiply probability of departing at time t with the probability of arriving at or before time (t - transfer time)
-    for i in range(len(departure_probabilities)):
-        # only consider the arrival time probabilities that are before the departure time - transfer time
-        # check if we need a transfer (or if we are in the same train)
-        time_limit = (
-            departure_probabilities[i][0] - transfer_time
-            if transfer_needed
-            else departure_probabilities[i][0]
+    if len(departure_probabilities) == 0:
+        return 0
+    departure_times, probabilities = _distribution_arrays(departure_probabilities)
+    # only consider the arrival time probabilities that are before the departure time - transfer time
+    # check if we need a transfer (or if we are in the same train)
+    time_limits = departure_times - transfer_time if transfer_needed else departure_times
+    # multiply probability of departing at time t with the probability of arriving at or before time (t - transfer time), and sum
+    return float(
+        np.dot(
+            probabilities,
+            compute_probability_to_arrive_at_or_before(
+                time_limits, arrival_probabilities, arrival_times
+            ),
         )
-        arrival_probability = compute_probability_to_arrive_at_or_before(
-            time_limit, arrival_probabilities, arrival_times
-        )
-        probabilities.append(departure_probabilities[i][1] * arrival_probability)
-    # sum the probabilities
-    probability = sum(probabilities)
-    # return the probability of a connection made
-    return probability
+    )
 
 
 def compute_probability_to_arrive_at_t_given_connection_made(
@@ -144,62 +187,60 @@ def compute_probability_to_arrive_at_t_given_connection_made(
     transfer_time=5,
 ) -> float:
     """Compute the probability of arriving at time t given that we made the connection."""
-    probabilities = []
-    # loop through all possible departure times
-    for t_dep in departure_probabilities:
-        # conditional probability of arriving at time t given the departure at t'
-        # To compute this conditional probability, we need to count how often an arrival-departure pair occurs (divided by total number of arrival-departure pairs)
-        # and then divide by the probability that we depart at t'
-        occurence_arrival_departure_pair = (
-            0  # how often the arrival-departure pair occurs
-        )
-        for pair in arrival_departure_tuples:
-            if t_dep[0] == pair[0] and arrival_time == pair[1]:
-                occurence_arrival_departure_pair += 1
-        # probability of arriving at time t given that we depart at t'
-        probability_arrival_at_t_given_departure_at_t_prime = (
-            occurence_arrival_departure_pair / len(arrival_departure_tuples)
-        )
-
-        # probability of departing at time t'
-        probability_departure = t_dep[1]
-        # probability of arriving at time t given that we depart at t'
-        probability_arrival_given_departure = (
-            probability_arrival_at_t_given_departure_at_t_prime / probability_departure
-        )
+    # check if the probability of connection made is 0, if yes, we return 0 (otherwise we would divide by 0)
+    if probability_connection_made == 0 or len(departure_probabilities) == 0:
+        return 0
+    # the actual (departure, arrival) times of the trip as arrays
+    arrival_departure_tuples = as_actual_times(arrival_departure_tuples)
+    distributions = arrival_departure_tuples.distributions
+    departure_times, probabilities_departure = _distribution_arrays(
+        departure_probabilities
+    )
 
-        # probability of arriving at or before t' given the arrival probabilities
-        # check if the transfer is needed, if yes, we need to consider the transfer time
-        time_limit = t_dep[0] - transfer_time if transfer_needed else t_dep[0]
-        probability_arrival_before_t_prime = compute_probability_to_arrive_at_or_before(
-            time_limit, arrival_probabilities, arrival_times
-        )
+    # conditional probability of arriving at time t given the departure at t'
+    # how often each arrival-departure pair occurs: lookup in the precomputed (sparse) joint histogram of the (departure, arrival) times
+    arrival_index = np.searchsorted(distributions["arrival_times"], arrival_time)
+    occurence_per_departure_time = np.zeros(len(distributions["departure_times"]) + 1)
+    if (
+        arrival_index < len(distributions["arrival_times"])
+        and distributions["arrival_times"][arrival_index] == arrival_time
+    ):
+        is_arrival_time = distributions["joint_arrival_indices"] == arrival_index
+        occurence_per_departure_time[
+            distributions["joint_departure_indices"][is_arrival_time]
+        ] = distributions["joint_counts"][is_arrival_time]
+    # departure times that were never observed have no occurrences (last element)
+    departure_indices = np.searchsorted(
+        distributions["departure_times"], departure_times
+    )
+    is_observed = departure_indices < len(distributions["departure_times"])
+    is_observed[is_observed] = (
+        distributions["departure_times"][departure_indices[is_observed]]
+        == departure_times[is_observed]
+    )
+    departure_indices[~is_observed] = len(distributions["departure_times"])
+    occurence_arrival_departure_pair = occurence_per_departure_time[departure_indices]
+    # probability of arriving at time t given that we depart at t'
+    probability_arrival_given_departure = (
+        occurence_arrival_departure_pair / len(arrival_departure_tuples)
+    ) / probabilities_departure
 
-        # logging.debug(f"Departure time: {t_dep[0]}, Arrival time: {arrival_time}")
-        # logging.debug(f"Departure probability: {probability_departure}")
-        # logging.debug(f"Arrival probability before t': {probability_arrival_before_t_prime}")
-        # logging.debug(f"Arrival probability given departure: {probability_arrival_given_departure}")
-        # logging.debug(f"Probability connection made: {probability_connection_made}")
+    # probability of arriving at or before t' given the arrival probabilities
+    # check if the transfer is needed, if yes, we need to consider the transfer time
+    time_limits = departure_times - transfer_time if transfer_needed else departure_times
+    probability_arrival_before_t_prime = compute_probability_to_arrive_at_or_before(
+        time_limits, arrival_probabilities, arrival_times
+    )
 
-        # check if the probability of connection made is 0, if yes, we return 0
-        if probability_connection_made == 0:
-            return (
-                0  # otherwise we would divide by 0, #@todo -> maybe break better here?
-            )
-        # conditional probability of arriving at time t given that we made the connection
-        probability = (
-            probability_departure
+    # conditional probability of arriving at time t given that we made the connection (sum over all departure times)
+    return float(
+        np.sum(
+            probabilities_departure
             * probability_arrival_before_t_prime
             * probability_arrival_given_departure
-        ) / probability_connection_made
-
-        # logging.debug(f"Probability of arriving at time {arrival_time} given that we made the connection: {probability}")
-
-        # sum later over all departure times
-        probabilities.append(probability)
-    probability_sum = sum(probabilities)
-
-    return probability_sum
+        )
+        / probability_connection_made
+    )
 
 
 def compute_arrival_probability_last_trip(
@@ -219,211 +260,804 @@ def compute_arrival_probability_last_trip(
     return probability_arrival_before_time_limit
 
 
-def compute_reliability(
-    station_trips: List[dict],
-    start_time: int,
-    time_budget: int,
-    complete_path=True,  # whether we want the reliability for a partial path (sequence of trips) or a complete one
-    transfer_time=TRANSFER_TIME_DEFAULT,
-) -> float | tuple[float, float]:
+def compute_probability_to_arrive_at_or_before_distribution(
+    time_limit: int, arrival_distribution: tuple[np.ndarray, np.ndarray, np.ndarray]
+) -> float:
     """
-    Compute the reliability of a connection given a list of trips and a start time and time budget
-    station_trips because it is a dictionary with the station as key and the trips from this station as values
+    Compute the probability of arriving at or before a given time given an arrival distribution (arrival times, probabilities and cumulative probabilities)
     """
-    # logging.debug(f"#########################################")
-    # logging.debug(f"Compute reliability, complete path: {complete_path}")
-    # logging.debug(f"Compute reliability for station trips: {station_trips}")
-    # First, add the departure probabilities to the trips
-    # create a deep copy of the station trips to avoid modifying the original data
-    station_trips_copy = deepcopy(station_trips)
+    arrival_times, _, cumulative_probabilities = arrival_distribution
+    index = np.searchsorted(arrival_times, time_limit, side="right")
+    return float(cumulative_probabilities[index - 1]) if index > 0 else 0
 
-    # different handling / exception: if the first trip is our start (meaning "from" and "to" are the same node/station, we skip this trip and take the next one)
-    if station_trips_copy[0]["from"] == station_trips_copy[0]["to"]:
-        # remove the first trip from the station trips
-        station_trips_copy = station_trips_copy[1:]
 
-    add_departure_probabilities(station_trips_copy)
+def compute_connection_and_arrival_distribution(
+    arrival_distribution_previous_trip: tuple[np.ndarray, np.ndarray, np.ndarray],
+    trip: dict,
+    transfer_needed: bool,
+    transfer_time=TRANSFER_TIME_DEFAULT,
+) -> tuple[float, tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Compute the probability of making the connection from the previous trip to the trip, and the arrival distribution of the trip given that we made the connection
+    Same as compute_connection_probability and compute_probability_to_arrive_at_t_given_connection_made, but for all times at once
+    (using the precomputed departure and arrival distributions of the trip, see ActualTimes):
+    - probability of the connection: sum over the departure times of P(departure) * P(arrival previous trip at or before departure (minus transfer time))
+    - arrival distribution: the probabilities of arriving at or before the departure times (minus transfer time) multiplied with the joint histogram
+      of the (departure, arrival) times of the trip, divided by the probability of the connection
+    """
+    distributions = as_actual_times(trip["actual_times"]).distributions
+    departure_times = distributions["departure_times"]
+    number_actual_times = len(distributions["departure_indices"])
+    arrival_times_previous_trip, _, cumulative_probabilities_previous_trip = (
+        arrival_distribution_previous_trip
+    )
+    # probability of arriving with the previous trip at or before the latest possible arrival (for each departure time of the trip)
+    latest_arrivals = (
+        departure_times.astype(np.int32) - transfer_time
+        if transfer_needed
+        else departure_times
+    )
+    probabilities_arrival_before_departure = np.concatenate(
+        ([0.0], cumulative_probabilities_previous_trip)
+    )[np.searchsorted(arrival_times_previous_trip, latest_arrivals, side="right")]
+    probability_connection_made = float(
+        np.dot(
+            distributions["departure_probabilities"],
+            probabilities_arrival_before_departure,
+        )
+    )
+    arrival_times = distributions["arrival_times"]
+    if probability_connection_made == 0 or number_actual_times == 0:
+        # the connection is never made, all arrival probabilities are 0
+        zeros = np.zeros(len(arrival_times))
+        return 0, (arrival_times, zeros, zeros)
+    # probability of arriving at each arrival time given that we made the connection: the probabilities of arriving before the departures
+    # multiplied with the (precomputed, sparse) joint histogram of the (departure, arrival) pairs
+    arrival_probabilities = np.bincount(
+        distributions["joint_arrival_indices"],
+        weights=probabilities_arrival_before_departure[
+            distributions["joint_departure_indices"]
+        ]
+        * distributions["joint_counts"],
+        minlength=len(arrival_times),
+    ) / (number_actual_times * probability_connection_made)
+    return probability_connection_made, (
+        arrival_times,
+        arrival_probabilities,
+        np.cumsum(arrival_probabilities),
+    )
 
-    # different handling depending on the number of trips
-    # if the length is 0, we return 0
-    if len(station_trips_copy) == 0:
-        return 0, 0
 
-    # extract the first trip from the station trips
-    first_trip = station_trips_copy[
-        0
-    ]  # for a path, we have always only one trip per station, therefore we can use [0]
-    # logging.debug(f"First trip: {first_trip}")
+class PartialPathReliability:
+    """
+    Reliability information of a partial path (sequence of trips), carried along with the path in the search for the most reliable path
+    Extending the path only needs the computation for the new last (tail) trip instead of recomputing the whole path (compute_reliability):
+    - probability of making all connections before the tail trip
+    - arrival distribution of the trip before the tail trip (needed if the tail trip is consolidated, e.g., extended with the same train)
+    - probability of making the connection to the tail trip and the arrival distribution of the tail trip given that we made the connections
+    """
 
-    # get arrival times and arrival probabilities for the first trip
-    arrival_times_first_trip = get_arrival_times_from_trip(first_trip)
-    arrival_probabilities_first_trip = get_all_arrival_probabilities_trip(
-        arrival_times_first_trip
+    __slots__ = (
+        "probability_connections_made_before_tail",
+        "arrival_distribution_previous_trip",
+        "probability_connection_made_tail",
+        "arrival_distribution_tail",
     )
 
-    # if the length is 1, we return the probability of arriving at the destination at or before the time limit
-    if len(station_trips_copy) == 1:
-        if not complete_path:
-            return compute_arrival_probability_last_trip(
-                start_time,
-                time_budget,
-                arrival_probabilities_first_trip,
-                arrival_times_first_trip,
-            ), 1  # the connection is always made, because we only have one trip
-        return compute_arrival_probability_last_trip(
-            start_time,
-            time_budget,
-            arrival_probabilities_first_trip,
-            arrival_times_first_trip,
+    def __init__(
+        self,
+        probability_connections_made_before_tail=1,
+        arrival_distribution_previous_trip=None,
+        probability_connection_made_tail=1,
+        arrival_distribution_tail=None,
+    ):
+        self.probability_connections_made_before_tail = (
+            probability_connections_made_before_tail
         )
-    # logging.debug("-----------------------------")
-    # extract the second trip from the station trips (also handled a bit differently)
-    second_trip = station_trips_copy[1]
-    # logging.debug(f"Second trip: {second_trip}")
-    # all the trips from the third trip onwards until the last trip
-    trips_from_third_trip = station_trips_copy[2:]
-
-    # list of all probabilities of making the connections
-    probabilities_connections_made = []
-
-    # compute the probability of making the first connection (between the first and second trip)
-    # check if a transfer is needed between the first and second trip
-    transfer_needed_first_second_trip = is_transfer_needed(
-        first_trip["trip_id"] if "trip_id" in first_trip else "",
-        second_trip["trip_id"] if "trip_id" in second_trip else "",
-    )
+        self.arrival_distribution_previous_trip = arrival_distribution_previous_trip
+        self.probability_connection_made_tail = probability_connection_made_tail
+        self.arrival_distribution_tail = arrival_distribution_tail
 
-    connection_made_first_second_trip = compute_connection_probability(
-        second_trip["departure_probabilities"],
-        arrival_probabilities_first_trip,
-        arrival_times_first_trip,
-        transfer_needed_first_second_trip,
+    def _with_tail(
+        self,
+        probability_connections_made_before_tail,
+        arrival_distribution_previous_trip,
+        trip: dict,
+        transfer_needed: bool,
         transfer_time,
-    )
-    # store the probability of making the connection (for the reliability computation, last step)
-    probabilities_connections_made.append(connection_made_first_second_trip)
-    # compute arrival probabilities for second trip given that we made the connection (between the first and second trip)
-    arrival_times_second_trip = get_arrival_times_from_trip(second_trip)
-    arrival_probabilities_second_trip = []
-    # loop through the arrival times of the second trip and compute the probability of arriving at that time given that we made the connection
-    for arrival_time in arrival_times_second_trip:
-        probability = compute_probability_to_arrive_at_t_given_connection_made(
-            arrival_time,
-            second_trip["departure_probabilities"],
-            arrival_probabilities_first_trip,
-            arrival_times_first_trip,
-            connection_made_first_second_trip,
-            second_trip["actual_times"],
-            transfer_needed_first_second_trip,
+    ):
+        if arrival_distribution_previous_trip is None:
+            # first trip of the path: the connection is always made
+            return PartialPathReliability(
+                probability_connections_made_before_tail,
+                None,
+                1,
+                as_actual_times(trip["actual_times"]).arrival_distribution,
+            )
+        probability_connection_made, arrival_distribution = (
+            compute_connection_and_arrival_distribution(
+                arrival_distribution_previous_trip, trip, transfer_needed, transfer_time
+            )
+        )
+        return PartialPathReliability(
+            probability_connections_made_before_tail,
+            arrival_distribution_previous_trip,
+            probability_connection_made,
+            arrival_distribution,
+        )
+
+    def extend(self, trip: dict, transfer_needed: bool, transfer_time=TRANSFER_TIME_DEFAULT):
+        """
+        Reliability of the path extended with the trip (the trip is the new tail trip)
+        """
+        if self.arrival_distribution_tail is None:
+            # empty path
+            return self._with_tail(1, None, trip, transfer_needed, transfer_time)
+        return self._with_tail(
+            self.probability_connections_made,
+            self.arrival_distribution_tail,
+            trip,
+            transfer_needed,
             transfer_time,
         )
-        arrival_probabilities_second_trip.append((arrival_time, probability))
-    # only use unique arrival probabilities
-    arrival_probabilities_second_trip = list(set(arrival_probabilities_second_trip))
-
-    # check if the length is 2, if yes, we return the probability of arriving at the destination at or before the time limit multiplied by the probability of
-    # making the first connection as reliability
-    if len(station_trips_copy) == 2:
-        probability_arrival_before_time_limit = compute_arrival_probability_last_trip(
-            start_time,
-            time_budget,
-            arrival_probabilities_second_trip,
-            arrival_times_second_trip,
+
+    def replace_tail(self, trip: dict, transfer_needed: bool, transfer_time=TRANSFER_TIME_DEFAULT):
+        """
+        Reliability of the path where the tail trip is replaced by the trip (e.g., the tail trip consolidated with a connection of the same train)
+        transfer_needed is about the transfer from the trip before the tail trip to the (new) tail trip
+        """
+        return self._with_tail(
+            self.probability_connections_made_before_tail,
+            self.arrival_distribution_previous_trip,
+            trip,
+            transfer_needed,
+            transfer_time,
         )
-        # If we want to know the reliability of a partial path (not complete), then we return the probabilities separately
-        if not complete_path:
-            return (
-                probability_arrival_before_time_limit,
-                connection_made_first_second_trip,
-            )
-        return probability_arrival_before_time_limit * connection_made_first_second_trip
 
-    # logging.debug("-----------------------------")
+    @property
+    def probability_connections_made(self) -> float:
+        """
+        Probability of making all connections of the path
+        """
+        return (
+            self.probability_connections_made_before_tail
+            * self.probability_connection_made_tail
+        )
 
-    is_third_trip = True  # different handling for the third trip
+    @property
+    def probability_connections_made_bound(self) -> float:
+        """
+        Upper bound of the probability of making all connections of any extension of the path: a transfer to another trip adds a connection,
+        staying in the train replaces the tail trip (consolidated with the next connection), so only the connections before the tail trip are kept
+        """
+        return max(
+            self.probability_connections_made,
+            self.probability_connections_made_before_tail,
+        )
 
-    # prepare the data for the reliability computation
-    last_trip_arrival_probabilities = []  # arrival probabilities
-    last_trip_arrival_times = []  # arrival times
+    def probability_arrival(self, time_limit: int) -> float:
+        """
+        Probability of arriving with the tail trip at or before the time limit, given that we made all connections
+        """
+        return compute_probability_to_arrive_at_or_before_distribution(
+            time_limit, self.arrival_distribution_tail
+        )
 
-    # compute the rest of the connections (from the third trip onwards), connection probability and arrival probabilities given that we made the connection
-    # first, we handle the case of the third trip (preparing the data we need for the probability computation)
-    # then, we compute the connection probability, and the arrival probabilities given that we made the connection
-    # then, we prepare the data for the next trip (iteration)
-    # we repeat this for all trips after the second trip
-    for current_trip in trips_from_third_trip:
-        if is_third_trip:
-            previous_trip = second_trip
-            arrival_probabilities_previous_trip = arrival_probabilities_second_trip
-            arrival_times_previous_trip = arrival_times_second_trip
-            is_third_trip = False
+    def arrival_cdf(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Arrival times of the tail trip and the probability of making all connections and arriving at or before them (reliability for every time limit)
+        """
+        arrival_times, _, cumulative_probabilities = self.arrival_distribution_tail
+        return arrival_times, cumulative_probabilities * self.probability_connections_made
 
-        transfer_needed = is_transfer_needed(
-            previous_trip["trip_id"] if "trip_id" in previous_trip else "",
-            current_trip["trip_id"] if "trip_id" in current_trip else "",
+    def expected_arrival(self) -> float:
+        """
+        Expected arrival time of the tail trip given that we made all connections (infinity if the connections are never made)
+        """
+        arrival_times, arrival_probabilities, _ = self.arrival_distribution_tail
+        total_probability = float(np.sum(arrival_probabilities))
+        if total_probability == 0:
+            return float("inf")
+        return float(np.dot(arrival_times, arrival_probabilities)) / total_probability
+
+
+class PartialPathScenarios:
+    """
+    Reliability information of a partial path based on the historical days (scenarios), alternative to PartialPathReliability
+    The observations of all trips of the path are aligned by their operating day (days x trips), for each day we check if all connections were
+    made and when we arrived with the tail trip. The reliability is the fraction of the (common) days on which all connections were made and we
+    arrived in time, delays that are correlated on the same day (e.g., a disruption affecting several trains) are therefore taken into account.
+    """
+
+    __slots__ = (
+        "days_before_tail",
+        "connections_made_before_tail",
+        "arrivals_before_tail",
+        "days",
+        "connections_made",
+        "arrivals",
+    )
+
+    def __init__(
+        self,
+        days_before_tail=None,
+        connections_made_before_tail=None,
+        arrivals_before_tail=None,
+        days=None,
+        connections_made=None,
+        arrivals=None,
+    ):
+        # operating days, if all connections were made on the day, and arrival time of the trip before the tail trip (None for the first trip)
+        self.days_before_tail = days_before_tail
+        self.connections_made_before_tail = connections_made_before_tail
+        self.arrivals_before_tail = arrivals_before_tail
+        # the same for the tail trip (None for an empty path)
+        self.days = days
+        self.connections_made = connections_made
+        self.arrivals = arrivals
+
+    def _with_tail(
+        self,
+        days_before_tail,
+        connections_made_before_tail,
+        arrivals_before_tail,
+        trip: dict,
+        transfer_needed: bool,
+        transfer_time,
+    ):
+        actual_times = as_actual_times(trip["actual_times"])
+        if days_before_tail is None:
+            # first trip of the path: the connection is always made
+            return PartialPathScenarios(
+                None,
+                None,
+                None,
+                actual_times.operating_days,
+                np.ones(len(actual_times), dtype=bool),
+                actual_times.arrivals,
+            )
+        # only the days on which we have observations for all trips
+        days, indices_before_tail, indices_tail = np.intersect1d(
+            days_before_tail,
+            actual_times.operating_days,
+            assume_unique=True,
+            return_indices=True,
+        )
+        latest_arrivals = actual_times.departures[indices_tail].astype(np.int32) - (
+            transfer_time if transfer_needed else 0
+        )
+        connections_made = connections_made_before_tail[indices_before_tail] & (
+            arrivals_before_tail[indices_before_tail] <= latest_arrivals
         )
-        arrival_times = get_arrival_times_from_trip(current_trip)
-        arrival_probabilities = []
-
-        # compute the probability of making the connection (between the previous and current trip)
-        connection_made = compute_connection_probability(
-            current_trip["departure_probabilities"],
-            arrival_probabilities_previous_trip,
-            arrival_times_previous_trip,
+        return PartialPathScenarios(
+            days_before_tail,
+            connections_made_before_tail,
+            arrivals_before_tail,
+            days,
+            connections_made,
+            actual_times.arrivals[indices_tail],
+        )
+
+    def extend(self, trip: dict, transfer_needed: bool, transfer_time=TRANSFER_TIME_DEFAULT):
+        """
+        Scenarios of the path extended with the trip (the trip is the new tail trip)
+        """
+        return self._with_tail(
+            self.days,
+            self.connections_made,
+            self.arrivals,
+            trip,
             transfer_needed,
             transfer_time,
         )
-        # store the probability of making the connection (for the reliability computation, last step)
-        probabilities_connections_made.append(connection_made)
-        # logging.debug(f"### Connection made: {connection_made} for trip {current_trip}, with arrival probabilities {arrival_probabilities_previous_trip} and arrival times {arrival_times_previous_trip}")
-
-        # compute arrival probabilities for the current trip given that we made the connection (between the previous and current trip)
-        for arrival_time in arrival_times:
-            probability = compute_probability_to_arrive_at_t_given_connection_made(
-                arrival_time,
-                current_trip["departure_probabilities"],
-                arrival_probabilities_previous_trip,
-                arrival_times_previous_trip,
-                connection_made,
-                current_trip["actual_times"],
-                transfer_needed,
-                transfer_time,
+
+    def replace_tail(self, trip: dict, transfer_needed: bool, transfer_time=TRANSFER_TIME_DEFAULT):
+        """
+        Scenarios of the path where the tail trip is replaced by the trip (e.g., the tail trip consolidated with a connection of the same train)
+        """
+        return self._with_tail(
+            self.days_before_tail,
+            self.connections_made_before_tail,
+            self.arrivals_before_tail,
+            trip,
+            transfer_needed,
+            transfer_time,
+        )
+
+    @property
+    def probability_connections_made(self) -> float:
+        """
+        Fraction of the days on which all connections of the path were made
+        """
+        if self.days is None or len(self.days) == 0:
+            return 0
+        return int(np.count_nonzero(self.connections_made)) / len(self.days)
+
+    @property
+    def probability_connections_made_bound(self) -> float:
+        """
+        Upper bound of the probability of making all connections of any extension of the path (see PartialPathReliability)
+        The fraction of the days can increase if a trip restricts the path to fewer days, so the bound is 1 as long as the connections are made
+        on at least one day (with the tail trip, or before it when staying in the train), otherwise no extension makes the connections
+        """
+        if self.days_before_tail is None:
+            # empty path or first trip (the connection to the first trip is always made)
+            return 1
+        return (
+            1
+            if np.any(self.connections_made) or np.any(self.connections_made_before_tail)
+            else 0
+        )
+
+    def probability_arrival(self, time_limit: int) -> float:
+        """
+        Fraction of the days with all connections made on which we arrived with the tail trip at or before the time limit
+        """
+        number_connections_made = (
+            int(np.count_nonzero(self.connections_made)) if self.days is not None else 0
+        )
+        if number_connections_made == 0:
+            return 0
+        return (
+            int(np.count_nonzero(self.arrivals[self.connections_made] <= time_limit))
+            / number_connections_made
+        )
+
+    def arrival_cdf(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Arrival times of the tail trip and the fraction of the days on which all connections were made and we arrived at or before them
+        """
+        if self.days is None or len(self.days) == 0:
+            return np.zeros(0, dtype=np.int16), np.zeros(0)
+        arrival_times, counts = np.unique(
+            self.arrivals[self.connections_made], return_counts=True
+        )
+        return arrival_times, np.cumsum(counts) / len(self.days)
+
+    def expected_arrival(self) -> float:
+        """
+        Average arrival time of the tail trip on the days on which all connections were made (infinity if there are no such days)
+        """
+        if self.days is None or not np.any(self.connections_made):
+            return float("inf")
+        return float(np.mean(self.arrivals[self.connections_made]))
+
+
+class PartialPathSamples(PartialPathScenarios):
+    """
+    Reliability information of a partial path based on sampled delays (Monte Carlo), with a fixed number of samples per path
+    Same as PartialPathScenarios, but instead of the historical days, each sample draws one observation (departure, arrival) of every trip
+    (independently per trip, like the analytic computation), the estimation costs the same for every path
+    """
+
+    __slots__ = ("random_generator", "number_samples")
+
+    def __init__(
+        self,
+        random_generator=None,
+        number_samples=MONTE_CARLO_SAMPLES_SEARCH,
+        days_before_tail=None,
+        connections_made_before_tail=None,
+        arrivals_before_tail=None,
+        days=None,
+        connections_made=None,
+        arrivals=None,
+    ):
+        # the samples take the place of the days of PartialPathScenarios
+        super().__init__(
+            days_before_tail=days_before_tail,
+            connections_made_before_tail=connections_made_before_tail,
+            arrivals_before_tail=arrivals_before_tail,
+            days=days,
+            connections_made=connections_made,
+            arrivals=arrivals,
+        )
+        self.random_generator = (
+            random_generator
+            if random_generator is not None
+            else np.random.default_rng()
+        )
+        self.number_samples = number_samples
+
+    def _with_tail(
+        self,
+        days_before_tail,
+        connections_made_before_tail,
+        arrivals_before_tail,
+        trip: dict,
+        transfer_needed: bool,
+        transfer_time,
+    ):
+        actual_times = as_actual_times(trip["actual_times"])
+        samples = np.arange(self.number_samples)
+        if len(actual_times) == 0:
+            # without observations, we never make the connection
+            departures = arrivals = np.full(self.number_samples, np.iinfo(np.int16).max)
+            connections_made = np.zeros(self.number_samples, dtype=bool)
+        else:
+            observations = self.random_generator.integers(
+                len(actual_times), size=self.number_samples
+            )
+            departures = actual_times.departures[observations]
+            arrivals = actual_times.arrivals[observations]
+            connections_made = np.ones(self.number_samples, dtype=bool)
+        if days_before_tail is not None:
+            latest_arrivals = departures.astype(np.int32) - (
+                transfer_time if transfer_needed else 0
+            )
+            connections_made = (
+                connections_made
+                & connections_made_before_tail
+                & (arrivals_before_tail <= latest_arrivals)
             )
-            arrival_probabilities.append((arrival_time, probability))
-        # only use unique arrival probabilities
-        arrival_probabilities = list(set(arrival_probabilities))
-        # logging.debug(f"### Arrival probabilities in loop {arrival_probabilities}")
+        return PartialPathSamples(
+            random_generator=self.random_generator,
+            number_samples=self.number_samples,
+            days_before_tail=days_before_tail,
+            connections_made_before_tail=connections_made_before_tail,
+            arrivals_before_tail=arrivals_before_tail,
+            days=samples,
+            connections_made=connections_made,
+            arrivals=arrivals,
+        )
+
 
-        # at the end of this iteration, we prepare the previous trip for the next iteration
-        previous_trip = current_trip
-        arrival_probabilities_previous_trip = arrival_probabilities
-        arrival_times_previous_trip = arrival_times
+def compute_confidence_interval(
+    number_successes: int, number_samples: int, z=MONTE_CARLO_CONFIDENCE_Z
+) -> tuple[float, float]:
+    """
+    Compute the (Wilson score) confidence interval of a probability estimated from samples
+    """
+    if number_samples == 0:
+        return 0, 1
+    probability = number_successes / number_samples
+    denominator = 1 + z**2 / number_samples
+    center = (probability + z**2 / (2 * number_samples)) / denominator
+    half_width = (
+        z
+        * np.sqrt(
+            probability * (1 - probability) / number_samples
+            + z**2 / (4 * number_samples**2)
+        )
+        / denominator
+    )
+    return max(0.0, float(center - half_width)), min(1.0, float(center + half_width))
 
-        # store the arrival probabilities of the last trip and the connection probability for the final reliability computation
-        last_trip_arrival_probabilities = arrival_probabilities
-        last_trip_arrival_times = arrival_times
 
-    # compute the reliability of the connection
-    # first, compute the part where we check if we arrive at the destination at or before the time limit
-    # then, we multiply this with the probability of making the last connection
+def estimate_reliability_monte_carlo(
+    station_trips: List[dict],
+    start_time: int,
+    time_budget: int,
+    transfer_time=TRANSFER_TIME_DEFAULT,
+    max_samples=MONTE_CARLO_MAX_SAMPLES,
+    batch_size=MONTE_CARLO_BATCH_SIZE,
+    tolerance=MONTE_CARLO_TOLERANCE,
+    z=MONTE_CARLO_CONFIDENCE_Z,
+    random_generator=None,
+) -> dict:
+    """
+    Estimate the reliability of a path by sampling delay scenarios: for each sample, one observation (departure, arrival) is drawn for every trip,
+    the sample is successful if all connections are made and we arrive at or before the time limit
+    The samples are drawn in batches, we stop as soon as the confidence interval is narrower than the tolerance (or after max_samples)
+    Returns the reliability, the confidence interval (lower, upper), the probability of making all connections and the number of samples
+    """
+    if random_generator is None:
+        random_generator = np.random.default_rng()
+    # different handling / exception: if the first trip is our start, we skip it (like in compute_reliability)
+    if len(station_trips) > 0 and station_trips[0]["from"] == station_trips[0]["to"]:
+        station_trips = station_trips[1:]
+    result = {
+        "reliability": 0,
+        "lower": 0,
+        "upper": 0,
+        "probability_connections_made": 0,
+        "samples": 0,
+    }
+    # without trips or samples, there is nothing to estimate
+    if len(station_trips) == 0 or max_samples <= 0:
+        return result
 
-    probability_arrival_before_time_limit = compute_arrival_probability_last_trip(
-        start_time,
-        time_budget,
-        last_trip_arrival_probabilities,
-        last_trip_arrival_times,
+    time_limit = start_time + time_budget
+    number_samples = number_successes = number_connections_made = 0
+    while number_samples < max_samples:
+        batch = PartialPathSamples(
+            random_generator=random_generator,
+            number_samples=min(batch_size, max_samples - number_samples),
+        )
+        previous_trip = None
+        for trip in station_trips:
+            transfer_needed = previous_trip is not None and is_transfer_needed(
+                previous_trip["trip_id"] if "trip_id" in previous_trip else "",
+                trip["trip_id"] if "trip_id" in trip else "",
+            )
+            batch = batch.extend(trip, transfer_needed, transfer_time=transfer_time)
+            previous_trip = trip
+        number_samples += batch.number_samples
+        number_connections_made += int(np.count_nonzero(batch.connections_made))
+        number_successes += int(
+            np.count_nonzero(batch.connections_made & (batch.arrivals <= time_limit))
+        )
+        lower, upper = compute_confidence_interval(number_successes, number_samples, z)
+        if upper - lower <= tolerance:
+            break
+
+    result.update(
+        reliability=number_successes / number_samples,
+        lower=lower,
+        upper=upper,
+        probability_connections_made=number_connections_made / number_samples,
+        samples=number_samples,
+    )
+    return result
+
+
+def create_partial_path_reliability(reliability_engine="analytic"):
+    """
+    Create the reliability information of an empty path for the given reliability engine (see RELIABILITY_ENGINES)
+    """
+    if reliability_engine == "analytic":
+        return PartialPathReliability()
+    if reliability_engine == "scenario":
+        return PartialPathScenarios()
+    if reliability_engine == "monte_carlo":
+        return PartialPathSamples()
+    raise ValueError(
+        f"Unknown reliability engine {reliability_engine}, use one of {RELIABILITY_ENGINES}"
+    )
+
+
+def get_trip_key(trip: dict) -> tuple:
+    """
+    Get the key of a (consolidated) trip of a path: (departure station, trip identifier, planned departure, arrival station, planned arrival)
+    """
+    return (
+        trip["from"],
+        trip.get("trip_id"),
+        trip.get("planned_departure"),
+        trip["to"],
+        trip.get("planned_arrival"),
+    )
+
+
+class ReliabilityCache:
+    """
+    Least recently used (LRU) cache of the reliability information of partial paths (see create_partial_path_reliability)
+    Paths are identified by prefix keys: (key of the path without the last trip, key of the last trip, transfer needed to the last trip),
+    starting with the key of the empty path (reliability engine, transfer time). The cache returns the stored key of a path,
+    so the keys of all paths sharing a prefix share the same (interned) prefix key.
+    The cache assumes that the actual times of a trip do not change, so one cache belongs to one network (e.g., each Graph has its own cache),
+    it can only be shared by queries on the same network (e.g., the network of the whole day).
+    """
+
+    __slots__ = ("max_size", "entries", "hits", "misses")
+
+    def __init__(self, max_size=RELIABILITY_CACHE_SIZE):
+        self.max_size = max_size
+        # prefix key -> (interned prefix key, reliability information of the path)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_root_key(reliability_engine="analytic", transfer_time=TRANSFER_TIME_DEFAULT):
+        """
+        Get the key of the empty path, None if the results of the reliability engine are not cached
+        """
+        if reliability_engine not in CACHED_RELIABILITY_ENGINES:
+            return None
+        return reliability_engine, transfer_time
+
+    @staticmethod
+    def get_key(prefix_key: tuple, trip: dict, transfer_needed) -> tuple:
+        """
+        Get the key of the path (with key prefix_key) extended with the trip
+        """
+        return prefix_key, get_trip_key(trip), bool(transfer_needed)
+
+    def get(self, key: tuple, compute_partial_path_reliability):
+        """
+        Get the interned key and the reliability information of a path, computed with compute_partial_path_reliability() if it is not cached
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = (key, compute_partial_path_reliability())
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            # remove the least recently used path
+            self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __repr__(self) -> str:
+        return f"ReliabilityCache(size={len(self.entries)}, max_size={self.max_size}, hits={self.hits}, misses={self.misses})"
+
+
+# reliability caches per network key (the least recently used network is removed first)
+reliability_caches = OrderedDict()
+
+
+def get_reliability_cache(network_key) -> ReliabilityCache:
+    """
+    Get the reliability cache of a network, shared by all queries (graphs) on networks with the same key
+    The key has to identify the actual times of the trips, e.g., all networks sliced from the network of a day have the same trips (see get_network_key)
+    """
+    reliability_cache = reliability_caches.get(network_key)
+    if reliability_cache is None:
+        reliability_cache = ReliabilityCache()
+        reliability_caches[network_key] = reliability_cache
+        if len(reliability_caches) > RELIABILITY_CACHE_NETWORKS:
+            reliability_caches.popitem(last=False)
+    else:
+        reliability_caches.move_to_end(network_key)
+    return reliability_cache
+
+
+def get_partial_path_reliability(
+    station_trips: List[dict],
+    transfer_time=TRANSFER_TIME_DEFAULT,
+    reliability_engine="analytic",
+    reliability_cache=None,
+):
+    """
+    Get the reliability information of a path (see create_partial_path_reliability), adding the trips one after the other
+    The reliability information of all prefixes of the path is taken from (and stored in) the reliability cache, if one is given
+    """
+    partial_path_reliability = create_partial_path_reliability(reliability_engine)
+    key = (
+        reliability_cache.get_root_key(reliability_engine, transfer_time)
+        if reliability_cache is not None
+        else None
     )
-    # logging.debug(f"Probability of arriving at the destination at or before the time limit: {probability_arrival_before_time_limit}")
+    previous_trip = None
+    for trip in station_trips:
+        # check if a transfer is needed between the previous and the current trip
+        transfer_needed = previous_trip is not None and is_transfer_needed(
+            previous_trip["trip_id"] if "trip_id" in previous_trip else "",
+            trip["trip_id"] if "trip_id" in trip else "",
+        )
+        if key is None:
+            partial_path_reliability = partial_path_reliability.extend(
+                trip, transfer_needed, transfer_time=transfer_time
+            )
+        else:
+            key, partial_path_reliability = reliability_cache.get(
+                reliability_cache.get_key(key, trip, transfer_needed),
+                lambda: partial_path_reliability.extend(
+                    trip, transfer_needed, transfer_time=transfer_time
+                ),
+            )
+        previous_trip = trip
+    return partial_path_reliability
+
 
+def compute_arrival_cdf(
+    station_trips: List[dict],
+    transfer_time=TRANSFER_TIME_DEFAULT,
+    reliability_engine="analytic",
+    reliability_cache=None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the arrival time CDF of a path: the possible arrival times at the destination and the probability of making all connections
+    and arriving at or before them. The reliability for a time budget is the value at the last arrival time at or before start time + time budget.
+    @param reliability_cache: reliability cache of the network of the path (see ReliabilityCache), None to compute the path without cache
+    """
+    # different handling / exception: if the first trip is our start, we skip it (like in compute_reliability)
+    if len(station_trips) > 0 and station_trips[0]["from"] == station_trips[0]["to"]:
+        station_trips = station_trips[1:]
+    if len(station_trips) == 0:
+        return np.zeros(0, dtype=np.int16), np.zeros(0)
+    return get_partial_path_reliability(
+        station_trips,
+        transfer_time=transfer_time,
+        reliability_engine=reliability_engine,
+        reliability_cache=reliability_cache,
+    ).arrival_cdf()
+
+
+def get_reliability_from_arrival_cdf(
+    arrival_cdf: tuple[np.ndarray, np.ndarray], time_limits
+) -> np.ndarray:
+    """
+    Get the reliability (probability of arriving at or before the time limit) for each time limit from an arrival time CDF
+    """
+    arrival_times, cumulative_probabilities = arrival_cdf
+    return np.concatenate(([0.0], cumulative_probabilities))[
+        np.searchsorted(arrival_times, np.asarray(time_limits), side="right")
+    ]
+
+
+def compute_reliability_for_time_budgets(
+    station_trips: List[dict],
+    start_time: int,
+    time_budgets: List[int],
+    transfer_time=TRANSFER_TIME_DEFAULT,
+    reliability_engine="analytic",
+    reliability_cache=None,
+) -> List[float]:
+    """
+    Compute the reliability of a path for several time budgets at once (from the arrival time CDF of the path)
+    """
+    arrival_cdf = compute_arrival_cdf(
+        station_trips,
+        transfer_time=transfer_time,
+        reliability_engine=reliability_engine,
+        reliability_cache=reliability_cache,
+    )
+    return get_reliability_from_arrival_cdf(
+        arrival_cdf, start_time + np.asarray(time_budgets)
+    ).tolist()
+
+
+def compute_reliability(
+    station_trips: List[dict],
+    start_time: int,
+    time_budget: int,
+    complete_path=True,  # whether we want the reliability for a partial path (sequence of trips) or a complete one
+    transfer_time=TRANSFER_TIME_DEFAULT,
+    reliability_engine="analytic",
+    reliability_cache=None,
+) -> float | tuple[float, float]:
+    """
+    Compute the reliability of a connection given a list of trips and a start time and time budget
+    station_trips because it is a dictionary with the station as key and the trips from this station as values
+    The trips are added one after the other (see PartialPathReliability): the probability of making the connection to the next trip depends on the
+    arrival distribution of the previous trip given that we made all connections before, the reliability is the probability of making all connections
+    multiplied with the probability of arriving with the last trip at or before the time limit
+    With the "scenario" reliability engine, the historical days are replayed instead (see PartialPathScenarios), with the "monte_carlo" engine,
+    the reliability is estimated by sampling (see estimate_reliability_monte_carlo)
+    @param reliability_cache: reliability cache of the network of the path (see ReliabilityCache), None to compute the path without cache
+    """
+    # different handling / exception: if the first trip is our start (meaning "from" and "to" are the same node/station, we skip this trip and take the next one)
+    if len(station_trips) > 0 and station_trips[0]["from"] == station_trips[0]["to"]:
+        station_trips = station_trips[1:]
+
+    # if the length is 0, we return 0
+    if len(station_trips) == 0:
+        return 0, 0
+
+    if reliability_engine == "monte_carlo":
+        estimation = estimate_reliability_monte_carlo(
+            station_trips, start_time, time_budget, transfer_time=transfer_time
+        )
+        if not complete_path:
+            probability_connections_made = estimation["probability_connections_made"]
+            return (
+                estimation["reliability"] / probability_connections_made
+                if probability_connections_made > 0
+                else 0,
+                probability_connections_made,
+            )
+        return estimation["reliability"]
+
+    partial_path_reliability = get_partial_path_reliability(
+        station_trips,
+        transfer_time=transfer_time,
+        reliability_engine=reliability_engine,
+        reliability_cache=reliability_cache,
+    )
+
+    # probability of arriving at the destination at or before the time limit (given that we made all connections)
+    probability_arrival_before_time_limit = partial_path_reliability.probability_arrival(
+        start_time + time_budget
+    )
     # product of probabilities of all connections made
-    product_probabilities_connections_made = 1
-    for probability_connection_made in probabilities_connections_made:
-        product_probabilities_connections_made *= probability_connection_made
-    # logging.debug(f"** Probabilities of all connections made: {probabilities_connections_made}")
+    product_probabilities_connections_made = (
+        partial_path_reliability.probability_connections_made
+    )
 
     # If we want to know the reliability of a partial path (not complete), then we return the probabilities separately
     if not complete_path:
-        # logging.debug(f"Prob. of arrival before time limit: {probability_arrival_before_time_limit}, Prob. of all connections made: {product_probabilities_connections_made}")
         return (
             probability_arrival_before_time_limit,
             product_probabilities_connections_made,
@@ -0,0 +1,196 @@
+# This file contains an optimistic (upper) bound on the reliability that can still be achieved from a station, used for pruning in the search for the most reliable path.
+# The bound is computed once per query with a backward pass from the target over all connections (sorted by departure time, latest first),
+# similar to the profile variant of the Connection Scan Algorithm: for each station, it stores the best reachable probability of arriving
+# at the target in time as a step function of the departure time at the station.
+# Reference: "The most reliable flight itinerary problem" (Redmond et al., 2019), A*-like bounds on the remaining reliability
+import logging
+from bisect import bisect_left, bisect_right
+
+from algorithm.actual_times import as_actual_times
+from algorithm.helper import merge_actual_times
+from algorithm.reliability import compute_probability_to_arrive_at_or_before_distribution
+from constants import LOG_LEVEL
+
+# set log level
+logging.basicConfig(level=LOG_LEVEL)
+
+
+class ReliabilityUpperBound:
+    """
+    Optimistic probability of arriving at the target at or before the time limit, per station and earliest departure time
+    With independent trips (analytic reliability), the reliability of a path is at most the probability of making the connections before its last trip
+    times the probability of the last trip arriving in time (the probability of making the last connection is at most 1).
+    The last trip can be consolidated (same train from an earlier station, restricted to the common operating days), so the probability of a
+    connection to the target is the best over all stations where the train can be boarded.
+    """
+
+    def __init__(self, connections: list[dict], target, time_limit: int):
+        """
+        @param connections: all connections of the network sorted by planned departure time (like ConnectionScan.connections)
+        @param target: the target node
+        @param time_limit: the latest arrival time at the target
+        """
+        self.target = target
+        self.time_limit = time_limit
+        # profile per station: negative departure times (ascending, the connections are scanned with the latest departure first)
+        # and the best probability of any connection departing at or after this time
+        self.negative_departure_times = {}
+        self.probabilities = {}
+        # best probability when staying in the train (station, trip identifier)
+        self.trip_probabilities = {}
+        # connections of the trains reaching the target per trip identifier and arrival station (to consolidate the last trip)
+        trips_to_target = {
+            connection["trip_id"] for connection in connections if connection["to"] == target
+        }
+        self.trip_connections = {
+            (connection["trip_id"], connection["to"]): connection
+            for connection in connections
+            if connection["trip_id"] in trips_to_target
+        }
+
+        # the connections are scanned backwards in groups with the same departure time
+        end = len(connections)
+        while end > 0:
+            departure_time = connections[end - 1]["planned_departure"]
+            start = end - 1
+            while start > 0 and connections[start - 1]["planned_departure"] == departure_time:
+                start -= 1
+            # connections with travel time only depend on the connections departing later (already scanned)
+            connections_without_travel_time = []
+            for connection in connections[start:end]:
+                if connection["planned_arrival"] > departure_time:
+                    self._add(connection, self._get_connection_probability(connection))
+                else:
+                    connections_without_travel_time.append(connection)
+            # a connection without travel time can be followed by a connection with the same departure time (repeat until nothing changes)
+            is_changed = True
+            while is_changed:
+                is_changed = False
+                for connection in connections_without_travel_time:
+                    probability = self._get_connection_probability(connection)
+                    if probability > self.get_trip(connection["from"], connection["trip_id"]):
+                        self._add(connection, probability)
+                        is_changed = True
+            end = start
+        logging.debug(
+            f"Reliability upper bound to {target} until {time_limit} for {len(self.probabilities)} stations"
+        )
+
+    def _get_connection_probability(self, connection: dict) -> float:
+        """
+        Best probability of arriving at the target in time when taking the connection
+        """
+        if connection["to"] == self.target:
+            # the search stops at the target, the connection is the last trip
+            return self._get_last_trip_probability(connection)
+        # continue with any connection departing at or after the planned arrival
+        return self.get(connection["to"], connection["planned_arrival"])
+
+    def _get_last_trip_probability(self, connection: dict) -> float:
+        """
+        Best probability of arriving in time with the connection to the target as last trip, consolidated with the connections of the same train before
+        (the actual times are merged like in the search, boarding the train at an earlier station restricts the trip to the common operating days)
+        """
+        probability = 0.0
+        trip_connection = connection
+        actual_times = connection["actual_times"]
+        while len(actual_times) > 0:
+            probability = max(
+                probability,
+                compute_probability_to_arrive_at_or_before_distribution(
+                    self.time_limit, as_actual_times(actual_times).arrival_distribution
+                ),
+            )
+            # connection of the same train to the departure station
+            previous_connection = self.trip_connections.get(
+                (trip_connection["trip_id"], trip_connection["from"])
+            )
+            if (
+                previous_connection is None
+                or previous_connection["planned_departure"] >= trip_connection["planned_departure"]
+            ):
+                break
+            actual_times = merge_actual_times(previous_connection["actual_times"], actual_times)
+            trip_connection = previous_connection
+        return probability
+
+    def _add(self, connection: dict, probability: float):
+        station = connection["from"]
+        departure_time = connection["planned_departure"]
+        trip_key = (station, connection["trip_id"])
+        self.trip_probabilities[trip_key] = max(
+            self.trip_probabilities.get(trip_key, 0.0), probability
+        )
+        negative_departure_times = self.negative_departure_times.setdefault(station, [])
+        probabilities = self.probabilities.setdefault(station, [])
+        if negative_departure_times and negative_departure_times[-1] == -departure_time:
+            probabilities[-1] = max(probabilities[-1], probability)
+            return
+        # the probability is the best of all connections departing at or after the departure time
+        negative_departure_times.append(-departure_time)
+        probabilities.append(max(probabilities[-1], probability) if probabilities else probability)
+
+    def get(self, station, earliest_departure) -> float:
+        """
+        Get the best probability of arriving at the target in time with a connection departing from the station at or after the earliest departure
+        """
+        negative_departure_times = self.negative_departure_times.get(station)
+        if not negative_departure_times:
+            return 0.0
+        # last connection departing at or after the earliest departure (the probabilities are the best over all later connections)
+        index = bisect_right(negative_departure_times, -earliest_departure) - 1
+        return self.probabilities[station][index] if index >= 0 else 0.0
+
+    def get_trip(self, station, trip_id) -> float:
+        """
+        Get the best probability of arriving at the target in time when staying in the train (trip) at the station
+        """
+        return self.trip_probabilities.get((station, trip_id), 0.0)
+
+    def get_path_bound(self, trip: dict, partial_path_reliability) -> float:
+        """
+        Optimistic reliability of any extension of a partial path (with the tail trip and its reliability information, see PartialPathReliability)
+        that reaches the target: either transfer to another connection or stay in the train of the tail trip (the tail trip is consolidated,
+        so only the connections before the tail trip are kept)
+        """
+        return max(
+            partial_path_reliability.probability_connections_made
+            * self.get(trip["to"], trip["planned_arrival"]),
+            partial_path_reliability.probability_connections_made_before_tail
+            * self.get_trip(trip["to"], trip["trip_id"]),
+        )
+
+
+class ArrivalLowerBound:
+    """
+    Earliest observed (actual) arrival at the target of the connections departing at or after a time, a lower bound on the expected arrival
+    of any path whose last trip departs at or after this time (the arrivals of a consolidated trip are a subset of the arrivals of its last connection)
+    """
+
+    def __init__(self, connections: list[dict], target):
+        """
+        @param connections: all connections of the network sorted by planned departure time (like ConnectionScan.connections)
+        @param target: the target node
+        """
+        connections_to_target = [
+            connection
+            for connection in connections
+            if connection["to"] == target and len(connection["actual_times"]) > 0
+        ]
+        self.departure_times = [connection["planned_departure"] for connection in connections_to_target]
+        # earliest arrival of all connections departing at or after the departure time of the connection (minimum of the suffix)
+        self.earliest_arrivals = [
+            float(as_actual_times(connection["actual_times"]).arrivals.min())
+            for connection in connections_to_target
+        ]
+        for index in range(len(self.earliest_arrivals) - 2, -1, -1):
+            self.earliest_arrivals[index] = min(
+                self.earliest_arrivals[index], self.earliest_arrivals[index + 1]
+            )
+
+    def get(self, earliest_departure) -> float:
+        """
+        Get the earliest observed arrival at the target of the connections departing at or after the earliest departure (infinity if there are none)
+        """
+        index = bisect_left(self.departure_times, earliest_departure)
+        return self.earliest_arrivals[index] if index < len(self.earliest_arrivals) else float("inf")
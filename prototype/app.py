@@ -1,6 +1,8 @@
 from flask import Flask, render_template, request
 from algorithm.graph import Graph
-from algorithm.reliability import compute_reliability
+from algorithm.helper import get_day_network, get_network_key, get_specific_station_identifier_from_name
+from algorithm.reliability import compute_reliability, get_reliability_cache
+from retrieve_data.Network_wcancelled import slice_network
 
 
 app = Flask(__name__)
@@ -134,6 +136,33 @@ graph = {
 
 G = Graph(graph=graph)
 
+# Instead of the example graph, the network of a whole day can be used (built once from the delay data and shared by all requests)
+USE_DAY_NETWORK = False
+DATE = "2024-10-02"
+DATABASE_PATH = "../transport_data.db"
+END_TIME_INTERVAL = 120  # in minutes
+
+
+def get_graph(departure_station, departure_time: int) -> Graph:
+    """
+    Get the graph for a request (the example graph or the network of the day sliced to the departure time and station)
+    """
+    if not USE_DAY_NETWORK:
+        return G
+    day_network = get_day_network(DATE, DATABASE_PATH)
+    return Graph(
+        graph=slice_network(
+            day_network,
+            departure_time,
+            departure_time + END_TIME_INTERVAL,
+            departure_station,
+        ),
+        # all requests on the network of the day share the reliability cache (the sliced networks have the same trips)
+        reliability_cache=get_reliability_cache(
+            get_network_key(DATE, DATABASE_PATH, use_day_network=True)
+        ),
+    )
+
 
 # ---------------------------------------------------------------------------
 # A sample list of stations. In real usage, you might retrieve these
@@ -143,6 +172,15 @@ STATIONS = list(graph.keys())
 
 
 def get_paths(departure_station: str, arrival_station: str, departure_time: int):
+    if USE_DAY_NETWORK:
+        # the network uses station identifiers
+        departure_station = int(
+            get_specific_station_identifier_from_name(stop_name=departure_station)
+        )
+        arrival_station = int(
+            get_specific_station_identifier_from_name(stop_name=arrival_station)
+        )
+    G = get_graph(departure_station, departure_time)
     # Example mock data for demonstration:
     # shortest_time, shortest_path = G.dijkstra(departure_station, arrival_station, departure_time)
     shortest_time, shortest_path_result = G.dijkstra(
@@ -160,6 +198,7 @@ def get_paths(departure_station: str, arrival_station: str, departure_time: int)
         departure_time,
         (shortest_time - departure_time) * 1,
         transfer_time=5,
+        reliability_cache=G.reliability_cache,
     )
 
     arrival_time, reliability, most_reliable_path_result = G.find_most_reliable_path(
@@ -171,6 +210,19 @@ def get_paths(departure_station: str, arrival_station: str, departure_time: int)
     most_reliable_path = _map_path_to_tuples(most_reliable_path_result)
     most_reliable_path_reliability = reliability
 
+    # choice set: Pareto front of expected arrival, reliability and number of transfers (one search, same time budget)
+    pareto_paths = [
+        (
+            _convert_minutes_to_time(round(expected_arrival)),
+            path_reliability,
+            number_of_transfers,
+            _map_path_to_tuples(path),
+        )
+        for expected_arrival, path_reliability, number_of_transfers, path in G.find_pareto_paths(
+            departure_station, arrival_station, departure_time, int(time_budget), transfer_time=5
+        )
+    ]
+
     # Calculate the arrival time difference between the shortest path and the most reliable path
     difference = (
         most_reliable_path_result[-1]["planned_arrival"]
@@ -185,6 +237,7 @@ def get_paths(departure_station: str, arrival_station: str, departure_time: int)
         most_reliable_path,
         most_reliable_path_reliability,
         difference,
+        pareto_paths,
     )
 
 
@@ -230,6 +283,7 @@ def index():
             most_reliable_path,
             most_reliable_path_reliability,
             difference,
+            pareto_paths,
         ) = get_paths(departure_station, arrival_station, departure_time_minutes)
 
         print("most_reliable_path: ", most_reliable_path)
@@ -245,6 +299,7 @@ def index():
             most_reliable_path=most_reliable_path,
             most_reliable_path_reliability=most_reliable_path_reliability,
             difference=difference,
+            pareto_paths=pareto_paths,
         )
 
     # If GET request, just render the form and include the station list
@@ -9,17 +9,18 @@ from constants import LOG_LEVEL
 logging.basicConfig(level=LOG_LEVEL)
 
 
+from algorithm.connection_scan import get_earliest_arrival_from_profile
 from algorithm.graph import Graph
 from algorithm.helper import (
     print_path,
     get_specific_station_identifier_from_name,
-    get_specific_station_name_from_identifier, get_graph_data,
+    get_specific_station_name_from_identifier, get_graph_data, get_network_key,
 )
-from algorithm.reliability import compute_reliability
+from algorithm.reliability import compute_reliability, estimate_reliability_monte_carlo, get_reliability_cache
 
 
 def setup_network_data(
-    start, destination, start_time, end_time_interval, use_example=False
+    start, destination, start_time, end_time_interval, use_example=False, use_day_network=False
 ):
     if not use_example:
         # get stop ids from names
@@ -42,6 +43,8 @@ def setup_network_data(
         end_time,
         start,
         use_example_data=use_example,
+        # the network of the whole day is built only once and shared by all test cases (sliced per test case)
+        use_day_network=use_day_network,
     )
     logging.info("Graph data loaded")
 
@@ -49,20 +52,53 @@ def setup_network_data(
     runtime_generate_graph = run_time_end_generate_graph - run_time_start_generate_graph
     logging.info(f"Runtime for generating graph: {runtime_generate_graph} seconds")
 
-    return graph, start, destination, runtime_generate_graph
+    # the reliability cache is shared by all test cases with the same network (with the day network, all test cases of the batch)
+    reliability_cache = get_reliability_cache(
+        get_network_key(
+            "2024-10-02",
+            "../transport_data.db",
+            start_time,
+            end_time,
+            start,
+            use_example_data=use_example,
+            use_day_network=use_day_network,
+        )
+    )
+
+    return graph, start, destination, runtime_generate_graph, reliability_cache
+
+
+# algorithms for finding the shortest path (earliest arrival): "dijkstra", "connection_scan" (Connection Scan Algorithm),
+# "contraction_hierarchy" (time-dependent contraction hierarchy, built once per network and stored in CONTRACTION_HIERARCHY_DIRECTORY)
+# or "raptor" (Round-Based Public Transit Routing, with at most MAXIMUM_NUMBER_OF_TRIPS trips like the search for the most reliable path)
+SHORTEST_PATH_ALGORITHMS = ("dijkstra", "connection_scan", "contraction_hierarchy", "raptor")
 
 
-def run_algorithms(graph, start, destination, start_time, time_budget_multiplier=1.5, enable_efficiency_improvements=True):
-    # initialize graph G (with graph class)
-    G = Graph(graph=graph)
+def run_algorithms(graph, start, destination, start_time, time_budget_multiplier=1.5, enable_efficiency_improvements=True, shortest_path_algorithm="dijkstra", reliability_engine="analytic", time_budget_multipliers=None, evaluate_raptor_candidates=False, find_pareto_front=False, check_time_budgets=False, reliability_cache=None):
+    if shortest_path_algorithm not in SHORTEST_PATH_ALGORITHMS:
+        raise ValueError(f"Unknown shortest path algorithm {shortest_path_algorithm}, use one of {SHORTEST_PATH_ALGORITHMS}")
+    # initialize graph G (with graph class), the reliability cache of the network is shared with the other queries on it (a new one if None is given)
+    G = Graph(graph=graph, reliability_cache=reliability_cache)
 
     # if the graph is empty, return
     if not G.graph:
         logging.info("Graph is empty")
         return
+    if shortest_path_algorithm == "contraction_hierarchy":
+        # the preprocessing is not part of the runtime of the query (it is loaded from disk after the first run)
+        run_time_contraction_hierarchy_start = time.time()
+        G.get_contraction_hierarchy()
+        logging.info(f"Runtime for loading or building the contraction hierarchy: {time.time() - run_time_contraction_hierarchy_start} seconds")
     run_time_shortest_path_start = time.time()
     # find the shortest path
-    shortest_time, shortest_path = G.dijkstra(start, destination, start_time)
+    if shortest_path_algorithm == "connection_scan":
+        shortest_time, shortest_path = G.connection_scan_earliest_arrival(start, destination, start_time)
+    elif shortest_path_algorithm == "contraction_hierarchy":
+        shortest_time, shortest_path = G.contraction_hierarchy_earliest_arrival(start, destination, start_time)
+    elif shortest_path_algorithm == "raptor":
+        shortest_time, shortest_path = G.raptor_earliest_arrival(start, destination, start_time)
+    else:
+        shortest_time, shortest_path = G.dijkstra(start, destination, start_time)
     # check if the shortest path is empty
     if not shortest_path or len(shortest_path) == 0:
         return {}
@@ -78,7 +114,8 @@ def run_algorithms(graph, start, destination, start_time, time_budget_multiplier
         shortest_time - start_time
     ) * 1 # + 5 # add 5 minutes for reliability assessment, assuming 5 minutes later is still acceptable
     shortest_path_reliability = compute_reliability(
-        shortest_path, start_time, time_budget_shortest_path, transfer_time=5
+        shortest_path, start_time, time_budget_shortest_path, transfer_time=5, reliability_engine=reliability_engine,
+        reliability_cache=G.reliability_cache,
     )
     logging.info("Found shortest path")
     print_path(shortest_path, start, start_time, convert_ids_to_names=True)
@@ -95,12 +132,22 @@ def run_algorithms(graph, start, destination, start_time, time_budget_multiplier
         shortest_path,
     )
     reliable_arrival_time, reliability, most_reliable_path = G.find_most_reliable_path(
-        start, destination, start_time, int(time_budget), lower_bound_reliability=shortest_path_reliability, initial_most_reliable_path=initial_most_reliable_path, enable_efficiency_improvements=enable_efficiency_improvements
+        start, destination, start_time, int(time_budget), lower_bound_reliability=shortest_path_reliability, initial_most_reliable_path=initial_most_reliable_path, enable_efficiency_improvements=enable_efficiency_improvements,
+        reliability_engine=reliability_engine,
     )
     run_time_end = time.time()
     runtime = run_time_end - run_time_start
+    # the Monte Carlo search keeps the path with the best noisy score (biased upwards), so the chosen path is estimated again with new samples
+    reliability_estimation = None
+    if reliability_engine == "monte_carlo" and most_reliable_path:
+        reliability_estimation = estimate_reliability_monte_carlo(
+            most_reliable_path, start_time, int(time_budget), transfer_time=5
+        )
+        reliability = reliability_estimation["reliability"]
+    # hits and misses of the reliability cache (of the network of this query, shared with the other queries on it)
+    logging.info(f"Reliability cache: {G.reliability_cache}")
 
-    return {
+    result = {
         "start_time": start_time,
         "start_station": start,
         "destination_station": destination,
@@ -113,6 +160,103 @@ def run_algorithms(graph, start, destination, start_time, time_budget_multiplier
         "shortest_path": shortest_path,
         "most_reliable_path": most_reliable_path,
     }
+    if reliability_estimation is not None:
+        # confidence interval of the re-estimated reliability
+        result["reliability_lower"] = reliability_estimation["lower"]
+        result["reliability_upper"] = reliability_estimation["upper"]
+
+    # find the most reliable path for several time budgets at once (one search for all time budgets)
+    if time_budget_multipliers:
+        time_budgets = [int(time_budget_shortest_path * multiplier) for multiplier in time_budget_multipliers]
+        run_time_start = time.time()
+        most_reliable_paths = G.find_most_reliable_paths_for_time_budgets(
+            start, destination, start_time, time_budgets, transfer_time=5, reliability_engine=reliability_engine,
+        )
+        run_time_end = time.time()
+        result["most_reliable_paths_per_time_budget"] = [
+            {
+                "time_budget_multiplier": multiplier,
+                "time_budget": time_budget,
+                "arrival_time_most_reliable_path": most_reliable_paths[time_budget][0],
+                "reliability": most_reliable_paths[time_budget][1],
+                "most_reliable_path": most_reliable_paths[time_budget][2],
+            }
+            for multiplier, time_budget in zip(time_budget_multipliers, time_budgets)
+        ]
+        result["runtime_time_budgets"] = run_time_end - run_time_start  # in seconds
+        if check_time_budgets:
+            # compare the result of each time budget with a search without pruning for the time budget (slow, for checking the pruning only)
+            for entry, is_equal in zip(
+                result["most_reliable_paths_per_time_budget"],
+                check_most_reliable_paths_for_time_budgets(
+                    G, start, destination, start_time, most_reliable_paths, reliability_engine=reliability_engine
+                ),
+            ):
+                entry["equals_exhaustive_search"] = is_equal
+
+    # evaluate the reliability of the RAPTOR journeys only (Pareto sets of number of trips and arrival time) instead of searching all partial paths
+    if evaluate_raptor_candidates:
+        run_time_start = time.time()
+        (raptor_arrival_time, raptor_reliability, raptor_path), raptor_candidates = G.find_most_reliable_raptor_candidate(
+            start, destination, start_time, int(time_budget), transfer_time=5, reliability_engine=reliability_engine,
+        )
+        run_time_end = time.time()
+        result["arrival_time_most_reliable_raptor_candidate"] = raptor_arrival_time
+        result["reliability_raptor_candidate"] = raptor_reliability
+        result["most_reliable_raptor_candidate"] = raptor_path
+        result["raptor_candidates"] = [
+            {
+                "number_of_trips": number_of_trips,
+                "arrival_time": arrival_time,
+                "reliability": candidate_reliability,
+                "path": path,
+            }
+            for number_of_trips, arrival_time, candidate_reliability, path in raptor_candidates
+        ]
+        result["runtime_raptor_candidates"] = run_time_end - run_time_start  # in seconds
+
+    # find the Pareto front of expected arrival, reliability and number of transfers with one search (a choice set instead of two paths)
+    if find_pareto_front:
+        run_time_start = time.time()
+        pareto_paths = G.find_pareto_paths(
+            start, destination, start_time, int(time_budget), transfer_time=5, reliability_engine=reliability_engine,
+            enable_efficiency_improvements=enable_efficiency_improvements,
+        )
+        run_time_end = time.time()
+        result["pareto_front"] = [
+            {
+                "expected_arrival": expected_arrival,
+                "reliability": path_reliability,
+                "number_of_transfers": number_of_transfers,
+                "path": path,
+            }
+            for expected_arrival, path_reliability, number_of_transfers, path in pareto_paths
+        ]
+        result["runtime_pareto_front"] = run_time_end - run_time_start  # in seconds
+
+    return result
+
+
+def check_most_reliable_paths_for_time_budgets(graph, start, destination, start_time, most_reliable_paths, transfer_time=5, reliability_engine="analytic"):
+    """
+    Check that the reliability of the most reliable path of each time budget (see Graph.find_most_reliable_paths_for_time_budgets) is the same
+    as the one of the search for the single time budget without efficiency improvements (exhaustive search)
+    The Monte Carlo reliability is sampled per path, so the results of the two searches are only comparable for the other reliability engines.
+    Returns if the reliabilities are equal for each time budget (in the order of most_reliable_paths)
+    """
+    results = []
+    for time_budget, (_, reliability, _) in most_reliable_paths.items():
+        _, exhaustive_reliability, _ = graph.find_most_reliable_path(
+            start, destination, start_time, time_budget, transfer_time=transfer_time, enable_efficiency_improvements=False,
+            reliability_engine=reliability_engine,
+        )
+        is_equal = abs(reliability - exhaustive_reliability) <= 1e-9
+        if not is_equal:
+            logging.warning(
+                f"Most reliable path for the time budget {time_budget} differs from the exhaustive search: {reliability} instead of {exhaustive_reliability}"
+            )
+        results.append(is_equal)
+    return results
 
 
 def find_shortest_and_most_reliable_path(
@@ -123,6 +267,8 @@ def find_shortest_and_most_reliable_path(
     end_time_interval=120,
     enable_efficiency_improvements=True,
     use_example=False,
+    use_day_network=False,
+    find_pareto_front=False,
 ) -> dict:
     """
     Find the shortest and most reliable path from start to destination
@@ -139,12 +285,13 @@ def find_shortest_and_most_reliable_path(
     """
     logging.info(f"Loading graph data for {start} to {destination}")
 
-    graph, start, destination, run_time_generate_graph = setup_network_data(
-        start, destination, start_time, end_time_interval, use_example
+    graph, start, destination, run_time_generate_graph, reliability_cache = setup_network_data(
+        start, destination, start_time, end_time_interval, use_example, use_day_network
     )
 
     result = run_algorithms(
-        graph, start, destination, start_time, time_budget_multiplier, enable_efficiency_improvements=enable_efficiency_improvements
+        graph, start, destination, start_time, time_budget_multiplier, enable_efficiency_improvements=enable_efficiency_improvements,
+        find_pareto_front=find_pareto_front, reliability_cache=reliability_cache,
     )
     # check if the result is empty
     if not result or len(result.values()) == 0:
@@ -153,7 +300,7 @@ def find_shortest_and_most_reliable_path(
     result["runtime_generate_graph"] = run_time_generate_graph
     return result
 
-def run_single_case(start, destination, start_time, end_time_interval, time_budget_multiplier=1.5, enable_efficiency_improvements=True):
+def run_single_case(start, destination, start_time, end_time_interval, time_budget_multiplier=1.5, enable_efficiency_improvements=True, use_day_network=False, find_pareto_front=False):
     logging.info(f"Running test case: {start} to {destination} at {start_time} with time interval {end_time_interval} and time budget multiplier {time_budget_multiplier}, efficiency improvements: {enable_efficiency_improvements}")
     result = find_shortest_and_most_reliable_path(
         start,
@@ -163,6 +310,8 @@ def run_single_case(start, destination, start_time, end_time_interval, time_budg
         time_budget_multiplier=time_budget_multiplier,
         enable_efficiency_improvements=enable_efficiency_improvements,
         use_example=False,
+        use_day_network=use_day_network,
+        find_pareto_front=find_pareto_front,
     )
     if len(result.values()) == 0:
         logging.info("No solution could be found.")
@@ -182,7 +331,7 @@ def run_single_case(start, destination, start_time, end_time_interval, time_budg
     )
     return result
 
-def run_multiple_test_cases(test_cases, enable_efficiency_improvements=True, create_average_run_time=False):
+def run_multiple_test_cases(test_cases, enable_efficiency_improvements=True, create_average_run_time=False, use_day_network=False, find_pareto_front=False):
     for case in test_cases:
         start = case["start"]
         destination = case["destination"]
@@ -202,7 +351,7 @@ def run_multiple_test_cases(test_cases, enable_efficiency_improvements=True, cre
             result = {}
             # running the test case 2 times to get an average run time
             for i in range(2):
-                result = run_single_case(start, destination, start_time, end_time_interval, time_budget_multiplier, enable_efficiency_improvements=enable_efficiency_improvements)
+                result = run_single_case(start, destination, start_time, end_time_interval, time_budget_multiplier, enable_efficiency_improvements=enable_efficiency_improvements, use_day_network=use_day_network, find_pareto_front=find_pareto_front)
                 # if result is empty, continue with the next test case
                 if len(result.values()) == 0:
                     continue
@@ -220,7 +369,7 @@ def run_multiple_test_cases(test_cases, enable_efficiency_improvements=True, cre
             result["runtime_generate_graph"] = average_runtime_generate_graph
             result["runtime_shortest_path"] = average_runtime_shortest_path
         else:
-            result = run_single_case(start, destination, start_time, end_time_interval, time_budget_multiplier, enable_efficiency_improvements=enable_efficiency_improvements)
+            result = run_single_case(start, destination, start_time, end_time_interval, time_budget_multiplier, enable_efficiency_improvements=enable_efficiency_improvements, use_day_network=use_day_network, find_pareto_front=find_pareto_front)
 
         if len(result.values()) == 0:
             logging.info(f"No solution could be found for test case {start} to {destination} at {start_time} with time interval {end_time_interval} and time budget multiplier {time_budget_multiplier}")
@@ -269,6 +418,28 @@ def run_multiple_test_cases(test_cases, enable_efficiency_improvements=True, cre
         path_df.to_csv(
             solution_path / f"{file_name_prefix}_most_reliable_path.csv"
         )
+        # save the Pareto front (one row per path) in a csv file
+        if "pareto_front" in result:
+            pareto_front_df = pd.DataFrame(
+                [
+                    {
+                        "expected_arrival": pareto_path["expected_arrival"],
+                        "reliability": pareto_path["reliability"],
+                        "number_of_transfers": pareto_path["number_of_transfers"],
+                        "planned_departure": pareto_path["path"][0]["planned_departure"],
+                        "planned_arrival": pareto_path["path"][-1]["planned_arrival"],
+                        "trip_ids": " -> ".join(str(trip["trip_id"]) for trip in pareto_path["path"]),
+                        "stations": " -> ".join(
+                            get_specific_station_name_from_identifier(stop_id=station)
+                            for station in [pareto_path["path"][0]["from"]] + [trip["to"] for trip in pareto_path["path"]]
+                        ),
+                    }
+                    for pareto_path in result.pop("pareto_front")
+                ]
+            )
+            pareto_front_df.to_csv(
+                solution_path / f"{file_name_prefix}_pareto_front.csv"
+            )
         # remove the paths from the result dictionary
         result.pop("shortest_path")
         result.pop("most_reliable_path")
@@ -286,9 +457,73 @@ def run_multiple_test_cases(test_cases, enable_efficiency_improvements=True, cre
         result_df.to_csv(solution_path / f"{file_name_prefix}.csv")
 
 
+def run_departure_sweep(test_cases, use_day_network=False, departure_step=1):
+    """
+    Compute the earliest arrival (shortest path) and its reliability for every departure minute between start_time and start_time + end_time_interval,
+    the network is generated once per test case and the earliest arrivals for all departure times are computed with one profile query
+    (instead of running the whole pipeline per start time), the results are saved in one csv file per test case
+    :param departure_step: minutes between two departure times of the sweep
+    """
+    for case in test_cases:
+        start_time = case["start_time"]
+        end_time_interval = case["end_time_interval"]
+        graph, start, destination, run_time_generate_graph, reliability_cache = setup_network_data(
+            case["start"], case["destination"], start_time, end_time_interval, use_day_network=use_day_network
+        )
+        G = Graph(graph=graph, reliability_cache=reliability_cache)
+        if not G.graph:
+            logging.info("Graph is empty")
+            continue
+        end_time = start_time + end_time_interval
+        run_time_profile_start = time.time()
+        profile = G.connection_scan_earliest_arrival_profile(start, destination, start_time, end_time, transfer_time=5)
+        runtime_profile = time.time() - run_time_profile_start
+        logging.info(f"Runtime for the earliest arrival profile ({len(profile)} steps): {runtime_profile} seconds")
+
+        results = []
+        for departure_time in range(start_time, end_time + 1, departure_step):
+            shortest_time, shortest_path = get_earliest_arrival_from_profile(profile, departure_time)
+            if not shortest_path:
+                continue
+            results.append(
+                {
+                    "departure_time": departure_time,
+                    "earliest_arrival_time": shortest_time,
+                    "travel_time": shortest_time - departure_time,
+                    # for the shortest path, we have 100% (and not more) of the time budget
+                    "shortest_path_reliability": compute_reliability(
+                        shortest_path, departure_time, shortest_time - departure_time, transfer_time=5,
+                        reliability_cache=G.reliability_cache,
+                    ),
+                    "planned_departure": shortest_path[0]["planned_departure"],
+                    "trip_ids": " -> ".join(str(trip["trip_id"]) for trip in shortest_path),
+                    "runtime_profile": runtime_profile,  # in seconds, for all departure times
+                    "runtime_generate_graph": run_time_generate_graph,
+                }
+            )
+        if not results:
+            logging.info(f"No solution could be found for test case {case['start']} to {case['destination']} between {start_time} and {end_time}")
+            continue
+        # save results
+        solution_path = Path("../prototype/results")
+        file_name_prefix = f"{case['start']}_{case['destination']}_{start_time}_departure_sweep"
+        # check if the file already exists, if so, add a number to the file name and check again
+        file_number = 1
+        while (solution_path / f"{file_name_prefix}_{file_number}.csv").exists():
+            file_number += 1
+        logging.info(f"Saving results to {solution_path / f'{file_name_prefix}_{file_number}.csv'}")
+        pd.DataFrame(results).to_csv(solution_path / f"{file_name_prefix}_{file_number}.csv")
+
+
 if __name__ == "__main__":
     create_average_run_time = False
     enable_efficiency_improvements = True
+    # build the network of the whole day once (all stations) instead of one network per test case
+    use_day_network = False
+    # also find the Pareto front of expected arrival, reliability and number of transfers (saved in a separate csv file per test case)
+    find_pareto_front = False
+    # instead of one run per test case, compute the earliest arrival for every departure minute of the time interval (one profile query per test case)
+    departure_sweep = False
 
     # prepare multiple test cases to run
     test_cases = [
@@ -336,4 +571,7 @@ if __name__ == "__main__":
         # },
     ]
 
-    run_multiple_test_cases(test_cases, enable_efficiency_improvements=enable_efficiency_improvements, create_average_run_time=create_average_run_time)
\ No newline at end of file
+    if departure_sweep:
+        run_departure_sweep(test_cases, use_day_network=use_day_network)
+    else:
+        run_multiple_test_cases(test_cases, enable_efficiency_improvements=enable_efficiency_improvements, create_average_run_time=create_average_run_time, use_day_network=use_day_network, find_pareto_front=find_pareto_front)
\ No newline at end of file
@@ -7,149 +7,200 @@
 import duckdb
 import pandas as pd
 import numpy as np
+import pyarrow.compute as pc
 from collections import defaultdict
 import json
 
+from algorithm.actual_times import create_actual_times
+from algorithm.connection_index import ConnectionIndex
 
-def get_data(date="2024-10-02", database_path="transport_data.db"):
+
+def get_data(
+    date="2024-10-02", database_path="transport_data.db", start_time=None, end_time=None
+):
+    """Get the train services of the given date with the predictions of the same weekday in the past
+
+    Filtering, the conversion of times to minutes since midnight and the merge of cancelled services are done in DuckDB,
+    only the columns needed for building the graph are transferred (as an Arrow table).
+
+    Args:
+        date (str): Date of interest (YYYY-MM-DD)
+        database_path (str): Path to the DuckDB database with the services table
+        start_time (int): Optional start of the time window in minutes since midnight (planned arrival at or after)
+        end_time (int): Optional end of the time window in minutes since midnight (planned departure at or before)
+
+    Returns:
+        pandas.DataFrame: services of the given date with merged predictions from different dates
+    """
     # Connect to the database
     connection = duckdb.connect(database_path, read_only=False)
 
     # Get weekday number (1-7) for the given date
     weekday = pd.to_datetime(date).weekday() + 1
 
-    # Query to get regular train services with real arrival/departure predictions
-    query = f""" 
-    SELECT distinct *
-    FROM services 
-    WHERE PRODUCT_ID='Zug' 
-    AND ARRIVAL_PREDICTION_STATUS='REAL' 
-    AND DEPARTURE_PREDICTION_STATUS='REAL'
-    AND strftime('%w', OPERATING_DAY) = '{weekday}'"""
-
-    df_Zug = connection.execute(query).df()
-
-    # Query to get cancelled train services for the same weekday
-    query = f""" 
+    # Restrict the services of the given date to the requested time window (same condition as in process_route_data)
+    time_window_condition = ""
+    if start_time is not None:
+        time_window_condition += f" AND PLANNED_ARRIVAL >= {int(start_time)}"
+    if end_time is not None:
+        time_window_condition += f" AND PLANNED_DEPARTURE <= {int(end_time)}"
+
+    query = f"""
+    WITH regular_services AS (
+        -- regular train services with real arrival/departure predictions (converted to minutes since midnight)
+        SELECT
+            OPERATING_DAY,
+            TRIP_IDENTIFIER,
+            BPUIC,
+            hour(ARRIVAL_TIME) * 60 + minute(ARRIVAL_TIME) AS PLANNED_ARRIVAL,
+            hour(DEPARTURE_TIME) * 60 + minute(DEPARTURE_TIME) AS PLANNED_DEPARTURE,
+            hour(ARRIVAL_PREDICTION) * 60 + minute(ARRIVAL_PREDICTION) AS ARRIVAL_PREDICTION,
+            hour(DEPARTURE_PREDICTION) * 60 + minute(DEPARTURE_PREDICTION) AS DEPARTURE_PREDICTION
+        FROM (
+            SELECT DISTINCT
+                OPERATING_DAY,
+                TRIP_IDENTIFIER,
+                BPUIC,
+                ARRIVAL_TIME,
+                DEPARTURE_TIME,
+                ARRIVAL_PREDICTION,
+                DEPARTURE_PREDICTION
+            FROM services
+            WHERE PRODUCT_ID='Zug'
+            AND ARRIVAL_PREDICTION_STATUS='REAL'
+            AND DEPARTURE_PREDICTION_STATUS='REAL'
+            AND strftime('%w', OPERATING_DAY) = '{weekday}'
+        )
+    ),
+    day_services AS (
+        SELECT * FROM regular_services WHERE OPERATING_DAY = DATE '{date}'
+    ),
+    cancelled_services AS (
+        -- cancelled train services for the same weekday that are part of the services of the given date
+        -- set maximum delay (2880 minutes = 48 hours) for cancelled services
+        SELECT
+            cancelled.OPERATING_DAY,
+            cancelled.TRIP_IDENTIFIER,
+            cancelled.BPUIC,
+            hour(cancelled.ARRIVAL_TIME) * 60 + minute(cancelled.ARRIVAL_TIME) AS PLANNED_ARRIVAL,
+            hour(cancelled.DEPARTURE_TIME) * 60 + minute(cancelled.DEPARTURE_TIME) AS PLANNED_DEPARTURE,
+            2880 AS ARRIVAL_PREDICTION,
+            2880 AS DEPARTURE_PREDICTION
+        FROM services AS cancelled
+        JOIN day_services
+            ON cancelled.TRIP_IDENTIFIER = day_services.TRIP_IDENTIFIER
+            AND cancelled.BPUIC = day_services.BPUIC
+            AND hour(cancelled.ARRIVAL_TIME) * 60 + minute(cancelled.ARRIVAL_TIME) = day_services.PLANNED_ARRIVAL
+        WHERE cancelled.PRODUCT_ID='Zug'
+        AND cancelled.CANCELLED_TF=1
+        AND strftime('%w', cancelled.OPERATING_DAY) = '{weekday}'
+        AND cancelled.ARRIVAL_PREDICTION_STATUS='UNBEKANNT'
+    ),
+    numbered_services AS (
+        -- handle duplicate entries (numbered by arrival prediction)
+        SELECT
+            *,
+            row_number() OVER (
+                PARTITION BY OPERATING_DAY, TRIP_IDENTIFIER, BPUIC
+                ORDER BY ARRIVAL_PREDICTION NULLS LAST
+            ) AS duplicate_number
+        FROM (
+            SELECT * FROM regular_services
+            UNION ALL
+            SELECT * FROM cancelled_services
+        )
+    ),
+    window_services AS (
         SELECT *
-        FROM services 
-        WHERE PRODUCT_ID='Zug' 
-        AND CANCELLED_TF=1
-        AND strftime('%w', OPERATING_DAY) = '{weekday}'
-        AND ARRIVAL_PREDICTION_STATUS='UNBEKANNT' """
-
-    df_cancelled = connection.execute(query).df()
-    # Set maximum delay (2880 minutes = 48 hours) for cancelled services
-    df_cancelled["ARRIVAL_PREDICTION"] = 2880
-    df_cancelled["DEPARTURE_PREDICTION"] = 2880
-
-    # Convert time predictions to minutes since midnight
-    df_Zug["ARRIVAL_PREDICTION"] = df_Zug["ARRIVAL_PREDICTION"].apply(
-        lambda x: (x.hour * 60 + x.minute) if pd.notnull(x) else np.nan
-    )
-    df_Zug["DEPARTURE_PREDICTION"] = df_Zug["DEPARTURE_PREDICTION"].apply(
-        lambda x: (x.hour * 60 + x.minute) if pd.notnull(x) else np.nan
+        FROM numbered_services
+        WHERE OPERATING_DAY = DATE '{date}'{time_window_condition}
     )
+    -- services of the given date in the time window with the predictions of the same services on the other dates
+    -- (aggregated in a single pass, one list entry per other date the service was observed)
+    SELECT
+        window_services.*,
+        list(
+            struct_pack(
+                OPERATING_DAY := history.OPERATING_DAY,
+                DEPARTURE_PREDICTION := history.DEPARTURE_PREDICTION,
+                ARRIVAL_PREDICTION := history.ARRIVAL_PREDICTION
+            )
+        ) FILTER (WHERE history.OPERATING_DAY IS NOT NULL) AS HISTORICAL_PREDICTIONS
+    FROM window_services
+    LEFT JOIN numbered_services AS history
+        ON history.TRIP_IDENTIFIER = window_services.TRIP_IDENTIFIER
+        AND history.BPUIC = window_services.BPUIC
+        AND history.duplicate_number = window_services.duplicate_number
+        AND history.OPERATING_DAY <> DATE '{date}'
+    GROUP BY ALL
+    """
 
-    # Process data for the specific date
-    df_day = df_Zug[df_Zug["OPERATING_DAY"] == date].copy()
-    df_day.loc[:, "minute"] = pd.to_datetime(df_day["ARRIVAL_TIME"]).dt.time.apply(
-        lambda x: x.hour * 60 + x.minute
-    )
-    df_cancelled["minute"] = pd.to_datetime(
-        df_cancelled["ARRIVAL_TIME"], errors="coerce"
-    ).apply(lambda x: x.hour * 60 + x.minute if pd.notnull(x) else None)
-
-    # Merge cancelled services with regular services based on trip identifier, station ID, and minute
-    df_cancelled = df_cancelled.merge(
-        df_day[["TRIP_IDENTIFIER", "BPUIC", "minute"]],
-        on=["TRIP_IDENTIFIER", "BPUIC", "minute"],
-        how="inner",
-    )
+    services = connection.execute(query).fetch_arrow_table()
 
-    # Combine regular and cancelled services
-    df_Zug = pd.concat([df_Zug, df_cancelled], ignore_index=True)
+    # Close database connection
+    connection.close()
 
-    # Sort by arrival prediction and handle duplicate entries
-    df_Zug = df_Zug.sort_values("ARRIVAL_PREDICTION")
-    df_Zug["duplicate_number"] = (
-        df_Zug.groupby(["OPERATING_DAY", "TRIP_IDENTIFIER", "BPUIC"]).cumcount() + 1
+    result_df = services.drop(["HISTORICAL_PREDICTIONS"]).to_pandas()
+    # Process predictions for all dates
+    _, departure_predictions, arrival_predictions = pivot_historical_predictions(
+        services["HISTORICAL_PREDICTIONS"]
     )
+    # one array per service (entries of the same position belong to the same date, NaN if the service was not observed)
+    result_df["DEPARTURE_PREDICTIONS"] = list(departure_predictions)
+    result_df["ARRIVAL_PREDICTIONS"] = list(arrival_predictions)
+    return result_df
 
-    def merge_predictions(df_Zug, base_date):
-        """Merge predictions from different dates for the same services
-
-        Args:
-            df_Zug (pandas.DataFrame): DataFrame containing all services
-            base_date (str): Reference date for comparison
-
-        Returns:
-            pandas.DataFrame: DataFrame with merged predictions from different dates
-        """
-        base_date = pd.to_datetime(base_date).date()
-        df_Zug["OPERATING_DAY"] = pd.to_datetime(df_Zug["OPERATING_DAY"]).dt.date
-
-        # Get unique dates sorted in descending order
-        unique_dates = sorted(df_Zug["OPERATING_DAY"].unique(), reverse=True)
-
-        # Get data for the base date
-        result_df = df_Zug[df_Zug["OPERATING_DAY"] == base_date].copy()
-
-        base_date_str = base_date.strftime("%Y-%m-%d")
-        other_dates = [d for d in unique_dates if d != base_date]
-
-        # Merge predictions from other dates
-        for d in other_dates:
-            temp_df = df_Zug[df_Zug["OPERATING_DAY"] == d][
-                [
-                    "TRIP_IDENTIFIER",
-                    "BPUIC",
-                    "DEPARTURE_PREDICTION",
-                    "ARRIVAL_PREDICTION",
-                    "duplicate_number",
-                ]
-            ]
-
-            date_str = d.strftime("%Y-%m-%d")
-            # Rename columns to include the date
-            temp_df = temp_df.rename(
-                columns={
-                    "DEPARTURE_PREDICTION": f"DEPARTURE_PREDICTION_{date_str}",
-                    "ARRIVAL_PREDICTION": f"ARRIVAL_PREDICTION_{date_str}",
-                }
-            )
-
-            # Merge with the result DataFrame
-            result_df = result_df.merge(
-                temp_df, on=["TRIP_IDENTIFIER", "BPUIC", "duplicate_number"], how="left"
-            )
-
-        return result_df
 
-    # Process predictions for all dates
-    result_df = merge_predictions(df_Zug, date)
+def pivot_historical_predictions(historical_predictions):
+    """Pivot the aggregated historical predictions into one column per date
 
-    # Convert planned times to minutes since midnight
-    result_df["PLANNED_DEPARTURE"] = pd.to_datetime(
-        result_df["DEPARTURE_TIME"]
-    ).dt.time.apply(lambda x: x.hour * 60 + x.minute)
-    result_df["PLANNED_ARRIVAL"] = pd.to_datetime(
-        result_df["ARRIVAL_TIME"]
-    ).dt.time.apply(lambda x: x.hour * 60 + x.minute)
+    Args:
+        historical_predictions (pyarrow.ChunkedArray): list of (OPERATING_DAY, DEPARTURE_PREDICTION, ARRIVAL_PREDICTION)
+            structs per service
 
-    # Close database connection and return results
-    connection.close()
-    return result_df
+    Returns:
+        tuple: dates (descending, as strings), departure and arrival predictions as matrices (rows: services,
+            columns: dates, NaN if the service was not observed at this date)
+    """
+    historical_predictions = historical_predictions.combine_chunks()
+    number_of_services = len(historical_predictions)
+    # position of the service for every single prediction
+    service_positions = pc.list_parent_indices(historical_predictions).to_numpy()
+    predictions = historical_predictions.flatten()
+    operating_days = predictions.field("OPERATING_DAY").to_numpy(zero_copy_only=False)
+
+    # dates in descending order
+    historical_days = np.unique(operating_days)
+    day_positions = (
+        len(historical_days) - 1 - np.searchsorted(historical_days, operating_days)
+    )
+    historical_days = historical_days[::-1]
+
+    departure_predictions = np.full((number_of_services, len(historical_days)), np.nan)
+    arrival_predictions = np.full((number_of_services, len(historical_days)), np.nan)
+    departure_predictions[service_positions, day_positions] = predictions.field(
+        "DEPARTURE_PREDICTION"
+    ).to_numpy(zero_copy_only=False)
+    arrival_predictions[service_positions, day_positions] = predictions.field(
+        "ARRIVAL_PREDICTION"
+    ).to_numpy(zero_copy_only=False)
+    return (
+        [str(day) for day in historical_days],
+        departure_predictions,
+        arrival_predictions,
+    )
 
 
 def process_route_data(result_df, start_time=700, end_time=880, start_stop=8503000):
     """Process train route data to create a graph of possible transitions between stops
 
     Args:
-        result_df (pandas.DataFrame): DataFrame containing train route information
-        start_time (int): Start time in minutes since midnight (default: 700 = 11:40 AM)
-        end_time (int): End time in minutes since midnight (default: 880 = 2:40 PM)
-        start_stop (int): Starting station ID (default: 8503000)
+        result_df (pandas.DataFrame): DataFrame containing train route information (from get_data, with the
+            historical predictions per service in DEPARTURE_PREDICTIONS and ARRIVAL_PREDICTIONS)
+        start_time (int): Start time in minutes since midnight (default: 700 = 11:40 AM), None for no restriction
+        end_time (int): End time in minutes since midnight (default: 880 = 2:40 PM), None for no restriction
+        start_stop (int): Starting station ID (default: 8503000), only the transitions reachable from the first route at
+            this station are part of the graph. None for the whole network (all stations).
 
     Returns:
         dict: Graph representation of possible transitions between stops
@@ -166,163 +217,257 @@ def process_route_data(result_df, start_time=700, end_time=880, start_stop=85030
                 return int(obj)
             return super(TupleEncoder, self).default(obj)
 
-    def get_prediction_columns(df):
-        """Extract and pair prediction columns from the DataFrame
-
-        Finds columns containing both 'PREDICTION' and '_202' (year) in their names
-        and pairs them as (departure_prediction, arrival_prediction)
-        """
-        prediction_columns = []
-        for col in df.columns:
-            if "PREDICTION" in col and "_202" in col:
-                prediction_columns.append(col)
-
-        # Pair departure and arrival prediction columns
-        paired_columns = []
-        for i in range(0, len(prediction_columns), 2):
-            if i + 1 < len(prediction_columns):
-                dep_col = prediction_columns[i]
-                arr_col = prediction_columns[i + 1]
-                paired_columns.append((dep_col, arr_col))
-
-        return paired_columns
-
-    # Filter data for the specified time window
-    mask = (result_df["PLANNED_ARRIVAL"] >= start_time) & (
-        result_df["PLANNED_DEPARTURE"] <= end_time
-    )
+    # Filter data for the specified time window (if there is one)
+    mask = pd.Series(True, index=result_df.index)
+    if start_time is not None:
+        mask &= result_df["PLANNED_ARRIVAL"] >= start_time
+    if end_time is not None:
+        mask &= result_df["PLANNED_DEPARTURE"] <= end_time
     df_filtered = result_df[mask]
 
-    # Sort data by trip and planned arrival time
+    # Sort data by trip and planned arrival time (only once, everything below works on this order)
     data = df_filtered.sort_values(["TRIP_IDENTIFIER", "PLANNED_ARRIVAL"])
+    # a stop event is identified by (trip, stop, planned arrival), if there are multiple rows for the same event, the first one is used
+    data = data.drop_duplicates(["TRIP_IDENTIFIER", "BPUIC", "PLANNED_ARRIVAL"])
 
-    # Initialize graph structure and get prediction column pairs
+    # Initialize graph structure
     graph = defaultdict(list)
-    prediction_pairs = get_prediction_columns(data)
-
-    def get_predictions_for_transition(from_stop_data, to_stop_data):
-        """Get all valid predictions for a transition between two stops
-
-        Args:
-            from_stop_data: DataFrame row for departure stop
-            to_stop_data: DataFrame row for arrival stop
-
-        Returns:
-            list of tuples: (departure_time, arrival_time) or None if no valid predictions
-        """
-        predictions = []
-        for dep_col, arr_col in prediction_pairs:
-            departure = from_stop_data[dep_col]
-            arrival = to_stop_data[arr_col]
-            if pd.notna(departure) and pd.notna(arrival):
-                predictions.append((int(departure), int(arrival)))
-        return predictions if predictions else None
-
-    def build_line_path(stop, arrival_time, trip_identifier, prev_departure=None):
-        """Recursively build path through the network for a given line
-
-        Processes both direct connections (next stops on the same line)
-        and transfers (connections to other lines at the same station)
-
-        Args:
-            stop: Current station ID
-            arrival_time: Arrival time at current stop
-            trip_identifier: Current trip ID
-            prev_departure: Previous departure time (optional)
-        """
-        # Find next stops on the same line
-        next_stops = data[
-            (data["TRIP_IDENTIFIER"] == trip_identifier)
-            & (data["PLANNED_ARRIVAL"] > arrival_time)
-        ].sort_values("PLANNED_ARRIVAL")
 
-        # Find possible transfers at current station
-        transfers = data[
-            (data["BPUIC"] == stop)
-            & (data["PLANNED_ARRIVAL"] > arrival_time)
-            & (data["TRIP_IDENTIFIER"] != trip_identifier)
+    if data.empty:
+        return dict(graph)
+
+    # Column-wise access to the data (one row per stop event)
+    trip_identifiers = data["TRIP_IDENTIFIER"].to_numpy()
+    stops = data["BPUIC"].to_numpy()
+    planned_arrivals = data["PLANNED_ARRIVAL"].to_numpy().astype(int)
+    planned_departures = data["PLANNED_DEPARTURE"].to_numpy()
+    # predictions as matrices (rows: stop events, columns: historical operating days)
+    departure_predictions = np.vstack(data["DEPARTURE_PREDICTIONS"].to_numpy()).astype(
+        float
+    )
+    arrival_predictions = np.vstack(data["ARRIVAL_PREDICTIONS"].to_numpy()).astype(float)
+
+    # Find the next stop on the same line for each stop event (grouped lead)
+    # The next stop is the first row of the same trip with a later planned arrival, rows with the same trip and
+    # planned arrival form a block, so we take the start of the following block
+    number_of_events = len(data)
+    new_block = np.ones(number_of_events, dtype=bool)
+    new_block[1:] = (trip_identifiers[1:] != trip_identifiers[:-1]) | (
+        planned_arrivals[1:] != planned_arrivals[:-1]
+    )
+    block_starts = np.flatnonzero(new_block)
+    block_of_event = np.cumsum(new_block) - 1
+    next_event = np.full(number_of_events, -1)
+    has_next_block = block_of_event + 1 < len(block_starts)
+    candidate_next_event = block_starts[
+        np.minimum(block_of_event + 1, len(block_starts) - 1)
+    ]
+    same_trip = trip_identifiers[candidate_next_event] == trip_identifiers
+    next_event[has_next_block & same_trip] = candidate_next_event[
+        has_next_block & same_trip
+    ]
+
+    # Valid predictions for the transition to the next stop (departure at the current stop, arrival at the next stop)
+    has_next_event = next_event >= 0
+    transition_valid = np.zeros(arrival_predictions.shape, dtype=bool)
+    transition_valid[has_next_event] = ~np.isnan(
+        departure_predictions[has_next_event]
+    ) & ~np.isnan(arrival_predictions[next_event[has_next_event]])
+    has_transition = has_next_event & transition_valid.any(axis=1)
+    # Valid predictions for a transfer to this stop event (departure and arrival of the same row)
+    transfer_valid = (
+        ~np.isnan(departure_predictions) & ~np.isnan(arrival_predictions)
+    ).any(axis=1)
+
+    if start_stop is None:
+        # Whole network (all stations): every stop event is part of the graph, the network can be sliced by time window and
+        # origin later on (see slice_network)
+        reached = np.ones(number_of_events, dtype=bool)
+        for stop in np.unique(stops):
+            graph[stop]
+    else:
+        # Find the initial route from the start station (the first available route)
+        event_positions = pd.Series(np.arange(len(data)), index=data.index)
+        initial_routes = data[
+            (data["BPUIC"] == start_stop)
+            & (data["PLANNED_ARRIVAL"] >= (start_time if start_time is not None else 0))
         ].sort_values("PLANNED_ARRIVAL")
+        if initial_routes.empty:
+            return dict(graph)
+        initial_event = event_positions[initial_routes.index[0]]
+
+        # Determine which stop events can be reached from the initial route
+        # A stop event is reached if it is the initial route, if the previous stop on the same line is reached (and the transition
+        # has valid predictions) or if there is a transfer at the same station (another line arriving earlier was reached).
+        # Both ways go strictly forward in time, so one sweep over the events ordered by planned arrival is enough.
+        reached = np.zeros(number_of_events, dtype=bool)
+        reached_by_transfer = np.zeros(number_of_events, dtype=bool)
+        reached[initial_event] = True
+        # for each station, the earliest reached arrival and the earliest reached arrival of a different trip
+        # (stop: (arrival, trip identifier, arrival of another trip))
+        earliest_reached = {}
+
+        def earliest_arrival_other_trip(stop, trip_identifier):
+            if stop not in earliest_reached:
+                return None
+            arrival, arrival_trip_identifier, arrival_other_trip = earliest_reached[stop]
+            return arrival if arrival_trip_identifier != trip_identifier else arrival_other_trip
+
+        def update_earliest_reached(stop, arrival, trip_identifier):
+            if stop not in earliest_reached:
+                earliest_reached[stop] = (arrival, trip_identifier, None)
+                return
+            best_arrival, best_trip_identifier, arrival_other_trip = earliest_reached[stop]
+            if trip_identifier == best_trip_identifier:
+                earliest_reached[stop] = (
+                    min(arrival, best_arrival),
+                    best_trip_identifier,
+                    arrival_other_trip,
+                )
+            elif arrival < best_arrival:
+                earliest_reached[stop] = (arrival, trip_identifier, best_arrival)
+            elif arrival_other_trip is None or arrival < arrival_other_trip:
+                earliest_reached[stop] = (best_arrival, best_trip_identifier, arrival)
+
+        # the previous stop event on the same line (inverse of next_event), only if the transition has valid predictions
+        previous_event = np.full(number_of_events, -1)
+        previous_event[next_event[has_transition]] = np.flatnonzero(has_transition)
+
+        event_order = np.argsort(planned_arrivals, kind="stable")
+        order_position = 0
+        while order_position < number_of_events:
+            # events with the same planned arrival cannot reach each other, so they are handled together
+            current_arrival = planned_arrivals[event_order[order_position]]
+            same_arrival_end = order_position
+            while (
+                same_arrival_end < number_of_events
+                and planned_arrivals[event_order[same_arrival_end]] == current_arrival
+            ):
+                same_arrival_end += 1
+            same_arrival_events = event_order[order_position:same_arrival_end]
+
+            for event in same_arrival_events:
+                previous = previous_event[event]
+                if previous >= 0 and reached[previous]:
+                    reached[event] = True
+                if transfer_valid[event]:
+                    earliest_arrival = earliest_arrival_other_trip(
+                        stops[event], trip_identifiers[event]
+                    )
+                    if earliest_arrival is not None and earliest_arrival < current_arrival:
+                        reached[event] = True
+                        reached_by_transfer[event] = True
+            for event in same_arrival_events:
+                if reached[event]:
+                    update_earliest_reached(
+                        stops[event], current_arrival, trip_identifiers[event]
+                    )
+            order_position = same_arrival_end
+
+        # stations with a transfer are part of the graph (even if there is no connection from there)
+        for event in np.flatnonzero(reached_by_transfer):
+            graph[stops[event]]
+
+    # Add the transitions of all reached stop events (column-wise predictions per transition)
+    transition_events = np.flatnonzero(reached & has_transition)
+    # the actual times of all transitions in contiguous arrays (departure at the current stop, arrival at the next stop and
+    # the index of the operating day), each transition gets a view on its part of the arrays
+    observation_events, operating_days = np.nonzero(transition_valid[transition_events])
+    observation_events = transition_events[observation_events]
+    actual_departures = departure_predictions[
+        observation_events, operating_days
+    ].astype(np.int16)
+    actual_arrivals = arrival_predictions[
+        next_event[observation_events], operating_days
+    ].astype(np.int16)
+    operating_days = operating_days.astype(np.int32)
+    observation_offsets = np.concatenate(
+        ([0], np.cumsum(transition_valid[transition_events].sum(axis=1)))
+    )
+
+    # actual times of all transitions with their (precomputed) departure and arrival distributions
+    transition_actual_times = create_actual_times(
+        actual_departures, actual_arrivals, operating_days, observation_offsets
+    )
 
-        # Process next stops on the same line
-        if not next_stops.empty:
-            next_stop_data = next_stops.iloc[0]
-            next_stop = next_stop_data["BPUIC"]
-            next_arrival = int(next_stop_data["PLANNED_ARRIVAL"])
+    # index of the transitions per stop (trip, planned departure, next stop), to add every transition only once
+    connection_index = ConnectionIndex()
+    for position, event in enumerate(transition_events):
+        next_stop_event = next_event[event]
+        stop = stops[event]
+        next_stop = stops[next_stop_event]
+        if next_stop == stop:
+            # self-transitions are not part of the graph
+            graph[stop]
+            continue
+        transition = {
+            "from": stop,
+            "planned_departure": int(planned_departures[event]),
+            "to": next_stop,
+            "planned_arrival": int(planned_arrivals[next_stop_event]),
+            # as a simplification, we use the line text instead of the trip identifier
+            # this is because we saw that the trip identifier sometimes changed though it was still the same train/line
+            "trip_id": trip_identifiers[event],
+            "actual_times": transition_actual_times[position],
+        }
+        if connection_index.add(transition):
+            graph[stop].append(transition)
 
-            current_stop_data = data[
-                (data["BPUIC"] == stop)
-                & (data["TRIP_IDENTIFIER"] == trip_identifier)
-                & (data["PLANNED_ARRIVAL"] == arrival_time)
-            ].iloc[0]
+    # Convert defaultdict to regular dict and return
+    return dict(graph)
 
-            current_departure = int(current_stop_data["PLANNED_DEPARTURE"])
 
-            predictions = get_predictions_for_transition(
-                current_stop_data, next_stop_data
-            )
+def slice_network(graph, start_time, end_time, start_stop=None):
+    """Slice a network of all stations (see process_route_data with start_stop=None) to a time window and origin
 
-            # Add transition if valid predictions exist
-            if predictions is not None:
-                transition = {
-                    "from": stop,
-                    "planned_departure": current_departure,
-                    "to": next_stop,
-                    "planned_arrival": next_arrival,
-                    # as a simplification, we use the line text instead of the trip identifier
-                    # this is because we saw that the trip identifier sometimes changed though it was still the same train/line
-                    "trip_id": trip_identifier,
-                    "actual_times": predictions,
-                }
-
-                if transition not in graph[stop]:
-                    graph[stop].append(transition)
-                    build_line_path(
-                        next_stop, next_arrival, trip_identifier, current_departure
-                    )
+    Args:
+        graph (dict): Graph representation of the whole network (e.g., a whole day)
+        start_time (int): Start time in minutes since midnight, connections departing earlier are removed
+        end_time (int): End time in minutes since midnight, connections departing later are removed
+        start_stop (int): Optional starting station ID, if given only the connections that can be reached from this station
+            (departing at or after start_time) are kept
 
-        # Process transfers at current station
-        for _, transfer in transfers.iterrows():
-            new_trip_identifier = transfer["TRIP_IDENTIFIER"]
-            new_arrival = int(transfer["PLANNED_ARRIVAL"])
-            new_departure = int(transfer["PLANNED_DEPARTURE"])
-
-            predictions = get_predictions_for_transition(transfer, transfer)
-
-            if predictions is not None:
-                transition = {
-                    "from": stop,
-                    "planned_departure": new_departure,
-                    "to": stop,
-                    "planned_arrival": new_arrival,
-                    "trip_id": new_trip_identifier,
-                    "actual_times": predictions,
-                }
-
-                if transition not in graph[stop]:
-                    graph[stop].append(transition)
-                    build_line_path(stop, new_arrival, new_trip_identifier)
-
-    # Find and process initial routes from the start station
-    initial_routes = data[
-        (data["BPUIC"] == start_stop) & (data["PLANNED_ARRIVAL"] >= start_time)
-    ].sort_values("PLANNED_ARRIVAL")
-
-    # Start building the graph from the first available route
-    if not initial_routes.empty:
-        initial_route = initial_routes.iloc[0]
-        initial_trip_identifier = initial_route["TRIP_IDENTIFIER"]
-        initial_arrival = int(initial_route["PLANNED_ARRIVAL"])
-
-        build_line_path(start_stop, initial_arrival, initial_trip_identifier)
-
-    # Clean up the graph by removing self-transitions
-    for stop in graph:
-        graph[stop] = [
-            transition for transition in graph[stop] if transition["to"] != stop
+    Returns:
+        dict: Graph representation of the transitions in the time window
+    """
+    sliced_graph = {
+        stop: [
+            connection
+            for connection in connections
+            if start_time <= connection["planned_departure"] <= end_time
         ]
-
-    # Convert defaultdict to regular dict and return
-    return dict(graph)
+        for stop, connections in graph.items()
+    }
+    if start_stop is None:
+        return sliced_graph
+
+    # Find the connections reachable from the start station (one sweep over all connections ordered by departure)
+    # a connection is reachable if we are already in the same train or if we are at the station before the departure
+    connections = sorted(
+        (connection for stop in sliced_graph for connection in sliced_graph[stop]),
+        key=lambda connection: (
+            connection["planned_departure"],
+            connection["planned_arrival"],
+        ),
+    )
+    earliest_arrival_times = {start_stop: start_time}
+    trips_reached = set()
+    reachable_graph = defaultdict(list)
+    for connection in connections:
+        if (
+            connection["trip_id"] in trips_reached
+            or earliest_arrival_times.get(connection["from"], float("inf"))
+            <= connection["planned_departure"]
+        ):
+            trips_reached.add(connection["trip_id"])
+            reachable_graph[connection["from"]].append(connection)
+            if connection["planned_arrival"] < earliest_arrival_times.get(
+                connection["to"], float("inf")
+            ):
+                earliest_arrival_times[connection["to"]] = connection["planned_arrival"]
+
+    # all reached stations are part of the graph (even if there is no connection from there)
+    return {stop: reachable_graph[stop] for stop in earliest_arrival_times}
 
 
 if __name__ == "__main__":
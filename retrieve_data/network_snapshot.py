@@ -0,0 +1,266 @@
+# This file contains functions for storing built networks (graphs) on disk, so they don't have to be rebuilt from the database every time.
+# A snapshot is a directory with one .npy file per column (connections and their actual times as flat arrays), these files can be memory-mapped when loading.
+# Snapshots are identified by a hash of the inputs (date, weekday, time window, start station and the version of the delay data).
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from algorithm.actual_times import as_actual_times, create_actual_times
+from constants import LOG_LEVEL
+from storage import METADATA_FILE_NAME, evict_least_recently_used
+
+logging.basicConfig(level=LOG_LEVEL)
+
+# default location of the snapshots (relative to the prototype folder, like the database) and maximum size of all snapshots
+NETWORK_SNAPSHOT_DIRECTORY = "../data/network_snapshots"
+NETWORK_SNAPSHOT_MAX_SIZE = 2 * 1024**3  # 2 GB
+# increase if the format of the snapshot changes (old snapshots are not used anymore)
+NETWORK_SNAPSHOT_FORMAT_VERSION = 2
+
+
+def get_data_version(database_path) -> str:
+    """
+    Get the version of the delay data, based on the database file (and its write-ahead log, if there is one)
+    Whenever the services table changes, the database file changes as well, so no database connection is needed.
+    """
+    version = []
+    for path in (Path(database_path), Path(f"{database_path}.wal")):
+        if path.exists():
+            stat = path.stat()
+            version.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return ";".join(version)
+
+
+def get_database_identifier(database_path) -> str | None:
+    """
+    Get the absolute path of the database (the same database can be given with different relative paths), None if no database is given
+    """
+    if database_path is None:
+        return None
+    return str(Path(database_path).resolve())
+
+
+def get_snapshot_key(date, start_time, end_time, start_station, data_version) -> str:
+    """
+    Get the key of a snapshot (hash of all inputs that are used for building the network)
+    """
+    weekday = pd.to_datetime(date).weekday() + 1
+    inputs = {
+        "date": str(date),
+        "weekday": weekday,
+        "start_time": start_time,
+        "end_time": end_time,
+        "start_station": str(start_station),
+        "data_version": data_version,
+        "format_version": NETWORK_SNAPSHOT_FORMAT_VERSION,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def _station_array(stations: list) -> np.ndarray:
+    """
+    Stations are either numbers (BPUIC) or names (example data), both are stored as fixed size arrays (can be memory-mapped)
+    """
+    if all(isinstance(station, (int, np.integer)) for station in stations):
+        return np.array(stations, dtype=np.int64)
+    return np.array([str(station) for station in stations], dtype=np.str_)
+
+
+def save_network_snapshot(
+    graph: dict,
+    key: str,
+    data_version: str = "",
+    snapshot_directory=NETWORK_SNAPSHOT_DIRECTORY,
+    max_size=NETWORK_SNAPSHOT_MAX_SIZE,
+    database_path=None,
+):
+    """
+    Save the network (graph dictionary) as snapshot
+    @param database_path: the database the network was built from (snapshots of older versions of this database are deleted)
+    """
+    snapshot_directory = Path(snapshot_directory)
+    snapshot_directory.mkdir(parents=True, exist_ok=True)
+
+    # stations (all nodes of the graph, also the ones without connections) and trips, connections refer to them by index
+    stations = list(graph.keys())
+    connections = [connection for node in graph for connection in graph[node]]
+    for connection in connections:
+        if connection["to"] not in graph:
+            stations.append(connection["to"])
+    stations = list(dict.fromkeys(stations))
+    station_index = {station: index for index, station in enumerate(stations)}
+    trips = list(dict.fromkeys(connection["trip_id"] for connection in connections))
+    trip_index = {trip: index for index, trip in enumerate(trips)}
+
+    # actual times of all connections in flat arrays (with offsets per connection)
+    actual_times = [
+        as_actual_times(connection["actual_times"]) for connection in connections
+    ]
+    number_actual_times = [len(times) for times in actual_times]
+
+    def concatenate(arrays, dtype):
+        return np.concatenate([np.zeros(0, dtype=dtype)] + arrays).astype(dtype)
+
+    columns = {
+        "stations": _station_array(stations),
+        "is_node": np.array([station in graph for station in stations], dtype=bool),
+        "trips": np.array([str(trip) for trip in trips], dtype=np.str_),
+        "from": np.array(
+            [station_index[connection["from"]] for connection in connections],
+            dtype=np.int32,
+        ),
+        "to": np.array(
+            [station_index[connection["to"]] for connection in connections],
+            dtype=np.int32,
+        ),
+        "planned_departure": np.array(
+            [connection["planned_departure"] for connection in connections],
+            dtype=np.int16,
+        ),
+        "planned_arrival": np.array(
+            [connection["planned_arrival"] for connection in connections],
+            dtype=np.int16,
+        ),
+        "trip_id": np.array(
+            [trip_index[connection["trip_id"]] for connection in connections],
+            dtype=np.int32,
+        ),
+        "actual_times_offsets": np.concatenate(
+            ([0], np.cumsum(number_actual_times, dtype=np.int64))
+        ),
+        "actual_departures": concatenate(
+            [times.departures for times in actual_times], np.int16
+        ),
+        "actual_arrivals": concatenate(
+            [times.arrivals for times in actual_times], np.int16
+        ),
+        "operating_days": concatenate(
+            [times.operating_days for times in actual_times], np.int32
+        ),
+    }
+
+    # write to a temporary directory first, so there is never a partially written snapshot
+    temporary_directory = snapshot_directory / f".{key}.{os.getpid()}.tmp"
+    if temporary_directory.exists():
+        shutil.rmtree(temporary_directory)
+    temporary_directory.mkdir()
+    for name, values in columns.items():
+        np.save(temporary_directory / f"{name}.npy", values, allow_pickle=False)
+    with open(temporary_directory / METADATA_FILE_NAME, "w") as metadata_file:
+        json.dump(
+            {
+                "key": key,
+                "data_version": data_version,
+                "database_path": get_database_identifier(database_path),
+                "format_version": NETWORK_SNAPSHOT_FORMAT_VERSION,
+                "created": time.time(),
+            },
+            metadata_file,
+        )
+    target_directory = snapshot_directory / key
+    if target_directory.exists():
+        shutil.rmtree(target_directory)
+    os.replace(temporary_directory, target_directory)
+    logging.info(f"Network snapshot saved to {target_directory}")
+
+    # keep the snapshots within the size limit
+    evict_network_snapshots(
+        snapshot_directory,
+        max_size=max_size,
+        current_data_version=data_version,
+        database_path=database_path,
+    )
+
+
+def load_network_snapshot(key: str, snapshot_directory=NETWORK_SNAPSHOT_DIRECTORY):
+    """
+    Load the network (graph dictionary) from a snapshot, returns None if there is no snapshot for the key
+    """
+    directory = Path(snapshot_directory) / key
+    if not (directory / METADATA_FILE_NAME).exists():
+        return None
+    try:
+        columns = {
+            path.stem: np.load(path, mmap_mode="r", allow_pickle=False)
+            for path in directory.glob("*.npy")
+        }
+    except (OSError, ValueError):
+        logging.info(f"Network snapshot {directory} could not be read")
+        return None
+    # mark the snapshot as used (for the eviction of the least recently used snapshots)
+    os.utime(directory / METADATA_FILE_NAME)
+
+    stations = columns["stations"].tolist()
+    trips = columns["trips"].tolist()
+    graph = {
+        station: []
+        for station, is_node in zip(stations, columns["is_node"].tolist())
+        if is_node
+    }
+    # the actual times of the connections are views on the memory-mapped arrays (the distributions are computed for all connections at once)
+    actual_times = create_actual_times(
+        columns["actual_departures"],
+        columns["actual_arrivals"],
+        columns["operating_days"],
+        columns["actual_times_offsets"],
+    )
+    for index, (
+        from_index,
+        to_index,
+        planned_departure,
+        planned_arrival,
+        trip_index,
+    ) in enumerate(
+        zip(
+            columns["from"].tolist(),
+            columns["to"].tolist(),
+            columns["planned_departure"].tolist(),
+            columns["planned_arrival"].tolist(),
+            columns["trip_id"].tolist(),
+        )
+    ):
+        graph[stations[from_index]].append(
+            {
+                "from": stations[from_index],
+                "planned_departure": planned_departure,
+                "to": stations[to_index],
+                "planned_arrival": planned_arrival,
+                "trip_id": trips[trip_index],
+                "actual_times": actual_times[index],
+            }
+        )
+    logging.info(f"Network snapshot loaded from {directory}")
+    return graph
+
+def evict_network_snapshots(
+    snapshot_directory=NETWORK_SNAPSHOT_DIRECTORY,
+    max_size=NETWORK_SNAPSHOT_MAX_SIZE,
+    current_data_version=None,
+    database_path=None,
+):
+    """
+    Delete snapshots of an outdated version of the delay data (only of the same database, the snapshots of other databases in the same directory
+    are still valid), and the least recently used snapshots if all snapshots together are larger than max_size (in bytes)
+    """
+    database_identifier = get_database_identifier(database_path)
+
+    def is_outdated(metadata: dict) -> bool:
+        # outdated snapshots are never used again (the key contains the data version)
+        return (
+            current_data_version is not None
+            and database_identifier is not None
+            and metadata.get("database_path") == database_identifier
+            and metadata.get("data_version") != current_data_version
+        ) or metadata.get("format_version") != NETWORK_SNAPSHOT_FORMAT_VERSION
+
+    evict_least_recently_used(
+        snapshot_directory, max_size, is_outdated, description="network snapshot"
+    )
+
@@ -0,0 +1,48 @@
+# This file contains functions for the directories stored on disk by the other modules (e.g., network snapshots and contraction hierarchies).
+# Each stored directory has a metadata file, which is touched when the directory is loaded (so its modification time is the time of the last use).
+import json
+import logging
+import shutil
+from pathlib import Path
+
+from constants import LOG_LEVEL
+
+logging.basicConfig(level=LOG_LEVEL)
+
+METADATA_FILE_NAME = "metadata.json"
+
+
+def evict_least_recently_used(
+    directory, max_size: int, is_outdated=None, description="stored directory"
+):
+    """
+    Delete the stored directories whose metadata is outdated, and the least recently used ones if all of them together are larger than max_size (in bytes)
+    @param is_outdated: function of the metadata (dictionary) that returns True if the directory is never used again, None to only evict by size
+    @param description: name of the stored directories (for logging)
+    """
+    directory = Path(directory)
+    if not directory.exists():
+        return
+    stored_directories = []
+    for stored_directory in directory.iterdir():
+        metadata_path = stored_directory / METADATA_FILE_NAME
+        if not stored_directory.is_dir() or not metadata_path.exists():
+            continue
+        with open(metadata_path) as metadata_file:
+            metadata = json.load(metadata_file)
+        if is_outdated is not None and is_outdated(metadata):
+            logging.info(f"Delete outdated {description} {stored_directory}")
+            shutil.rmtree(stored_directory, ignore_errors=True)
+            continue
+        size = sum(path.stat().st_size for path in stored_directory.iterdir())
+        stored_directories.append((metadata_path.stat().st_mtime, size, stored_directory))
+
+    # delete the least recently used directories first
+    stored_directories.sort()
+    total_size = sum(size for _, size, _ in stored_directories)
+    for _, size, stored_directory in stored_directories:
+        if total_size <= max_size:
+            break
+        logging.info(f"Delete least recently used {description} {stored_directory}")
+        shutil.rmtree(stored_directory, ignore_errors=True)
+        total_size -= size